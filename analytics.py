@@ -0,0 +1,311 @@
+"""
+Аналитика загрузки принтеров по суточным сводкам UsageDaily и UserDaily (db.py).
+Сводки ведутся в транзакции самой брони: создание добавляет её минуты по часам суток,
+отмена переносит их в cancelled, первая печать по брони отмечается в printed.
+Отчёт за месяц читает не больше дни × 24 × принтеры строк и сворачивает их NumPy, не трогая историю.
+rebuild() пересчитывает сводки за период по всей истории броней — для начального заполнения,
+данных, загруженных в обход API, или сверки:
+
+    python -m analytics --from 2026-01-01 --to 2026-02-01
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import case, delete, exists, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from db import Printer, PrintJob, UsageDaily, User, UserDaily, async_engine
+from lifecycle import booking_history
+
+logger = logging.getLogger("Analytics")
+logger.setLevel(logging.INFO)
+
+UPSERT = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+USAGE_KEYS = ("day", "printer_id", "hour")
+USER_KEYS = ("day", "tg_user")
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+TOP_USERS = 20
+INSERT_CHUNK = 5000
+EPOCH = date(1970, 1, 1)
+# 1970-01-01 — четверг: день недели (пн = 0) из номера дня от эпохи
+EPOCH_WEEKDAY = 3
+
+
+def to_minutes(values) -> np.ndarray:
+    return np.array(values, dtype="datetime64[m]").astype(np.int64)
+
+
+def to_days(values) -> np.ndarray:
+    return np.array(values, dtype="datetime64[D]").astype(np.int64)
+
+
+def from_day(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+def split_hours(start, end):
+    """
+    Интервалы [start, end) в минутах от эпохи -> (индекс интервала, час от эпохи, минут в этом часе)
+    для каждого часа, который интервал задевает. Без цикла по броням: повторы и смещения через repeat.
+    """
+    first = start // 60
+    count = np.maximum((end + 59) // 60 - first, 0)
+    which = np.repeat(np.arange(len(start)), count)
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    hour = first[which] + offset
+    minutes = np.minimum(end[which], (hour + 1) * 60) - np.maximum(start[which], hour * 60)
+    return which, hour, minutes
+
+
+def group_sum(keys, *weights):
+    """Уникальные строки keys (2D: колонка на поле) и суммы weights по каждой."""
+    keys = np.column_stack(keys)
+    if not len(keys):
+        return keys, [np.zeros(0, dtype=np.int64) for _ in weights]
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return unique, [np.bincount(inverse, weights=w, minlength=len(unique)).astype(np.int64) for w in weights]
+
+
+def usage_rows(printer_id, start, end, booked):
+    """Строки UsageDaily: минуты броней по (день, принтер, час); booked — маска неотменённых."""
+    which, hour, minutes = split_hours(start, end)
+    keys, (booked_min, cancelled_min) = group_sum(
+        (hour // 24, printer_id[which], hour % 24), minutes * booked[which], minutes * ~booked[which]
+    )
+    return [
+        {"day": from_day(d), "printer_id": int(p), "hour": int(h), "booked_min": int(b), "cancelled_min": int(c)}
+        for (d, p, h), b, c in zip(keys, booked_min, cancelled_min)
+    ]
+
+
+def user_rows(tg_user, start, end, cancelled, printed):
+    """Строки UserDaily по (день начала брони, пользователь)."""
+    keys, (bookings, cancels, minutes, prints) = group_sum(
+        (start // 1440, tg_user), np.ones(len(start)), cancelled, (end - start) * ~cancelled, printed
+    )
+    return [
+        {"day": from_day(d), "tg_user": int(u), "bookings": int(b), "cancelled": int(c), "minutes": int(m),
+         "printed": int(p)}
+        for (d, u), b, c, m, p in zip(keys, bookings, cancels, minutes, prints)
+    ]
+
+
+async def upsert_add(session, table, keys, rows):
+    """Прибавляет счётчики rows к строкам сводки (INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x)."""
+    if not rows:
+        return
+    # Одинаковый порядок строк во всех транзакциях: встречные блокировки не ведут к deadlock
+    rows = sorted(rows, key=lambda r: tuple(r[k] for k in keys))
+    stmt = UPSERT[async_engine.dialect.name](table)
+    fields = [c for c in rows[0] if c not in keys]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys), set_={f: table.c[f] + stmt.excluded[f] for f in fields}
+    )
+    await session.execute(stmt, rows)
+
+
+def booking_arrays(bookings):
+    return (
+        np.array([b.printer_id for b in bookings], dtype=np.int64),
+        np.array([b.tg_user for b in bookings], dtype=np.int64),
+        to_minutes([b.start_at for b in bookings]),
+        to_minutes([b.end_at for b in bookings]),
+    )
+
+
+async def record_created(session, bookings):
+    """Новые активные брони — в сводки, в транзакции session до её коммита."""
+    if not bookings:
+        return
+    printer_id, tg_user, start, end = booking_arrays(bookings)
+    booked = np.ones(len(bookings), dtype=bool)
+    none = np.zeros(len(bookings), dtype=np.int64)
+    await upsert_add(session, UsageDaily.__table__, USAGE_KEYS, usage_rows(printer_id, start, end, booked))
+    await upsert_add(session, UserDaily.__table__, USER_KEYS, user_rows(tg_user, start, end, ~booked, none))
+
+
+async def record_cancelled(session, bookings):
+    """Отменённые брони: минуты из booked в cancelled. Вызывать один раз на бронь — после успешной смены статуса."""
+    if not bookings:
+        return
+    printer_id, tg_user, start, end = booking_arrays(bookings)
+    which, hour, minutes = split_hours(start, end)
+    keys, (moved,) = group_sum((hour // 24, printer_id[which], hour % 24), minutes)
+    await upsert_add(session, UsageDaily.__table__, USAGE_KEYS, [
+        {"day": from_day(d), "printer_id": int(p), "hour": int(h), "booked_min": -int(m), "cancelled_min": int(m)}
+        for (d, p, h), m in zip(keys, moved)
+    ])
+    keys, (count, minutes) = group_sum((start // 1440, tg_user), np.ones(len(start)), end - start)
+    await upsert_add(session, UserDaily.__table__, USER_KEYS, [
+        {"day": from_day(d), "tg_user": int(u), "bookings": 0, "cancelled": int(c), "minutes": -int(m), "printed": 0}
+        for (d, u), c, m in zip(keys, count, minutes)
+    ])
+
+
+async def record_printed(session, booking):
+    """Первая печать по брони: в printed (no-show — прошедшая бронь без печати)."""
+    await upsert_add(session, UserDaily.__table__, USER_KEYS, [{
+        "day": booking.start_at.date(), "tg_user": booking.tg_user,
+        "bookings": 0, "cancelled": 0, "minutes": 0, "printed": 1,
+    }])
+
+
+def rebuild_on(conn, day_from: date = None, day_to: date = None) -> dict:
+    """
+    Пересчёт сводок за [day_from, day_to) (по умолчанию — за всю историю) на синхронном соединении.
+    Печать учитывается по ссылке задания на бронь; при архивации ссылка снимается (lifecycle.py),
+    поэтому printed у пересчитанных архивных дней — ноль.
+    """
+    b = booking_history().c
+    printed = exists().where(PrintJob.booking_id == b.id)
+    q = select(b.printer_id, b.tg_user, b.start_at, b.end_at, b.status == "cancelled", printed)
+    usage_where, user_where = [], []
+    if day_from is not None:
+        q = q.where(b.end_at > datetime.combine(day_from, datetime.min.time()))
+        usage_where.append(UsageDaily.day >= day_from)
+        user_where.append(UserDaily.day >= day_from)
+    if day_to is not None:
+        q = q.where(b.start_at < datetime.combine(day_to, datetime.min.time()))
+        usage_where.append(UsageDaily.day < day_to)
+        user_where.append(UserDaily.day < day_to)
+    rows = conn.execute(q).all()
+    printer_id, tg_user, start, end, cancelled, has_print = (
+        np.array(column) for column in zip(*rows)
+    ) if rows else [np.zeros(0, dtype=np.int64)] * 6
+    start, end = to_minutes(start), to_minutes(end)
+    cancelled, has_print = cancelled.astype(bool), has_print.astype(np.int64)
+
+    usage = usage_rows(printer_id.astype(np.int64), start, end, ~cancelled)
+    users = user_rows(tg_user.astype(np.int64), start, end, cancelled, has_print)
+    # Брони, задевающие границы периода, дают строки и за его пределами — они не трогаются
+    lo = day_from or date.min
+    hi = day_to or date.max
+    usage = [r for r in usage if lo <= r["day"] < hi]
+    users = [r for r in users if lo <= r["day"] < hi]
+
+    conn.execute(delete(UsageDaily).where(*usage_where))
+    conn.execute(delete(UserDaily).where(*user_where))
+    for table, out in ((UsageDaily.__table__, usage), (UserDaily.__table__, users)):
+        for i in range(0, len(out), INSERT_CHUNK):
+            conn.execute(insert(table), out[i:i + INSERT_CHUNK])
+    return {"bookings": len(rows), "usage_rows": len(usage), "user_rows": len(users)}
+
+
+async def rebuild(day_from: date = None, day_to: date = None) -> dict:
+    async with async_engine.begin() as conn:
+        return await conn.run_sync(rebuild_on, day_from, day_to)
+
+
+def rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def int_columns(rows, width: int):
+    if not rows:
+        return [np.zeros(0, dtype=np.int64)] * width
+    return [np.array(c, dtype=np.int64) for c in zip(*rows)]
+
+
+async def report(session, day_from: date, day_to: date, printer_id: int = None, top: int = TOP_USERS) -> dict:
+    """Сводка за [day_from, day_to): тепловая карта загрузки день недели × час, отмены, no-show, пользователи."""
+    # Суммы по (день, час) считает БД: в Python приходит не больше дни × 24 строк при любом числе принтеров
+    in_period = [UsageDaily.day >= day_from, UsageDaily.day < day_to]
+    if printer_id is not None:
+        in_period.append(UsageDaily.printer_id == printer_id)
+    rows = (await session.exec(
+        select(UsageDaily.day, UsageDaily.hour, func.sum(UsageDaily.booked_min), func.sum(UsageDaily.cancelled_min))
+        .where(*in_period).group_by(UsageDaily.day, UsageDaily.hour)
+    )).all()
+    day = np.array([d.toordinal() - EPOCH.toordinal() for d, *_ in rows], dtype=np.int64)
+    hour, booked_min, cancelled_min = int_columns([r[1:] for r in rows], 3)
+    if printer_id is not None:
+        printers = {printer_id}
+    else:
+        printers = set((await session.exec(select(Printer.id).where(Printer.enabled == True))).all())
+        printers |= set((await session.exec(select(UsageDaily.printer_id).where(*in_period).distinct())).all())
+
+    cell = (day + EPOCH_WEEKDAY) % 7 * 24 + hour
+    booked = np.bincount(cell, weights=booked_min, minlength=7 * 24).reshape(7, 24)
+    cancelled_total = int(cancelled_min.sum())
+    # Ёмкость часа: сколько раз этот день недели встречается в периоде × принтеры × 60 минут
+    period = np.arange(*to_days([day_from, day_to]))
+    capacity = np.bincount((period + EPOCH_WEEKDAY) % 7, minlength=7) * 60.0 * max(len(printers), 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        occupancy = np.nan_to_num(booked / capacity[:, None])
+        by_weekday = np.nan_to_num(booked.sum(axis=1) / (capacity * 24))
+    by_hour = booked.sum(axis=0) / capacity.sum()
+    busiest = [int(h) for h in np.argsort(-by_hour, kind="stable")[:3] if by_hour[h] > 0]
+
+    # No-show — прошедшая неотменённая бронь без печати. Сегодняшние ещё могут до печати дойти
+    past = UserDaily.day < datetime.utcnow().date()
+    users, u_bookings, u_cancels, u_minutes, u_due, u_printed = int_columns((await session.exec(
+        select(
+            UserDaily.tg_user, func.sum(UserDaily.bookings), func.sum(UserDaily.cancelled), func.sum(UserDaily.minutes),
+            func.sum(case((past, UserDaily.bookings - UserDaily.cancelled), else_=0)),
+            func.sum(case((past, UserDaily.printed), else_=0)),
+        ).where(UserDaily.day >= day_from, UserDaily.day < day_to).group_by(UserDaily.tg_user)
+    )).all(), 6)
+    order = np.lexsort((users, -u_minutes))[:top]
+    names = {}
+    if len(order):
+        names = {
+            tg: username or first_name
+            for tg, username, first_name in (await session.exec(
+                select(User.tg_id, User.username, User.first_name).where(User.tg_id.in_(users[order].tolist()))
+            )).all()
+        }
+
+    def no_show(due, done):
+        return rate(max(int(due) - int(done), 0), int(due))
+
+    return {
+        "from": day_from.isoformat(),
+        "to": day_to.isoformat(),
+        "printers": sorted(printers),
+        "occupancy": {
+            "total": round(float(booked.sum() / (capacity.sum() * 24)), 4),
+            "by_weekday_hour": np.round(occupancy, 4).tolist(),
+            "by_weekday": np.round(by_weekday, 4).tolist(),
+            "by_hour": np.round(by_hour, 4).tolist(),
+            "busiest_hours": busiest,
+        },
+        "hours_booked": round(float(booked.sum()) / 60, 1),
+        "hours_cancelled": round(cancelled_total / 60, 1),
+        "bookings": int(u_bookings.sum()),
+        "cancelled": int(u_cancels.sum()),
+        "cancellation_rate": rate(int(u_cancels.sum()), int(u_bookings.sum())),
+        "no_show_rate": no_show(u_due.sum(), u_printed.sum()),
+        "users": [
+            {
+                "tg_user": int(users[i]),
+                "name": names.get(int(users[i])),
+                "bookings": int(u_bookings[i]),
+                "cancelled": int(u_cancels[i]),
+                "hours": round(int(u_minutes[i]) / 60, 1),
+                "printed": int(u_printed[i]),
+                "cancellation_rate": rate(int(u_cancels[i]), int(u_bookings[i])),
+                "no_show_rate": no_show(u_due[i], u_printed[i]),
+            }
+            for i in order
+        ],
+    }
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Пересчёт сводок аналитики по истории броней")
+    parser.add_argument("--from", dest="day_from", type=parse_date, help="YYYY-MM-DD, по умолчанию — с начала истории")
+    parser.add_argument("--to", dest="day_to", type=parse_date, help="YYYY-MM-DD, не включая")
+    args = parser.parse_args()
+    logger.info("Rebuilt: %s", asyncio.run(rebuild(args.day_from, args.day_to)))
@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import mimetypes
+import re
+import time
+from pathlib import Path, PurePosixPath
+
+from fastapi import HTTPException, Request, Response
+
+from storage import IMMUTABLE_CACHE, etag_matches
+
+try:
+    import brotli
+except ImportError:  # без brotli отдаём только gzip
+    brotli = None
+
+COMPRESSIBLE = {".html", ".js", ".css", ".svg", ".json", ".txt"}
+CHECK_INTERVAL = 1.0
+STATIC_REF = re.compile(r"/static/([\w./-]+)(?:\?v=[\w.-]*)?")
+
+
+class Asset:
+    """Файл в памяти: исходные байты и заранее сжатые варианты (gzip, br)."""
+
+    def __init__(self, name: str, data: bytes):
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.media_type.startswith("text/") or self.media_type == "application/javascript":
+            self.media_type += "; charset=utf-8"
+        self.variants = {"identity": data}
+        if PurePosixPath(name).suffix in COMPRESSIBLE:
+            gz = gzip.compress(data, 9, mtime=0)
+            if len(gz) < len(data):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    self.variants["br"] = br
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        accepted = {
+            part.split(";")[0].strip().lower()
+            for part in request.headers.get("accept-encoding", "").split(",")
+            if "q=0" not in part.replace(" ", "").split(";")[1:]
+        }
+        encoding = next((e for e in ("br", "gzip") if e in self.variants and e in accepted), "identity")
+        etag = f'"{self.digest[:20]}-{encoding}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+def hashed_name(name: str, digest: str) -> str:
+    p = PurePosixPath(name)
+    return p.with_name(f"{p.stem}.{digest[:10]}{p.suffix}").as_posix()
+
+
+class StaticAssets:
+    """
+    Статика из webapp/static, загруженная в память и сжатая один раз.
+    Каждый файл доступен по обычному имени (no-cache + ETag) и по имени с хэшем содержимого
+    (кэшируется навсегда). Изменения на диске подхватываются не чаще раза в CHECK_INTERVAL.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.version = 0
+        self._assets = {}
+        self._hashed = {}
+        self._mtimes = {}
+        self._checked = 0.0
+
+    def _refresh(self):
+        if time.monotonic() - self._checked < CHECK_INTERVAL:
+            return
+        self._checked = time.monotonic()
+        for path in self.root.rglob("*"):
+            if not path.is_file():
+                continue
+            name = path.relative_to(self.root).as_posix()
+            mtime = path.stat().st_mtime_ns
+            if self._mtimes.get(name) == mtime:
+                continue
+            asset = Asset(name, path.read_bytes())
+            old = self._assets.get(name)
+            if old is not None:
+                self._hashed.pop(hashed_name(name, old.digest), None)
+            self._assets[name] = asset
+            self._hashed[hashed_name(name, asset.digest)] = name
+            self._mtimes[name] = mtime
+            self.version += 1
+
+    def url(self, name: str) -> str:
+        self._refresh()
+        asset = self._assets.get(name)
+        return f"/static/{hashed_name(name, asset.digest)}" if asset else f"/static/{name}"
+
+    def response(self, request: Request, path: str) -> Response:
+        self._refresh()
+        if path in self._hashed:
+            return self._assets[self._hashed[path]].response(request, IMMUTABLE_CACHE)
+        if path in self._assets:
+            return self._assets[path].response(request, "no-cache")
+        raise HTTPException(404, "Not found")
+
+
+class HtmlPage:
+    """HTML-страница в памяти: ссылки на /static переписаны на хэшированные имена."""
+
+    def __init__(self, path: Path, static: StaticAssets):
+        self.path = path
+        self.static = static
+        self._asset = None
+        self._key = None
+        self._checked = 0.0
+
+    def response(self, request: Request) -> Response:
+        if self._asset is None or time.monotonic() - self._checked >= CHECK_INTERVAL:
+            self._checked = time.monotonic()
+            self.static._refresh()
+            key = (self.path.stat().st_mtime_ns, self.static.version)
+            if key != self._key:
+                html = self.path.read_text(encoding="utf-8")
+                html = STATIC_REF.sub(lambda m: self.static.url(m.group(1)), html)
+                self._asset = Asset(self.path.name, html.encode("utf-8"))
+                self._key = key
+        return self._asset.response(request, "no-cache")
@@ -0,0 +1,154 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException, Request
+
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+# Через запятую; если задан ADMIN_IDS_FILE — список перечитывается из файла при его изменении
+ADMIN_IDS = os.getenv("ADMIN_IDS", "")
+ADMIN_IDS_FILE = os.getenv("ADMIN_IDS_FILE")
+IDENTITY_TTL = float(os.getenv("IDENTITY_TTL", "3600"))
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", str(24 * 3600)))
+CHECK_INTERVAL = 1.0
+INIT_DATA_HEADER = "X-TG-Init-Data"
+
+
+def parse_admin_ids(text: str) -> frozenset:
+    return frozenset(int(x) for x in text.replace("\n", ",").split(",") if x.strip())
+
+
+def check_init_data(init_data: str, bot_token: str, max_age: int = INIT_DATA_MAX_AGE, now: float = None):
+    """
+    Проверка подписи Telegram WebApp initData. Возвращает поле user (dict) или None.
+    secret = HMAC_SHA256("WebAppData", bot_token), hash = HMAC_SHA256(secret, data_check_string).
+    """
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", None)
+    if not received or not bot_token:
+        return None
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        return None
+    try:
+        auth_date = int(fields.get("auth_date", 0))
+        user = json.loads(fields["user"])
+        int(user["id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if max_age and (now or time.time()) - auth_date > max_age:
+        return None
+    return user
+
+
+class Identity:
+    __slots__ = ("tg_id", "username", "first_name", "verified")
+
+    def __init__(self, tg_id: int, username: str = None, first_name: str = None, verified: bool = False):
+        self.tg_id = tg_id
+        self.username = username
+        self.first_name = first_name
+        self.verified = verified
+
+
+class AdminList:
+    """frozenset администраторов; при заданном файле перечитывается не чаще раза в CHECK_INTERVAL."""
+
+    def __init__(self, ids: frozenset = frozenset(), path: str = None):
+        self.path = Path(path) if path else None
+        self._ids = ids
+        self._mtime = None
+        self._checked = 0.0
+
+    def reload(self, ids=None):
+        if ids is not None:
+            self._ids = frozenset(ids)
+        elif self.path and self.path.exists():
+            self._mtime = self.path.stat().st_mtime_ns
+            self._ids = parse_admin_ids(self.path.read_text())
+        return self._ids
+
+    @property
+    def ids(self) -> frozenset:
+        if self.path and time.monotonic() - self._checked >= CHECK_INTERVAL:
+            self._checked = time.monotonic()
+            if self.path.exists() and self.path.stat().st_mtime_ns != self._mtime:
+                self.reload()
+        return self._ids
+
+    def __contains__(self, tg_id) -> bool:
+        return tg_id in self.ids
+
+
+class IdentityResolver:
+    """
+    Личность пользователя по запросу. Подписанный initData (заголовок X-TG-Init-Data) проверяется
+    один раз и кэшируется на IDENTITY_TTL; в пределах запроса результат лежит в request.state.
+    Пока BOT_TOKEN не задан, как и раньше принимается неподписанный X-TG-ID.
+    """
+
+    def __init__(self, bot_token: str, admins: AdminList, ttl: float = IDENTITY_TTL, max_entries: int = 10_000,
+                 max_age: int = INIT_DATA_MAX_AGE):
+        self.bot_token = bot_token
+        self.admins = admins
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+
+    def _verify(self, init_data: str):
+        item = self._cache.get(init_data)
+        if item is not None and item[1] > time.monotonic():
+            self._cache.move_to_end(init_data)
+            return item[0]
+        user = check_init_data(init_data, self.bot_token, self.max_age)
+        identity = user and Identity(int(user["id"]), user.get("username"), user.get("first_name"), verified=True)
+        ttl = self.ttl
+        if identity and self.max_age:
+            # Из кэша initData не должен пережить INIT_DATA_MAX_AGE от auth_date
+            auth_date = int(dict(parse_qsl(init_data)).get("auth_date", 0))
+            ttl = min(ttl, auth_date + self.max_age - time.time())
+        self._cache[init_data] = (identity, time.monotonic() + ttl)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return identity
+
+    def resolve(self, request: Request):
+        if request is None:
+            return None
+        if hasattr(request.state, "identity"):
+            return request.state.identity
+        identity = None
+        init_data = request.headers.get(INIT_DATA_HEADER)
+        if init_data:
+            identity = self._verify(init_data)
+        elif not self.bot_token:
+            tg_id = request.headers.get("X-TG-ID")
+            if tg_id and tg_id.lstrip("-").isdigit():
+                identity = Identity(int(tg_id))
+        request.state.identity = identity
+        return identity
+
+    def is_admin(self, request: Request) -> bool:
+        identity = self.resolve(request)
+        return identity is not None and identity.tg_id in self.admins
+
+    def check_owner(self, request: Request, tg_user: int):
+        """Подписанная личность должна совпадать с tg_user из тела запроса."""
+        identity = self.resolve(request)
+        if identity is not None and identity.verified and identity.tg_id != tg_user:
+            raise HTTPException(403, "tg_user не совпадает с пользователем Telegram")
+        if identity is None and self.bot_token:
+            raise HTTPException(401, "Нужен заголовок X-TG-Init-Data")
+        return identity
+
+
+admins = AdminList(parse_admin_ids(ADMIN_IDS), ADMIN_IDS_FILE)
+identities = IdentityResolver(BOT_TOKEN, admins)
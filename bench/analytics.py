@@ -0,0 +1,82 @@
+"""
+Отчёт аналитики за --days дней по --bookings засеянным броням (bench/seed.py): по суточным сводкам
+(analytics.report) против пересчёта по истории броней на каждый запрос — выборка всех броней периода
+и их раскладка по часам теми же функциями NumPy. Плюс время полного rebuild() и строк в сводках.
+
+    DB_SQLITE=bench.db python -m bench.analytics --bookings 50000 --days 30
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlmodel import select
+
+import analytics
+from bench.seed import reset, seed
+from db import async_engine, get_async_session
+from lifecycle import booking_history
+from migrate import migrate
+
+
+async def rescan(day_from, day_to):
+    """Загрузка и no-show по броням периода напрямую из истории."""
+    b = booking_history().c
+    q = select(b.printer_id, b.tg_user, b.start_at, b.end_at, b.status == "cancelled").where(
+        b.end_at > datetime.combine(day_from, datetime.min.time()),
+        b.start_at < datetime.combine(day_to, datetime.min.time()),
+    )
+    async with get_async_session() as s:
+        rows = (await s.exec(q)).all()
+    printer_id, tg_user, start, end, cancelled = (np.array(c) for c in zip(*rows))
+    start, end = analytics.to_minutes(start), analytics.to_minutes(end)
+    cancelled = cancelled.astype(bool)
+    usage = analytics.usage_rows(printer_id.astype(np.int64), start, end, ~cancelled)
+    users = analytics.user_rows(tg_user.astype(np.int64), start, end, cancelled, np.zeros(len(rows), dtype=np.int64))
+    return len(rows), len(usage), len(users)
+
+
+async def report(day_from, day_to):
+    async with get_async_session() as s:
+        return await analytics.report(s, day_from, day_to)
+
+
+async def timed(fn, *args, repeat: int):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = await fn(*args)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000, out
+
+
+async def run(args):
+    await asyncio.to_thread(migrate)
+    await seed(users=args.users, bookings=args.bookings, models=0, pending=0, history_days=args.history_days)
+    t0 = time.perf_counter()
+    counts = await analytics.rebuild()
+    print(f"{async_engine.dialect.name}: rebuild {time.perf_counter() - t0:.2f} s, {counts}")
+    day_to = datetime.utcnow().date() + timedelta(days=1)
+    day_from = day_to - timedelta(days=args.days)
+    print(f"отчёт за {args.days} дней, медиана из {args.repeat}")
+    ms, out = await timed(report, day_from, day_to, repeat=args.repeat)
+    print(f"  сводки           {ms:>8.1f} ms  броней {out['bookings']}, загрузка {out['occupancy']['total']}")
+    ms, (bookings, usage, users) = await timed(rescan, day_from, day_to, repeat=args.repeat)
+    print(f"  пересчёт истории {ms:>8.1f} ms  броней {bookings} -> {usage} строк загрузки, {users} строк пользователей")
+    if not args.keep:
+        await reset()
+        await analytics.rebuild()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=50_000)
+    parser.add_argument("--history-days", type=int, default=180)
+    parser.add_argument("--days", type=int, default=analytics.DEFAULT_DAYS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="не удалять засеянные данные")
+    args = parser.parse_args()
+    asyncio.run(run(args))
@@ -0,0 +1,66 @@
+"""
+Пропускная способность отдачи HTML и статики через ASGI-приложение.
+Для сравнения «до/после» тот же скрипт запускается на предыдущей ревизии.
+
+    DB_SQLITE=bench.db python -m bench.assets --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import re
+import time
+
+import httpx
+
+import main
+from migrate import migrate
+
+CASES = (
+    ("/", {"Accept-Encoding": "gzip, br"}),
+    ("/library", {"Accept-Encoding": "gzip, br"}),
+    ("/static/js/app.js", {"Accept-Encoding": "gzip, br"}),
+    ("/static/css/style.css", {"Accept-Encoding": "gzip, br"}),
+    ("/static/img/default-avatar.png", {}),
+)
+
+
+async def hammer(c: httpx.AsyncClient, url: str, headers: dict, requests: int, concurrency: int):
+    sent = 0
+    size = 0
+
+    async def worker():
+        nonlocal sent, size
+        while sent < requests:
+            sent += 1
+            r = await c.get(url, headers=headers)
+            size = int(r.headers.get("content-length", len(r.content)))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - t0), size
+
+
+async def run(requests: int, concurrency: int):
+    migrate()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        index = (await c.get("/")).text
+        cases = list(CASES)
+        hashed = re.search(r"/static/js/app\.\w+\.js", index)
+        if hashed:
+            cases.append((hashed.group(0), {"Accept-Encoding": "gzip, br"}))
+        for url, headers in cases:
+            rps, size = await hammer(c, url, headers, requests, concurrency)
+            etag = (await c.get(url, headers=headers)).headers.get("etag")
+            line = f"  {url:<40} {rps:8.0f} rps  {size:7d} байт"
+            if etag:
+                rps304, _ = await hammer(c, url, {**headers, "If-None-Match": etag}, requests, concurrency)
+                line += f"   304: {rps304:8.0f} rps"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency))
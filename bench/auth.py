@@ -0,0 +1,104 @@
+"""
+Накладные расходы авторизации на запрос: проверка подписи initData без кэша и с кэшем
+IdentityResolver, плюс путь бронирования для нового и уже знакомого пользователя.
+
+    DB_SQLITE=bench.db python -m bench.auth --iterations 20000
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import httpx
+from starlette.requests import Request
+
+from auth import AdminList, IdentityResolver, check_init_data
+from bench.seed import ensure_printers
+from migrate import migrate
+
+BOT_TOKEN = "123456:bench"
+
+
+def sign(tg_id: int, bot_token: str = BOT_TOKEN) -> str:
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"q{tg_id}",
+        "user": json.dumps({"id": tg_id, "username": f"user{tg_id}", "first_name": "Bench"}),
+    }
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def request_with(headers: dict) -> Request:
+    raw = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def per_call(fn, iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def micro(iterations: int):
+    admins = AdminList(frozenset(range(1000, 1050)))
+    legacy_admins = list(range(1000, 1050))
+    init_data = sign(1049)
+    resolver = IdentityResolver(BOT_TOKEN, admins)
+
+    def legacy():
+        # Прежняя проверка: X-TG-ID и поиск в списке
+        req = request_with({"X-TG-ID": "1049"})
+        return int(req.headers.get("X-TG-ID")) in legacy_admins
+
+    rows = [
+        ("X-TG-ID + список (было)", legacy),
+        ("initData, подпись каждый раз", lambda: check_init_data(init_data, BOT_TOKEN)),
+        ("initData, IdentityResolver", lambda: resolver.is_admin(request_with({"X-TG-Init-Data": init_data}))),
+    ]
+    for name, fn in rows:
+        print(f"{name:32s} {per_call(fn, iterations):8.2f} us/запрос")
+
+
+async def bookings(count: int):
+    migrate()
+    await ensure_printers([1, 2, 3])
+    import main
+
+    base = datetime.utcnow().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=800)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as c:
+        for label, tg_base, warm in (("новые пользователи", 30_000, False), ("знакомый пользователь", 40_000, True)):
+            if warm:
+                r = await c.post("/api/book", json={
+                    "tg_user": tg_base, "username": "warm",
+                    "start": (base - timedelta(days=1)).isoformat(), "end": (base - timedelta(hours=23)).isoformat(),
+                })
+                r.raise_for_status()
+            t0 = time.perf_counter()
+            for i in range(count):
+                start = base + timedelta(hours=i)
+                r = await c.post("/api/book", json={
+                    "tg_user": tg_base if warm else tg_base + i, "username": f"u{i % 3}", "printer_id": 2 if warm else 3,
+                    "start": start.isoformat(), "end": (start + timedelta(hours=1)).isoformat(),
+                })
+                r.raise_for_status()
+            elapsed = time.perf_counter() - t0
+            print(f"/api/book, {label:22s} {elapsed / count * 1000:6.2f} ms/бронь")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--bookings", type=int, default=200)
+    args = parser.parse_args()
+    micro(args.iterations)
+    if args.bookings:
+        asyncio.run(bookings(args.bookings))
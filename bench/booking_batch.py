@@ -0,0 +1,55 @@
+"""
+100 отдельных POST /api/book против одного POST /api/book/batch с теми же интервалами.
+
+    DB_SQLITE=bench.db python -m bench.booking_batch --count 100
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+import main
+from bench.seed import ensure_printers
+from migrate import migrate
+
+
+def intervals(first: datetime, count: int):
+    # Час в день, как у кружка с регулярными занятиями
+    return [
+        {"start": (first + timedelta(days=i)).isoformat(), "end": (first + timedelta(days=i, hours=1)).isoformat()}
+        for i in range(count)
+    ]
+
+
+async def run(count: int, printer_id: int):
+    migrate()
+    await ensure_printers([printer_id])
+    base = datetime.utcnow().replace(hour=14, minute=0, second=0, microsecond=0) + timedelta(days=400)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as c:
+        single = intervals(base, count)
+        t0 = time.perf_counter()
+        for i in single:
+            r = await c.post("/api/book", json={**i, "tg_user": 20_001, "printer_id": printer_id})
+            r.raise_for_status()
+        t_single = time.perf_counter() - t0
+
+        batch = intervals(base + timedelta(days=count), count)
+        t0 = time.perf_counter()
+        r = await c.post("/api/book/batch", json={"intervals": batch, "tg_user": 20_002, "printer_id": printer_id})
+        r.raise_for_status()
+        t_batch = time.perf_counter() - t0
+
+    print(f"{count} x /api/book:      {t_single * 1000:8.1f} ms ({t_single / count * 1000:.2f} ms/бронь)")
+    print(f"1 x /api/book/batch:   {t_batch * 1000:8.1f} ms ({t_batch / count * 1000:.2f} ms/бронь)")
+    print(f"ускорение: x{t_single / t_batch:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--printer", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.count, args.printer))
@@ -0,0 +1,44 @@
+"""
+Гонка за один слот: сотни одновременных POST /api/book от разных пользователей.
+Ровно одна бронь должна пройти, остальные — получить 409.
+
+    DB_SQLITE=bench.db python -m bench.booking_race --requests 300
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+import main
+from bench.seed import ensure_printers
+from migrate import migrate
+
+
+async def run(requests: int) -> bool:
+    migrate()
+    await ensure_printers([1])
+    start = (datetime.utcnow() + timedelta(days=3)).replace(hour=12, minute=0, second=0, microsecond=0)
+    payload = {"start": start.isoformat(), "end": (start + timedelta(hours=1)).isoformat(), "printer_id": 1}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as c:
+        t0 = time.perf_counter()
+        responses = await asyncio.gather(*(
+            c.post("/api/book", json={**payload, "tg_user": 10_000 + i}) for i in range(requests)
+        ))
+        elapsed = time.perf_counter() - t0
+    codes = Counter(r.status_code for r in responses)
+    print(f"{requests} одновременных запросов за {elapsed:.2f}s: {dict(codes)}")
+    ok = codes[200] == 1 and codes[409] == requests - 1
+    print("OK: прошла ровно одна бронь" if ok else "FAIL: ожидалась ровно одна успешная бронь")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.requests)) else 1)
@@ -0,0 +1,76 @@
+"""
+Нагрузочная проверка шины событий: тысячи подписчиков, часть из них медленные.
+Меряет время publish(), задержку доставки и сколько клиентов получили resync.
+
+    python -m bench.events --subscribers 3000 --events 200 --slow 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from events import RESYNC, EventBroker
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else 0.0
+
+
+async def subscriber(broker, ready, done, delay, latencies, stats):
+    async with broker.subscribe() as sub:
+        ready.release()
+        while not done.is_set():
+            try:
+                frame = await asyncio.wait_for(sub.get(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            if frame is RESYNC:
+                stats["resync"] += 1
+                continue
+            sent = json.loads(frame.split("data: ", 1)[1])["ts"]
+            latencies.append(time.perf_counter() - sent)
+            stats["delivered"] += 1
+            if delay:
+                await asyncio.sleep(delay)
+        stats["dropped"] += sub.dropped
+
+
+async def run(subscribers: int, events: int, slow: float, rate: float):
+    broker = EventBroker()
+    ready = asyncio.Semaphore(0)
+    done = asyncio.Event()
+    latencies = []
+    stats = {"delivered": 0, "resync": 0, "dropped": 0}
+    tasks = [
+        asyncio.create_task(subscriber(broker, ready, done, 0.5 if random.random() < slow else 0, latencies, stats))
+        for _ in range(subscribers)
+    ]
+    for _ in range(subscribers):
+        await ready.acquire()
+
+    publish_times = []
+    for i in range(events):
+        t0 = time.perf_counter()
+        broker.publish("booking.created", {"id": i, "ts": time.perf_counter()})
+        publish_times.append(time.perf_counter() - t0)
+        await asyncio.sleep(1 / rate)
+    await asyncio.sleep(1)
+    done.set()
+    await asyncio.gather(*tasks)
+
+    print(f"{subscribers} подписчиков, {events} событий ({rate:.0f}/s), медленных {slow:.0%}")
+    print(f"  publish          p50={percentile(publish_times, 50) * 1000:7.2f}ms  p99={percentile(publish_times, 99) * 1000:7.2f}ms")
+    print(f"  доставка         p50={percentile(latencies, 50) * 1000:7.2f}ms  p99={percentile(latencies, 99) * 1000:7.2f}ms")
+    print(f"  доставлено {stats['delivered']}, resync {stats['resync']}, отброшено {stats['dropped']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=3000)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--slow", type=float, default=0.05)
+    parser.add_argument("--rate", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.events, args.slow, args.rate))
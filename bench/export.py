@@ -0,0 +1,117 @@
+"""
+Выгрузка большого архива: засевает N синтетических броней (по умолчанию 1 000 000 на 10 принтеров,
+~11 лет по часу подряд), выгружает их через /api/admin/export/bookings и проверяет пиковую память
+процесса во время выгрузки (tracemalloc). Выходит с ненулевым кодом, если пик больше --limit-mb.
+
+    DB_SQLITE=bench.db ADMIN_IDS=1 python -m bench.export --rows 1000000 --format csv
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+from sqlmodel import select
+
+import main
+from db import Booking, User, async_engine
+from migrate import migrate
+
+ADMIN_ID = 1
+PRINTERS = 10
+USERS = 1000
+SEED_CHUNK = 10_000
+BASE = datetime(2015, 1, 1, 8, 0)
+
+
+async def seed(rows: int):
+    async with async_engine.begin() as conn:
+        have = (await conn.execute(select(func.count()).select_from(Booking).where(Booking.tg_user >= 900_000))).scalar()
+        if have >= rows:
+            return
+        user_ids = (await conn.execute(select(User.id).where(User.tg_id >= 900_000).order_by(User.id))).scalars().all()
+        if not user_ids:
+            await conn.execute(insert(User.__table__), [
+                {"tg_id": 900_000 + i, "username": f"bench{i}", "first_name": "Бенч", "nickname": None}
+                for i in range(USERS)
+            ])
+            user_ids = (await conn.execute(select(User.id).where(User.tg_id >= 900_000).order_by(User.id))).scalars().all()
+
+    t0 = time.perf_counter()
+    for chunk_start in range(have, rows, SEED_CHUNK):
+        batch = []
+        for i in range(chunk_start, min(rows, chunk_start + SEED_CHUNK)):
+            # Каждому принтеру — свой непрерывный ряд часовых слотов; архив уже не active,
+            # поэтому проверка пересечений при вставке не срабатывает
+            start = BASE + timedelta(hours=i // PRINTERS)
+            batch.append({
+                "user_id": user_ids[i % USERS], "tg_user": 900_000 + i % USERS, "printer_id": 100 + i % PRINTERS,
+                "start_at": start, "end_at": start + timedelta(hours=1), "created_at": start, "status": "completed",
+            })
+        async with async_engine.begin() as conn:
+            await conn.execute(insert(Booking.__table__), batch)
+    print(f"засеяно {rows - have} броней за {time.perf_counter() - t0:.1f}s")
+
+
+async def export(fmt: str) -> int:
+    """
+    Запрос прямо в ASGI-приложение: httpx.ASGITransport копит тело ответа целиком,
+    а здесь байты только считаются, как их считал бы сокет.
+    """
+    size = 0
+    status = None
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal size, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body"):
+                done.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/admin/export/bookings", "raw_path": b"/api/admin/export/bookings",
+        "query_string": f"format={fmt}".encode(), "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(b"host", b"bench"), (b"x-tg-id", str(ADMIN_ID).encode())],
+    }
+    await main.app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"export вернул {status}")
+    return size
+
+
+async def run(rows: int, fmt: str, limit_mb: float) -> bool:
+    migrate()
+    await seed(rows)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = await export(fmt)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_mb = peak / 2**20
+    print(f"{fmt}: {size / 2**20:.1f} MiB за {elapsed:.1f}s, пик памяти {peak_mb:.1f} MiB (лимит {limit_mb} MiB)")
+    return peak_mb <= limit_mb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--limit-mb", type=float, default=64)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.rows, args.format, args.limit_mb)) else 1)
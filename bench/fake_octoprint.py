@@ -0,0 +1,74 @@
+"""
+Локальная имитация OctoPrint для бенчмарков и ручной проверки.
+Несколько принтеров на одном сервере: http://host:port/<printer>/api/...
+
+    python -m bench.fake_octoprint --port 5001 --duration 30
+"""
+import argparse
+import time
+from collections import defaultdict
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+
+class FakeOctoPrint:
+    def __init__(self, duration: float = 1.0, durations: dict = None, fail_every: int = 0):
+        self.duration = duration
+        self.durations = durations or {}
+        # каждый fail_every-й запрос отвечает 503, чтобы проверить повторы клиента
+        self.fail_every = fail_every
+        self.requests = 0
+        self.connections = set()
+        self.busy_until = defaultdict(float)
+        self.busy_time = defaultdict(float)
+        self.uploads = defaultdict(int)
+        self.app = self._build()
+
+    def state(self, printer: str):
+        return "Printing" if time.monotonic() < self.busy_until[printer] else "Operational"
+
+    def _build(self):
+        app = FastAPI(title="Fake OctoPrint")
+
+        @app.middleware("http")
+        async def track(request: Request, call_next):
+            # Порт клиента у каждого TCP-соединения свой — по ним видно переиспользование
+            self.connections.add((request.client.host, request.client.port))
+            self.requests += 1
+            if self.fail_every and self.requests % self.fail_every == 0:
+                return JSONResponse({"error": "injected failure"}, status_code=503)
+            return await call_next(request)
+
+        @app.post("/{printer}/api/files/local", status_code=201)
+        async def upload(printer: str, file: UploadFile = File(...), print: str = Form("false")):
+            while await file.read(1024 * 1024):
+                pass
+            self.uploads[printer] += 1
+            if print == "true":
+                if self.state(printer) == "Printing":
+                    raise HTTPException(409, "Printer is busy")
+                duration = self.durations.get(printer, self.duration)
+                self.busy_until[printer] = time.monotonic() + duration
+                self.busy_time[printer] += duration
+            return {"done": True, "files": {"local": {"name": file.filename}}}
+
+        @app.get("/{printer}/api/job")
+        async def job(printer: str):
+            return {"state": self.state(printer), "job": {}, "progress": {}}
+
+        @app.get("/{printer}/api/printer")
+        async def printer_state(printer: str):
+            return {"state": {"text": self.state(printer)}}
+
+        return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+    uvicorn.run(FakeOctoPrint(args.duration).app, host="127.0.0.1", port=args.port)
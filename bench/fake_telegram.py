@@ -0,0 +1,77 @@
+"""
+Локальная имитация Telegram Bot API (sendMessage) для бенчмарков и ручной проверки уведомлений.
+Как и настоящий, отвечает 429 с retry_after, если бот шлёт больше --rate сообщений в секунду
+или чаще раза в секунду в один чат.
+
+    python -m bench.fake_telegram --port 8081   # TELEGRAM_API_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class FakeTelegram:
+    def __init__(self, rate: int = 30, chat_interval: float = 1.0, latency: float = 0.05, blocked=()):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.latency = latency
+        # Чаты, где пользователь заблокировал бота: 403, как у Telegram
+        self.blocked = set(blocked)
+        self.window = deque()
+        self.chat_last = {}
+        self.messages = defaultdict(list)
+        self.sent_at = []
+        self.flood = 0
+        self.app = self._build()
+
+    def _limited(self, chat_id: int, now: float):
+        while self.window and self.window[0] <= now - 1:
+            self.window.popleft()
+        if len(self.window) >= self.rate:
+            return 1
+        last = self.chat_last.get(chat_id)
+        if last is not None and now - last < self.chat_interval:
+            return 1
+        return 0
+
+    def _build(self):
+        app = FastAPI(title="Fake Telegram Bot API")
+
+        @app.post("/bot{token}/sendMessage")
+        async def send_message(token: str, request: Request):
+            payload = await request.json()
+            chat_id = int(payload["chat_id"])
+            await asyncio.sleep(self.latency)
+            if chat_id in self.blocked:
+                return JSONResponse(
+                    {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, 403
+                )
+            now = time.monotonic()
+            if retry_after := self._limited(chat_id, now):
+                self.flood += 1
+                return JSONResponse({
+                    "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, 429)
+            self.window.append(now)
+            self.chat_last[chat_id] = now
+            self.messages[chat_id].append(payload["text"])
+            self.sent_at.append(now)
+            return {"ok": True, "result": {"message_id": len(self.sent_at), "chat": {"id": chat_id}, "text": payload["text"]}}
+
+        return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    uvicorn.run(FakeTelegram(args.rate, latency=args.latency).app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,151 @@
+"""
+Обслуживание таблицы броней на многомиллионной истории: засевает N броней (по умолчанию 2 000 000
+на 50 принтеров, по часу подряд до текущего момента), меряет типичные запросы, прогоняет
+BookingLifecycle (completed + перенос в архив) и меряет те же запросы ещё раз.
+Брони последних --active-days дней засеваются active — их worker должен пометить completed.
+
+    python -m bench.lifecycle --rows 2000000 --requests 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import delete, func, insert, text
+from sqlmodel import select
+
+import main
+from db import Booking, BookingArchive, User, async_engine
+from lifecycle import BookingLifecycle
+from migrate import migrate
+
+TG_BASE = 800_000
+PRINTER_BASE = 200
+PRINTERS = 50
+USERS = 1000
+SEED_CHUNK = 10_000
+FUTURE_HOURS = 7 * 24
+
+
+async def reset():
+    async with async_engine.begin() as conn:
+        for table in (Booking, BookingArchive):
+            await conn.execute(delete(table).where(table.tg_user >= TG_BASE, table.tg_user < TG_BASE + USERS))
+        user_ids = (await conn.execute(
+            select(User.id).where(User.tg_id >= TG_BASE, User.tg_id < TG_BASE + USERS).order_by(User.id)
+        )).scalars().all()
+        if not user_ids:
+            await conn.execute(insert(User.__table__), [
+                {"tg_id": TG_BASE + i, "username": f"bench{i}", "first_name": "Бенч", "nickname": None}
+                for i in range(USERS)
+            ])
+            user_ids = (await conn.execute(
+                select(User.id).where(User.tg_id >= TG_BASE, User.tg_id < TG_BASE + USERS).order_by(User.id)
+            )).scalars().all()
+    return user_ids
+
+
+async def seed(rows: int, active_days: int, now: datetime):
+    user_ids = await reset()
+    rng = random.Random(1)
+    hours = rows // PRINTERS
+    first = now - timedelta(hours=hours - FUTURE_HOURS)
+    active_from = now - timedelta(days=active_days)
+    t0 = time.perf_counter()
+    for chunk_start in range(0, rows, SEED_CHUNK):
+        batch = []
+        for i in range(chunk_start, min(rows, chunk_start + SEED_CHUNK)):
+            # У каждого принтера — непрерывный ряд часовых слотов, пересечений нет
+            start = first + timedelta(hours=i // PRINTERS)
+            u = rng.randrange(USERS)
+            if start >= active_from:
+                status = "active"
+            else:
+                status = "cancelled" if rng.random() < 0.1 else "completed"
+            batch.append({
+                "user_id": user_ids[u], "tg_user": TG_BASE + u, "printer_id": PRINTER_BASE + i % PRINTERS,
+                "start_at": start, "end_at": start + timedelta(hours=1), "created_at": start, "status": status,
+            })
+        async with async_engine.begin() as conn:
+            await conn.execute(insert(Booking.__table__), batch)
+    await analyze()
+    print(f"засеяно {rows} броней за {time.perf_counter() - t0:.1f}s")
+
+
+async def analyze():
+    # После переноса в PostgreSQL остаются мёртвые строки; VACUUM — то, что сделал бы autovacuum
+    async with async_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE" if conn.dialect.name == "postgresql" else "ANALYZE"))
+
+
+async def counts():
+    async with async_engine.connect() as conn:
+        live = (await conn.execute(select(func.count()).select_from(Booking))).scalar()
+        archived = (await conn.execute(select(func.count()).select_from(BookingArchive))).scalar()
+    return live, archived
+
+
+def queries(rng):
+    user = TG_BASE + rng.randrange(USERS)
+    return [
+        ("текущие брони", "/api/bookings", {"tg_user": user}),
+        ("слоты на неделю", "/api/slots", {"from": "0", "days": 7, "printer_id": PRINTER_BASE}),
+        ("архив пользователя", "/api/bookings/archive", {"tg_user": user, "limit": 50}),
+        ("история пользователя", "/api/bookings", {"tg_user": user, "all": "true", "limit": 50}),
+    ]
+
+
+async def measure(client, requests: int):
+    rng = random.Random(2)
+    times = {}
+    for _ in range(requests):
+        for name, url, params in queries(rng):
+            t0 = time.perf_counter()
+            r = await client.get(url, params=params)
+            times.setdefault(name, []).append((time.perf_counter() - t0) * 1000)
+            r.raise_for_status()
+    for name, values in times.items():
+        print(f"  {name:22s} p50 {statistics.median(values):8.2f} ms  max {max(values):8.2f} ms")
+
+
+async def run(rows: int, requests: int, active_days: int, archive_days: int, batch: int):
+    migrate()
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    await seed(rows, active_days, now)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        live, archived = await counts()
+        print(f"{async_engine.dialect.name}: до обслуживания — в Booking {live}, в архиве {archived}")
+        await measure(client, requests)
+
+        worker = BookingLifecycle(archive_after=timedelta(days=archive_days), batch_size=batch)
+        t0 = time.perf_counter()
+        completed = await worker.complete()
+        t1 = time.perf_counter()
+        archived = await worker.archive()
+        t2 = time.perf_counter()
+        print(f"completed: {completed} за {t1 - t0:.2f}s; в архив: {archived} за {t2 - t1:.1f}s "
+              f"({archived / max(t2 - t1, 1e-9):.0f} строк/s, пачка {batch})")
+        t0 = time.perf_counter()
+        again = await worker.run_once()
+        print(f"повторный проход (ничего не делает): {again}, {(time.perf_counter() - t0) * 1000:.1f} ms")
+        await analyze()
+
+        live, archived = await counts()
+        print(f"после — в Booking {live}, в архиве {archived}")
+        await measure(client, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--active-days", type=int, default=2)
+    parser.add_argument("--archive-days", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.requests, args.active_days, args.archive_days, args.batch))
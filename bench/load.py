@@ -0,0 +1,240 @@
+"""
+Нагрузочный прогон всего приложения: засевает БД (bench/seed.py) и гоняет настоящий main.app через
+ASGI-клиент. --users виртуальных пользователей повторяют app.js: при открытии — библиотека,
+мои брони, проверка админа (у админов ещё админские брони и заявки) и слоты выбранного дня,
+затем раз в --interval секунд refreshAll: слоты, мои брони, у админов админские брони и заявки.
+Параллельно меряется, насколько «залипает» event loop.
+
+Для каждого эндпоинта — запросов в секунду и p50/p95/p99; результат пишется в JSON (--out),
+а --compare сравнивает с прошлым прогоном и отмечает, где p95 вырос больше --tolerance.
+
+    DB_SQLITE=bench.db python -m bench.load --users 500 --interval 5 --duration 60 --out before.json
+    DB_SQLITE=bench.db python -m bench.load --users 500 --interval 5 --duration 60 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+import main
+from bench.auth import sign
+from bench.seed import PRINTER_BASE, TG_BASE, seed
+from db import async_engine
+from migrate import migrate
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def summary(self, elapsed: float) -> dict:
+        out = {}
+        for name in sorted(set(self.latency) | set(self.errors)):
+            values = self.latency[name]
+            out[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "rps": round(len(values) / elapsed, 1),
+                "mean_ms": round(statistics.fmean(values) * 1000, 2) if values else 0,
+                **{f"p{q}_ms": round(percentile(values, q) * 1000, 2) for q in (50, 95, 99)},
+            }
+        return out
+
+
+class VirtualUser:
+    def __init__(self, c: httpx.AsyncClient, index: int, admin: bool, printers: int, stats: Stats, rng):
+        self.c = c
+        self.tg_id = TG_BASE + index
+        self.admin = admin
+        self.stats = stats
+        self.rng = rng
+        self.printer_id = PRINTER_BASE + rng.randrange(printers)
+        self.day = rng.randrange(7)
+        token = main.identities.bot_token
+        self.headers = {"X-TG-Init-Data": sign(self.tg_id, token)} if token else {"X-TG-ID": str(self.tg_id)}
+
+    async def get(self, name: str, url: str, **params):
+        t0 = time.perf_counter()
+        try:
+            r = await self.c.get(url, params=params, headers=self.headers)
+        except httpx.HTTPError:
+            self.stats.errors[name] += 1
+            return
+        if r.status_code >= 400:
+            self.stats.errors[name] += 1
+            return
+        self.stats.latency[name].append(time.perf_counter() - t0)
+
+    async def open(self):
+        await self.get("models", "/api/models")
+        await self.get("my_bookings", "/api/bookings", tg_user=self.tg_id)
+        await self.get("user_is_admin", f"/api/user_is_admin/{self.tg_id}")
+        if self.admin:
+            await self.get("admin_bookings", "/api/admin/bookings")
+            await self.get("pending_models", "/api/pending_models")
+        await self.get("slots", f"/api/slots/{self.day}", printer_id=self.printer_id)
+
+    async def refresh(self):
+        await asyncio.gather(
+            self.get("slots", f"/api/slots/{self.day}", printer_id=self.printer_id),
+            self.get("my_bookings", "/api/bookings", tg_user=self.tg_id),
+            *((
+                self.get("admin_bookings", "/api/admin/bookings"),
+                self.get("pending_models", "/api/pending_models"),
+            ) if self.admin else ()),
+        )
+
+    async def run(self, interval: float, deadline: float):
+        # Пользователи открывают приложение не одновременно
+        await asyncio.sleep(self.rng.uniform(0, interval))
+        await self.open()
+        while True:
+            await asyncio.sleep(interval * self.rng.uniform(0.9, 1.1))
+            if time.perf_counter() >= deadline:
+                return
+            await self.refresh()
+
+
+async def loop_lag(stop: asyncio.Event, out: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        out.append(time.perf_counter() - t0 - 0.01)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run(args) -> dict:
+    await asyncio.to_thread(migrate)
+    main.ensure_dirs()
+    volumes = None
+    if not args.no_seed:
+        volumes = await seed(args.seed_users, args.bookings, args.models, args.pending, args.printers)
+    rng = random.Random(args.seed)
+    admins = {TG_BASE + i for i in range(args.users) if rng.random() < args.admin_share}
+    main.admins.reload(main.admins.ids | admins)
+
+    stats = Stats()
+    lag = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop, lag))
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as c:
+        users = [
+            VirtualUser(c, i % args.seed_users, TG_BASE + i in admins, args.printers, stats, random.Random(rng.random()))
+            for i in range(args.users)
+        ]
+        t0 = time.perf_counter()
+        deadline = t0 + args.duration
+        await asyncio.gather(*(u.run(args.interval, deadline) for u in users))
+        elapsed = time.perf_counter() - t0
+    stop.set()
+    await lag_task
+
+    endpoints = stats.summary(elapsed)
+    everything = [x for values in stats.latency.values() for x in values]
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "dialect": async_engine.dialect.name,
+            "cpu_count": os.cpu_count(),
+            "users": args.users,
+            "admins": len(admins),
+            "interval": args.interval,
+            "duration": round(elapsed, 1),
+            "data": volumes,
+        },
+        "endpoints": endpoints,
+        "total": {
+            "count": len(everything),
+            "errors": sum(stats.errors.values()),
+            "rps": round(len(everything) / elapsed, 1),
+            **{f"p{q}_ms": round(percentile(everything, q) * 1000, 2) for q in (50, 95, 99)},
+        },
+        "loop_lag_ms": {
+            "mean": round(statistics.fmean(lag) * 1000, 2) if lag else 0,
+            "max": round(max(lag, default=0) * 1000, 2),
+        },
+    }
+
+
+def report(result: dict):
+    meta = result["meta"]
+    print(f"{meta['dialect']}, {meta['users']} пользователей ({meta['admins']} админов), опрос раз в {meta['interval']}s, "
+          f"{meta['duration']}s")
+    for name, e in [*result["endpoints"].items(), ("всего", result["total"])]:
+        print(f"  {name:<16} {e['count']:>7} запр. {e['rps']:>7.1f} rps  p50 {e['p50_ms']:>7.1f}  p95 {e['p95_ms']:>7.1f}  "
+              f"p99 {e['p99_ms']:>7.1f} ms  ошибок {e['errors']}")
+    lag = result["loop_lag_ms"]
+    print(f"  loop lag         mean {lag['mean']:.1f} ms, max {lag['max']:.1f} ms")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """Сравнение p95 и rps с прошлым прогоном; True, если где-то p95 вырос больше tolerance."""
+    regressed = False
+    print(f"сравнение с {baseline['meta'].get('revision')} от {baseline['meta'].get('started_at')}:")
+    for name, e in [*result["endpoints"].items(), ("всего", result["total"])]:
+        old = baseline["endpoints"].get(name) if name != "всего" else baseline["total"]
+        if not old or not old["p95_ms"]:
+            continue
+        change = e["p95_ms"] / old["p95_ms"] - 1
+        mark = ""
+        if change > tolerance:
+            mark = "  <-- регрессия"
+            regressed = True
+        print(f"  {name:<16} p95 {old['p95_ms']:>7.1f} -> {e['p95_ms']:>7.1f} ms ({change:+.0%}), "
+              f"rps {old['rps']:.1f} -> {e['rps']:.1f}{mark}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200, help="виртуальных пользователей")
+    parser.add_argument("--interval", type=float, default=30, help="период опроса, с (в app.js — 30)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--admin-share", type=float, default=0.02)
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--models", type=int, default=2000)
+    parser.add_argument("--pending", type=int, default=100)
+    parser.add_argument("--printers", type=int, default=5)
+    parser.add_argument("--no-seed", action="store_true", help="данные уже засеяны (bench.seed)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="куда сохранить результат (JSON)")
+    parser.add_argument("--compare", help="JSON прошлого прогона")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p95")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    report(result)
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.compare and compare(result, json.loads(Path(args.compare).read_text()), args.tolerance):
+        raise SystemExit(1)
@@ -0,0 +1,79 @@
+"""
+Цена наблюдаемости: задержка типичных запросов через всё приложение (MetricsMiddleware, события
+SQLAlchemy) против того же ASGI-стека без них, и та же задержка с профилированием (X-Profile).
+
+    python -m bench.metrics --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from sqlalchemy import event
+
+import main
+from db import async_engine
+from migrate import migrate
+
+PATHS = ["/api/models", "/api/slots", "/api/printers"]
+
+
+def without_engine_events():
+    # Снимает слушатели, добавленные instrument_engine, и возвращает функцию, которая их вернёт
+    removed = []
+    for target in (async_engine.sync_engine, main.engine):
+        for name in ("before_cursor_execute", "after_cursor_execute"):
+            for fn in list(target.dispatch.__getattribute__(name)):
+                if getattr(fn, "__module__", "") == "metrics":
+                    event.remove(target, name, fn)
+                    removed.append((target, name, fn))
+
+    def restore():
+        for target, name, fn in removed:
+            event.listen(target, name, fn)
+    return restore
+
+
+async def measure(app, requests: int, headers=None):
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as c:
+        for path in PATHS:
+            await c.get(path)
+        for i in range(requests):
+            t0 = time.perf_counter()
+            r = await c.get(PATHS[i % len(PATHS)], headers=headers)
+            latencies.append(time.perf_counter() - t0)
+            r.raise_for_status()
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+async def bench(requests: int):
+    await asyncio.to_thread(migrate)
+    main.ensure_dirs()
+    full = main.app
+    # Тот же стек без MetricsMiddleware: собираем его заново из остальных middleware
+    bare = main.FastAPI()
+    bare.router = full.router
+    bare.user_middleware = [m for m in full.user_middleware if m.cls is not main.MetricsMiddleware]
+    admin = next(iter(main.admins.ids), None)
+
+    restore = without_engine_events()
+    p50, p99 = await measure(bare, requests)
+    restore()
+    print(f"без метрик:        p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+    p50, p99 = await measure(full, requests)
+    print(f"с метриками:       p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+    if admin is None:
+        print("профилирование: задайте ADMIN_IDS")
+        return
+    p50, p99 = await measure(full, requests // 10, {"X-Profile": "1", "X-TG-ID": str(admin)})
+    print(f"с профилированием: p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(bench(args.requests))
@@ -0,0 +1,157 @@
+"""
+Модерация --count заявок: по одной (POST /api/admin/approve_model и reject_model на каждую, как
+кнопками в app.js) против пакетных /api/admin/approve_models и reject_models по --batch id.
+Половина заявок — старые загрузки файлом в uploads/pending (одобрение переносит его в uploads/models),
+половина — блобы с превью (отклонение их удаляет). Для каждого варианта — время, заявок в секунду,
+насколько «залипал» event loop и где после этого лежат файлы заявок.
+
+    DB_SQLITE=bench.db python -m bench.moderation --count 1000
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import time
+
+import httpx
+from sqlalchemy import delete, insert
+from sqlmodel import select
+
+import main
+from bench.auth import sign
+from bench.load import loop_lag
+from db import ModelItem, Notification, PendingModel, async_engine
+from migrate import migrate
+from moderation import blob_files
+from storage import blob_path
+
+ADMIN_ID = 800_000
+PREFIX = "bench_mod_"
+FILE_SIZE = 64 * 1024
+# Заявки «старые»: моложе SWEEP_GRACE файлы не удаляются
+AGE = 86400
+
+
+def write_files(count: int, tag: str):
+    """Файлы заявок: чётные — старые загрузки в uploads/pending, нечётные — блобы с превью."""
+    old = time.time() - AGE
+    rows = []
+    for i in range(count):
+        data = f"{tag}:{i}:".encode() * (FILE_SIZE // 16)
+        filename = f"{PREFIX}{tag}{i}.stl"
+        if i % 2 == 0:
+            path = main.PENDING_DIR / filename
+            path.write_bytes(data)
+            os.utime(path, (old, old))
+            rows.append({"filename": filename, "file_hash": None, "thumb_hash": None})
+            continue
+        sha256 = hashlib.sha256(data).hexdigest()
+        for path in blob_files(sha256):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data if path == blob_path(sha256) else b"RIFF")
+            os.utime(path, (old, old))
+        rows.append({"filename": filename, "file_hash": sha256, "thumb_hash": sha256})
+    return rows
+
+
+def files_on_disk(rows):
+    """(файлов старых загрузок в uploads/pending, в uploads/models, файлов блобов с превью)."""
+    legacy = [r["filename"] for r in rows if not r["file_hash"]]
+    blobs = [p for r in rows if r["file_hash"] for p in blob_files(r["file_hash"])]
+    return (
+        sum((main.PENDING_DIR / name).exists() for name in legacy),
+        sum((main.UPLOADS_MODELS / name).exists() for name in legacy),
+        sum(p.exists() for p in blobs),
+    )
+
+
+async def seed(count: int, tag: str):
+    rows = await asyncio.to_thread(write_files, count, tag)
+    async with async_engine.begin() as conn:
+        await conn.execute(insert(PendingModel), [
+            {**r, "submitter_tg": ADMIN_ID + 1 + i % 50, "title": f"Заявка {tag}{i}", "image": None,
+             "moderated": False, "print_time": 3600}
+            for i, r in enumerate(rows)
+        ])
+        ids = (await conn.execute(
+            select(PendingModel.id).where(PendingModel.filename.like(f"{PREFIX}{tag}%")).order_by(PendingModel.id)
+        )).scalars().all()
+    return ids, rows
+
+
+async def reset():
+    async with async_engine.begin() as conn:
+        hashes = set((await conn.execute(
+            select(PendingModel.file_hash).where(PendingModel.filename.like(f"{PREFIX}%"), PendingModel.file_hash != None)
+        )).scalars())
+        for model in (ModelItem, PendingModel):
+            await conn.execute(delete(model).where(model.filename.like(f"{PREFIX}%")))
+        await conn.execute(delete(Notification).where(Notification.chat_id > ADMIN_ID, Notification.chat_id <= ADMIN_ID + 50))
+
+    def unlink():
+        for directory in (main.PENDING_DIR, main.UPLOADS_MODELS):
+            for path in directory.glob(f"{PREFIX}*"):
+                path.unlink()
+        for sha256 in hashes:
+            for path in blob_files(sha256):
+                path.unlink(missing_ok=True)
+
+    await asyncio.to_thread(unlink)
+
+
+async def one_by_one(c, action: str, ids):
+    for pending_id in ids:
+        r = await c.post(f"/api/admin/{action}_model", json={"pending_id": pending_id})
+        r.raise_for_status()
+
+
+async def batched(c, action: str, ids, batch: int):
+    for i in range(0, len(ids), batch):
+        r = await c.post(f"/api/admin/{action}_models", json={"ids": ids[i:i + batch]})
+        r.raise_for_status()
+
+
+async def run_once(c, label: str, action: str, count: int, moderate):
+    tag = f"{action[0]}{label[0]}"
+    ids, rows = await seed(count, tag)
+    lag = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop, lag))
+    t0 = time.perf_counter()
+    await moderate(c, action, ids)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await lag_task
+    pending, models, blobs = await asyncio.to_thread(files_on_disk, rows)
+    print(f"  {action:<7} {label:<9} {elapsed:>7.2f} s {count / elapsed:>6.0f} заявок/s  "
+          f"loop lag mean {statistics.fmean(lag) * 1000:>5.1f} / max {max(lag, default=0) * 1000:>6.1f} ms  "
+          f"файлы: pending {pending}, models {models}, блобы {blobs}")
+
+
+async def bench(args):
+    await asyncio.to_thread(migrate)
+    main.ensure_dirs()
+    await reset()
+    main.admins.reload(main.admins.ids | {ADMIN_ID})
+    token = main.identities.bot_token
+    headers = {"X-TG-Init-Data": sign(ADMIN_ID, token)} if token else {"X-TG-ID": str(ADMIN_ID)}
+    transport = httpx.ASGITransport(app=main.app)
+    print(f"{async_engine.dialect.name}, {args.count} заявок, пакеты по {args.batch}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=300) as c:
+        for action in ("approve", "reject"):
+            await run_once(c, "по одной", action, args.count, one_by_one)
+            await run_once(c, "пакетом", action, args.count,
+                           lambda c, action, ids: batched(c, action, ids, args.batch))
+    main.files.shutdown()
+    if not args.keep:
+        await reset()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=main.MAX_MODERATION_BATCH)
+    parser.add_argument("--keep", action="store_true", help="не удалять заявки и файлы после прогона")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
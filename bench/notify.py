@@ -0,0 +1,121 @@
+"""
+Очередь уведомлений против локального фейкового Bot API (bench/fake_telegram.py): засевает
+--messages сообщений на --chats чатов (часть чатов получает несколько подряд — они склеиваются)
+и --bookings броней, начинающихся через 10 минут, ставит по ним напоминания и меряет, за сколько
+Notifier разгребает очередь: сообщений в секунду, худшая секунда, 429 от Telegram и повторы.
+Для сравнения тот же прогон без ограничителя (--naive-rate сообщений в секунду).
+
+    python -m bench.notify --messages 2000 --chats 1500 --bookings 300
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+import uvicorn
+from sqlalchemy import delete, func, insert
+from sqlmodel import select
+
+from bench.fake_telegram import FakeTelegram
+from db import Booking, Notification, User, async_engine, get_async_session
+from migrate import migrate
+from notify import Notifier, enqueue
+
+TG_BASE = 700_000
+PRINTER_BASE = 5000
+BLOCKED = 5
+
+
+async def reset():
+    async with async_engine.begin() as conn:
+        await conn.execute(delete(Notification))
+        await conn.execute(delete(Booking).where(Booking.tg_user >= TG_BASE, Booking.tg_user < TG_BASE + 100_000))
+
+
+async def seed(messages: int, chats: int, bookings: int, rng):
+    await reset()
+    async with get_async_session() as s:
+        for i in range(messages):
+            enqueue(s, TG_BASE + rng.randrange(chats), f"Сообщение {i}: модель одобрена и добавлена в библиотеку.")
+        await s.commit()
+    if not bookings:
+        return
+    async with async_engine.begin() as conn:
+        user_id = (await conn.execute(select(User.id).where(User.tg_id == TG_BASE))).scalar()
+        if user_id is None:
+            user_id = (await conn.execute(insert(User).values(tg_id=TG_BASE).returning(User.id))).scalar()
+        start = datetime.utcnow() + timedelta(minutes=10)
+        # Каждая бронь на своём «принтере», чтобы не пересекаться по времени
+        await conn.execute(insert(Booking), [
+            {"user_id": user_id, "tg_user": TG_BASE + chats + i, "printer_id": PRINTER_BASE + i,
+             "start_at": start, "end_at": start + timedelta(hours=1)}
+            for i in range(bookings)
+        ])
+
+
+async def pending() -> int:
+    async with get_async_session() as s:
+        return (await s.exec(
+            select(func.count()).select_from(Notification).where(Notification.status == "pending")
+        )).one()
+
+
+async def run_once(label: str, rate: float, args, port: int):
+    rng = random.Random(1)
+    await seed(args.messages, args.chats, args.bookings, rng)
+    fake = FakeTelegram(latency=args.latency, blocked=[TG_BASE + i for i in range(BLOCKED)])
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    notifier = Notifier(token="bench", api_url=f"http://127.0.0.1:{port}", rate=rate)
+    t0 = time.perf_counter()
+    reminders = await notifier.remind()
+    queued = args.messages + reminders
+    await notifier.start()
+    notifier.wake()
+    while await pending() and time.perf_counter() - t0 < args.timeout:
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - t0
+    left = await pending()
+    await notifier.stop()
+    server.should_exit = True
+    await server_task
+
+    async with get_async_session() as s:
+        failed = (await s.exec(
+            select(func.count()).select_from(Notification).where(Notification.status == "failed")
+        )).one()
+    sent = len(fake.sent_at)
+    per_second = {}
+    for t in fake.sent_at:
+        per_second[int(t)] = per_second.get(int(t), 0) + 1
+    span = fake.sent_at[-1] - fake.sent_at[0] if sent > 1 else 0
+    print(
+        f"{label}: {queued} уведомлений ({reminders} напоминаний) -> {sent} сообщений за {elapsed:.1f} s, "
+        f"{sent / span if span else 0:.1f} msg/s, худшая секунда {max(per_second.values(), default=0)}, "
+        f"429: {fake.flood}, failed: {failed}, не отправлено: {left}"
+    )
+
+
+async def bench(args):
+    await asyncio.to_thread(migrate)
+    await run_once(f"ограничитель {args.rate:.0f}/s", args.rate, args, args.port)
+    await run_once(f"без ограничителя ({args.naive_rate:.0f}/s)", args.naive_rate, args, args.port + 1)
+    await reset()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=1500)
+    parser.add_argument("--bookings", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=25)
+    parser.add_argument("--naive-rate", type=float, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05, help="ответ Bot API, с")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--port", type=int, default=8792)
+    args = parser.parse_args()
+    asyncio.run(bench(args))
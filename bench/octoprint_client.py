@@ -0,0 +1,75 @@
+"""
+Клиент OctoPrint против локального фейкового сервера: сколько TCP-соединений
+открывается на серию опросов статуса и загрузок, и как отрабатывают повторы при 503.
+
+    python -m bench.octoprint_client --polls 200 --uploads 20 --fail-every 7
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+from bench.fake_octoprint import FakeOctoPrint
+from octoprint import OctoPrintClient
+
+
+async def fresh_client_per_call(base_url: str, polls: int, gcode: Path):
+    for _ in range(polls):
+        async with httpx.AsyncClient(base_url=base_url) as c:
+            (await c.get("/api/job")).raise_for_status()
+
+
+async def pooled(base_url: str, polls: int, uploads: int, gcode: Path):
+    client = OctoPrintClient(base_url, backoff=0.01)
+    try:
+        for _ in range(polls):
+            await client.status(max_age=0)
+        for _ in range(uploads):
+            await client.upload(str(gcode), print_after=False)
+        # одновременные запросы статуса склеиваются в один
+        await asyncio.gather(*(client.status(max_age=0) for _ in range(50)))
+    finally:
+        await client.aclose()
+
+
+async def measure(label, fake, fn):
+    fake.connections.clear()
+    fake.requests = 0
+    t0 = time.perf_counter()
+    await fn()
+    elapsed = time.perf_counter() - t0
+    print(f"  {label:<26} {elapsed:6.2f}s  запросов {fake.requests:5d}  соединений {len(fake.connections):4d}")
+
+
+async def run(polls: int, uploads: int, fail_every: int, size_mb: int, port: int):
+    fake = FakeOctoPrint(duration=0)
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}/p1"
+    with tempfile.NamedTemporaryFile(suffix=".gcode") as f:
+        f.truncate(size_mb * 2**20)
+        gcode = Path(f.name)
+        print(f"{polls} опросов статуса, {uploads} загрузок по {size_mb} МБ")
+        await measure("новый клиент на запрос", fake, lambda: fresh_client_per_call(base_url, polls, gcode))
+        await measure("общий пул", fake, lambda: pooled(base_url, polls, uploads, gcode))
+        fake.fail_every = fail_every
+        await measure(f"общий пул, 503 каждый {fail_every}-й", fake, lambda: pooled(base_url, polls, uploads, gcode))
+    server.should_exit = True
+    await task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--fail-every", type=int, default=7)
+    parser.add_argument("--size-mb", type=int, default=10)
+    parser.add_argument("--port", type=int, default=5002)
+    args = parser.parse_args()
+    asyncio.run(run(args.polls, args.uploads, args.fail_every, args.size_mb, args.port))
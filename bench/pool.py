@@ -0,0 +1,142 @@
+"""
+Насыщение пула соединений: API в одном процессе с разными DB_POOL_SIZE/DB_MAX_OVERFLOW и с
+DB_POOL_PRE_PING и без под нагрузкой --concurrency одновременных клиентов (больше, чем соединений).
+PostgreSQL подключается через прокси, добавляющий --rtt мс на каждый обмен, как у БД на другой машине:
+без этого на локальной БД соединение занято доли миллисекунды и упирается всё в CPU, а не в пул.
+Для каждой настройки — пропускная способность, p50/p99, число 503 (пул не выдал соединение
+за DB_POOL_TIMEOUT) и среднее число занятых соединений по /metrics.
+
+    python -m bench.pool --pools 2:0 5:5 10:10 --concurrency 100 --duration 15 --rtt 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import statistics
+import time
+from multiprocessing import Process
+
+import httpx
+
+from bench.workers import start_server, stop_server
+from db import DB_HOST, DB_PORT
+from migrate import migrate
+
+PROXY_PORT = 6543
+
+POOL_GAUGE = re.compile(r'db_pool_connections\{engine="async",state="checked_out"\} (\S+)')
+
+
+def requests_mix(rng):
+    # Только чтение из БД: /api/printers ждёт OctoPrint, /api/models отвечает из кэша
+    return rng.choice([
+        ("/api/slots", {"from": "0", "days": 7}),
+        ("/api/models/search", {"q": rng.choice(["gear", "holder", "case"])}),
+        ("/api/bookings", {"tg_user": rng.randint(1, 500)}),
+        ("/api/bookings/archive", {"tg_user": rng.randint(1, 500)}),
+    ])
+
+
+async def pipe(reader, writer, delay: float):
+    try:
+        while data := await reader.read(65536):
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def proxy(rtt: float):
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(DB_HOST, DB_PORT)
+        await asyncio.gather(
+            pipe(client_reader, server_writer, rtt / 2), pipe(server_reader, client_writer, rtt / 2)
+        )
+
+    server = await asyncio.start_server(handle, "127.0.0.1", PROXY_PORT)
+    await server.serve_forever()
+
+
+def run_proxy(rtt: float):
+    asyncio.run(proxy(rtt))
+
+
+async def sample_pool(c, deadline, samples):
+    while time.perf_counter() < deadline:
+        r = await c.get("/metrics")
+        m = POOL_GAUGE.search(r.text)
+        if m:
+            samples.append(float(m.group(1)))
+        await asyncio.sleep(0.25)
+
+
+async def load(port: int, duration: float, concurrency: int):
+    rng = random.Random(1)
+    latencies, rejected, errors, pool = [], 0, 0, []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as c:
+        async def worker():
+            nonlocal rejected, errors
+            while time.perf_counter() < deadline:
+                url, params = requests_mix(rng)
+                t0 = time.perf_counter()
+                try:
+                    r = await c.get(url, params=params)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if r.status_code == 503:
+                    rejected += 1
+                elif r.status_code != 200:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - t0)
+
+        await asyncio.gather(sample_pool(c, deadline, pool), *(worker() for _ in range(concurrency)))
+    return sorted(latencies), rejected, errors, pool
+
+
+def run_once(size: int, overflow: int, pre_ping: bool, args):
+    os.environ.update(
+        DB_HOST="127.0.0.1", DB_PORT=str(PROXY_PORT),
+        DB_POOL_SIZE=str(size), DB_MAX_OVERFLOW=str(overflow), DB_POOL_TIMEOUT=str(args.timeout),
+        DB_POOL_PRE_PING="1" if pre_ping else "0",
+    )
+    proc, _ = start_server(1, args.port)
+    try:
+        asyncio.run(load(args.port, 2, 8))
+        latencies, rejected, errors, pool = asyncio.run(load(args.port, args.duration, args.concurrency))
+    finally:
+        stop_server(proc)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    print(
+        f"pool {size}+{overflow}, pre_ping={'да' if pre_ping else 'нет'}: {len(latencies) / args.duration:.0f} req/s, "
+        f"p50 {statistics.median(latencies) * 1000 if latencies else 0:.1f} ms, p99 {p99 * 1000:.1f} ms, "
+        f"503: {rejected}, ошибок {errors}, занято соединений в среднем {statistics.mean(pool) if pool else 0:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", nargs="+", default=["2:0", "5:5", "10:10"], help="size:overflow")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--rtt", type=float, default=2, help="задержка до БД, мс")
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+    migrate()
+    proxy_proc = Process(target=run_proxy, args=(args.rtt / 1000,), daemon=True)
+    proxy_proc.start()
+    try:
+        for spec in args.pools:
+            size, overflow = (int(x) for x in spec.split(":"))
+            for pre_ping in (False, True):
+                run_once(size, overflow, pre_ping, args)
+    finally:
+        proxy_proc.terminate()
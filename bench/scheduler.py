@@ -0,0 +1,74 @@
+"""
+Планировщик печати против локального фейкового OctoPrint.
+Один принтер заметно медленнее остальных. Работа планировщика в том,
+чтобы он не тормозил очереди других принтеров и ни один принтер не простаивал.
+
+    DB_SQLITE=bench.db python -m bench.scheduler --printers 4 --jobs 40 --duration 0.5
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import uvicorn
+from sqlmodel import select
+
+from db import Printer, PrintJob, get_async_session
+from jobs import PrintScheduler
+from migrate import migrate
+from bench.fake_octoprint import FakeOctoPrint
+
+
+async def run(printers: int, jobs: int, duration: float, slow: float, port: int):
+    migrate()
+    durations = {"p1": duration * slow}
+    fake = FakeOctoPrint(duration, durations)
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    gcode = Path(tempfile.mkdtemp()) / "bench.gcode"
+    gcode.write_bytes(b"G28\n" * 10_000)
+    async with get_async_session() as s:
+        rows = [Printer(name=f"p{i}", octoprint_url=f"http://127.0.0.1:{port}/p{i}") for i in range(1, printers + 1)]
+        s.add_all(rows)
+        await s.commit()
+        ids = [p.id for p in rows]
+        for i in range(jobs):
+            s.add(PrintJob(printer_id=ids[i % printers], tg_user=1, file_path=str(gcode)))
+        await s.commit()
+
+    scheduler = PrintScheduler(poll_interval=duration / 20)
+    t0 = time.perf_counter()
+    await scheduler.start()
+    finish = {}
+    while len(finish) < printers:
+        async with get_async_session() as s:
+            left = (await s.exec(select(PrintJob.printer_id).where(PrintJob.status != "done"))).all()
+        for pid in ids:
+            if pid not in left and pid not in finish:
+                finish[pid] = time.perf_counter() - t0
+        await asyncio.sleep(duration / 20)
+    await scheduler.stop()
+    server.should_exit = True
+    await server_task
+
+    per_printer = jobs // printers
+    print(f"{printers} принтеров, {jobs} заданий по {duration}s (p1 в {slow:g} раз медленнее)")
+    for pid, name in zip(ids, (f"p{i}" for i in range(1, printers + 1))):
+        ideal = per_printer * durations.get(name, duration)
+        util = fake.busy_time[name] / finish[pid]
+        print(f"  {name}: очередь закрыта за {finish[pid]:6.2f}s (идеал {ideal:6.2f}s), загрузка {util:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--printers", type=int, default=4)
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=0.5)
+    parser.add_argument("--slow", type=float, default=4)
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+    asyncio.run(run(args.printers, args.jobs, args.duration, args.slow, args.port))
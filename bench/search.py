@@ -0,0 +1,100 @@
+"""
+Задержка поиска по библиотеке на синтетическом корпусе (по умолчанию 50 000 моделей
+с названиями, габаритами и временем печати): p50/p95/p99 для типичных запросов /api/models/search.
+
+    python -m bench.search --models 50000 --requests 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import func, insert, text
+from sqlmodel import select
+
+import main
+from db import ModelItem, async_engine
+from migrate import migrate
+
+SEED_CHUNK = 5000
+WORDS = [
+    "держатель", "кронштейн", "шестерня", "корпус", "крышка", "подставка", "фигурка", "ваза",
+    "органайзер", "крючок", "зажим", "адаптер", "втулка", "колесо", "рамка", "брелок",
+    "holder", "bracket", "gear", "case", "lid", "stand", "mount", "clip", "hook", "spool",
+]
+ADJECTIVES = ["малый", "большой", "угловой", "настенный", "складной", "усиленный", "mini", "pro", "v2", "v3"]
+
+QUERIES = [
+    ("слово", {"q": "шестерня"}),
+    ("префикс", {"q": "крон"}),
+    ("два слова", {"q": "держатель настенный"}),
+    ("латиница", {"q": "gear v2"}),
+    ("редкое", {"q": "брелок складной 42"}),
+    ("фильтр габаритов", {"max_x": 100, "max_y": 100, "max_z": 50}),
+    ("фильтр времени", {"min_time": 3600, "max_time": 7200}),
+    ("слово + фильтр", {"q": "корпус", "max_z": 80}),
+]
+
+
+async def seed(models: int):
+    async with async_engine.connect() as conn:
+        have = (await conn.execute(select(func.count()).select_from(ModelItem).where(ModelItem.filename.like("bench_%")))).scalar()
+    rng = random.Random(1)
+    base = datetime(2020, 1, 1)
+    t0 = time.perf_counter()
+    for start in range(have, models, SEED_CHUNK):
+        rows = []
+        for i in range(start, min(models, start + SEED_CHUNK)):
+            title = f"{rng.choice(WORDS).capitalize()} {rng.choice(ADJECTIVES)} {rng.randint(1, 300)}"
+            stl = rng.random() < 0.5
+            rows.append({
+                "title": title, "filename": f"bench_{i}.{'stl' if stl else 'gcode'}",
+                "uploaded_at": base + timedelta(minutes=i),
+                "size_x": round(rng.uniform(5, 250), 1) if stl else None,
+                "size_y": round(rng.uniform(5, 250), 1) if stl else None,
+                "size_z": round(rng.uniform(2, 250), 1) if stl else None,
+                "triangles": rng.randint(100, 2_000_000) if stl else None,
+                "print_time": None if stl else rng.randint(600, 48 * 3600),
+                "filament_g": None if stl else round(rng.uniform(1, 500), 1),
+            })
+        async with async_engine.begin() as conn:
+            await conn.execute(insert(ModelItem.__table__), rows)
+    if models > have:
+        async with async_engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("ANALYZE modelitem"))
+        print(f"засеяно {models - have} моделей за {time.perf_counter() - t0:.1f}s")
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(models: int, requests: int):
+    migrate()
+    await seed(models)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        print(f"{async_engine.dialect.name}, {models} моделей, {requests} запросов на вариант")
+        for name, params in QUERIES:
+            times = []
+            for _ in range(requests):
+                t0 = time.perf_counter()
+                r = await c.get("/api/models/search", params=params)
+                times.append((time.perf_counter() - t0) * 1000)
+                r.raise_for_status()
+            found = len(r.json())
+            print(f"  {name:18s} p50 {statistics.median(times):7.2f} ms  p95 {pct(times, 0.95):7.2f}  "
+                  f"p99 {pct(times, 0.99):7.2f}  найдено {found}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.models, args.requests))
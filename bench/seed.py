@@ -0,0 +1,148 @@
+"""
+Синтетические данные для нагрузочных прогонов: пользователи, брони (история --history-days дней
+и неделя вперёд, без пересечений на каждом принтере), модели библиотеки и заявки на модерацию.
+Цель — та же БД, что у приложения: DB_SQLITE=bench.db для SQLite, иначе PostgreSQL из DB_*.
+Повторный запуск сначала удаляет ранее засеянное (пользователи с tg_id от TG_BASE, файлы seed_*).
+
+    DB_SQLITE=bench.db python -m bench.seed --users 1000 --bookings 20000 --models 2000 --pending 100
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, text
+from sqlmodel import select
+
+from bench.search import ADJECTIVES, WORDS
+from db import Booking, BookingArchive, ModelItem, PendingModel, Printer, User, async_engine
+from migrate import migrate
+
+TG_BASE = 600_000
+TG_RANGE = 1_000_000
+# Синтетические брони — на своих принтерах, чтобы не пересекаться с настоящими
+PRINTER_BASE = 100
+FUTURE_DAYS = 7
+CHUNK = 5000
+
+
+async def reset():
+    async with async_engine.begin() as conn:
+        for table in (Booking, BookingArchive):
+            await conn.execute(delete(table).where(table.tg_user >= TG_BASE, table.tg_user < TG_BASE + TG_RANGE))
+        for model in (ModelItem, PendingModel):
+            await conn.execute(delete(model).where(model.filename.like("seed_%")))
+        await conn.execute(delete(User).where(User.tg_id >= TG_BASE, User.tg_id < TG_BASE + TG_RANGE))
+
+
+async def ensure_printers(ids):
+    """Принтеры, на которые бронирует прогон: брони на несуществующий принтер API отклоняет (404)."""
+    async with async_engine.begin() as conn:
+        have = set((await conn.execute(select(Printer.id).where(Printer.id.in_(ids)))).scalars())
+        missing = [i for i in ids if i not in have]
+        if not missing:
+            return
+        await conn.execute(insert(Printer), [{"id": i, "name": f"bench {i}", "enabled": True} for i in missing])
+        if conn.dialect.name == "postgresql":
+            # id заданы явно — последовательность сдвигается, чтобы новые принтеры не столкнулись с ними
+            await conn.execute(text("SELECT setval(pg_get_serial_sequence('printer', 'id'), (SELECT max(id) FROM printer))"))
+
+
+async def insert_chunks(table, rows):
+    for i in range(0, len(rows), CHUNK):
+        async with async_engine.begin() as conn:
+            await conn.execute(insert(table), rows[i:i + CHUNK])
+
+
+def booking_rows(user_ids, bookings: int, printers: int, history_days: int, rng):
+    """Брони подряд с промежутками на каждом принтере, от конца недели вперёд назад в историю."""
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    end = now + timedelta(days=FUTURE_DAYS)
+    per_printer = -(-bookings // printers)
+    # Средний шаг подбирается так, чтобы брони заняли окно истории и недели вперёд
+    step = max(1, (history_days + FUTURE_DAYS) * 24 // per_printer)
+    rows = []
+    for p in range(printers):
+        cursor = end
+        for _ in range(per_printer):
+            if len(rows) >= bookings:
+                break
+            hours = rng.choice((1, 1, 2, 3))
+            cursor -= timedelta(hours=hours + rng.randint(0, max(0, 2 * step - hours - 1)))
+            user = rng.randrange(len(user_ids))
+            if cursor >= now:
+                status = "active"
+            else:
+                status = "cancelled" if rng.random() < 0.15 else "completed"
+            rows.append({
+                "user_id": user_ids[user], "tg_user": TG_BASE + user, "printer_id": PRINTER_BASE + p,
+                "start_at": cursor, "end_at": cursor + timedelta(hours=hours),
+                "created_at": cursor - timedelta(days=rng.randint(0, 14)), "status": status,
+            })
+    return rows
+
+
+def model_rows(count: int, rng, pending: bool, users: int = 1):
+    base = datetime.utcnow() - timedelta(days=365)
+    rows = []
+    for i in range(count):
+        stl = rng.random() < 0.5
+        row = {
+            "title": f"{rng.choice(WORDS).capitalize()} {rng.choice(ADJECTIVES)} {rng.randint(1, 300)}",
+            "filename": f"seed_{'p' if pending else 'm'}{i}.{'stl' if stl else 'gcode'}",
+            "image": None,
+            "size_x": round(rng.uniform(5, 250), 1) if stl else None,
+            "size_y": round(rng.uniform(5, 250), 1) if stl else None,
+            "size_z": round(rng.uniform(2, 250), 1) if stl else None,
+            "print_time": None if stl else rng.randint(600, 48 * 3600),
+            "filament_g": None if stl else round(rng.uniform(1, 500), 1),
+        }
+        if pending:
+            row.update(submitter_tg=TG_BASE + rng.randrange(users), created_at=base + timedelta(minutes=i), moderated=False)
+        else:
+            row["uploaded_at"] = base + timedelta(minutes=i)
+        rows.append(row)
+    return rows
+
+
+async def seed(users: int = 1000, bookings: int = 20000, models: int = 2000, pending: int = 100,
+               printers: int = 5, history_days: int = 180, rng_seed: int = 1) -> dict:
+    """Засевает данные и возвращает их объёмы — для метаданных результатов прогона."""
+    rng = random.Random(rng_seed)
+    t0 = time.perf_counter()
+    await reset()
+    await insert_chunks(User, [
+        {"tg_id": TG_BASE + i, "username": f"user{i}", "first_name": f"Пользователь {i}"} for i in range(users)
+    ])
+    async with async_engine.connect() as conn:
+        user_ids = (await conn.execute(
+            select(User.id).where(User.tg_id >= TG_BASE, User.tg_id < TG_BASE + users).order_by(User.tg_id)
+        )).scalars().all()
+    await ensure_printers([PRINTER_BASE + p for p in range(printers)])
+    await insert_chunks(Booking, booking_rows(user_ids, bookings, printers, history_days, rng))
+    await insert_chunks(ModelItem, model_rows(models, rng, pending=False))
+    await insert_chunks(PendingModel, model_rows(pending, rng, pending=True, users=users))
+    async with async_engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            for table in ('"user"', "booking", "modelitem", "pendingmodel"):
+                await conn.execute(text(f"ANALYZE {table}"))
+    elapsed = time.perf_counter() - t0
+    print(f"засеяно за {elapsed:.1f}s: {users} пользователей, {bookings} броней, {models} моделей, {pending} заявок")
+    return {
+        "users": users, "bookings": bookings, "models": models, "pending": pending,
+        "printers": printers, "history_days": history_days, "seed_seconds": round(elapsed, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--models", type=int, default=2000)
+    parser.add_argument("--pending", type=int, default=100)
+    parser.add_argument("--printers", type=int, default=5)
+    parser.add_argument("--history-days", type=int, default=180)
+    args = parser.parse_args()
+    migrate()
+    asyncio.run(seed(args.users, args.bookings, args.models, args.pending, args.printers, args.history_days))
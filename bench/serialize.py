@@ -0,0 +1,128 @@
+"""
+Сериализация списков на --rows строк (брони и модели библиотеки из bench/seed.py): прежний путь —
+ORM-объекты, dict с isoformat() на строку и JSONResponse (stdlib json) — против кортежей нужных
+колонок и orjson в форматах json, columns и ndjson (serialize.py). Для каждого варианта — медианы
+времени выборки и кодирования по --repeat повторам и размер ответа, сырой и в gzip.
+
+    DB_SQLITE=bench.db python -m bench.serialize --rows 10000
+"""
+import argparse
+import asyncio
+import gzip
+import statistics
+import time
+
+from fastapi.responses import JSONResponse
+from sqlmodel import select
+
+import main
+from bench.seed import TG_BASE, reset, seed
+from db import Booking, ModelItem, async_engine, get_async_session
+from meta import META_FIELDS
+from migrate import migrate
+from serialize import encode_rows, query_fields
+from storage import blob_url
+from thumbnails import thumb_urls
+
+
+def bookings_query(rows: int):
+    return (
+        select(Booking.id, Booking.tg_user, Booking.start_at.label("start"), Booking.end_at.label("end"), Booking.status)
+        .where(Booking.tg_user >= TG_BASE)
+        .order_by(Booking.start_at)
+        .limit(rows)
+    )
+
+
+async def fetch(query):
+    async with get_async_session() as s:
+        return (await s.exec(query)).all()
+
+
+def bookings_old(rows: int):
+    query = select(Booking).where(Booking.tg_user >= TG_BASE).order_by(Booking.start_at).limit(rows)
+
+    def encode(items, format):
+        return JSONResponse([
+            {"id": b.id, "tg_user": b.tg_user, "start": b.start_at.isoformat(), "end": b.end_at.isoformat(),
+             "status": b.status}
+            for b in items
+        ]).body
+
+    return query, encode
+
+
+def bookings_new(rows: int):
+    query = bookings_query(rows)
+    fields = query_fields(query)
+    return query, lambda result, format: encode_rows(fields, result, format)
+
+
+def old_library_item(item: ModelItem):
+    """Карточка модели, как её собирал обработчик раньше: по атрибутам ORM-объекта."""
+    meta = {f: getattr(item, f) for f in META_FIELDS if getattr(item, f) is not None}
+    return {
+        "id": item.id,
+        "title": item.title,
+        "file": blob_url(item.file_hash, item.filename) if item.file_hash else f"/storage/models/{item.filename}",
+        "image": blob_url(item.image_hash, item.image) if item.image_hash else (
+            f"/storage/images/{item.image}" if item.image else None
+        ),
+        "thumbs": thumb_urls(item.thumb_hash),
+        "meta": meta or None,
+    }
+
+
+def models_old(rows: int):
+    query = select(ModelItem).order_by(ModelItem.uploaded_at.desc()).limit(rows)
+    return query, lambda items, format: JSONResponse([old_library_item(m) for m in items]).body
+
+
+def models_new(rows: int):
+    query = select(*main.model_columns(ModelItem)).order_by(ModelItem.uploaded_at.desc()).limit(rows)
+    return query, lambda result, format: encode_rows(
+        main.LIBRARY_FIELDS, [main.library_row(r) for r in result], format
+    )
+
+
+async def measure(variant, rows: int, format: str, repeat: int):
+    """Медианы выборки и кодирования, мс, и тело ответа."""
+    query, encode = variant(rows)
+    fetched, encoded = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = await fetch(query)
+        t1 = time.perf_counter()
+        body = encode(result, format)
+        encoded.append(time.perf_counter() - t1)
+        fetched.append(t1 - t0)
+    return statistics.median(fetched) * 1000, statistics.median(encoded) * 1000, body
+
+
+async def run(args):
+    await asyncio.to_thread(migrate)
+    await seed(users=1000, bookings=args.rows, models=args.rows, pending=0)
+    print(f"{async_engine.dialect.name}, {args.rows} строк, медиана из {args.repeat}")
+    for name, old, new in (("брони", bookings_old, bookings_new), ("модели", models_old, models_new)):
+        base = None
+        for label, variant, format in (
+            ("dict + json", old, "json"),
+            ("orjson json", new, "json"),
+            ("orjson columns", new, "columns"),
+            ("orjson ndjson", new, "ndjson"),
+        ):
+            fetch_ms, encode_ms, body = await measure(variant, args.rows, format, args.repeat)
+            base = base or encode_ms
+            print(f"  {name:<7} {label:<15} выборка {fetch_ms:>7.1f} ms, кодирование {encode_ms:>7.1f} ms "
+                  f"(x{base / encode_ms:.1f})  {len(body) / 1024:>6.0f} KiB, gzip {len(gzip.compress(body, 6)) / 1024:>5.0f} KiB")
+    if not args.keep:
+        await reset()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="не удалять засеянные данные")
+    args = parser.parse_args()
+    asyncio.run(run(args))
@@ -0,0 +1,84 @@
+"""
+Бенчмарк расчёта слотов на большой истории броней.
+Сравнивает прежний подход (все активные брони + фильтр в Python) с load_days.
+
+    DB_SQLITE=bench.db python -m bench.slots --bookings 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, time as dtime
+
+from sqlalchemy import insert
+from sqlmodel import select
+
+from db import Booking, User, get_async_session, get_session
+from migrate import migrate
+from slots import load_days
+
+
+def seed(count: int):
+    migrate()
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    with get_session() as s:
+        user = User(tg_id=1, username="bench")
+        s.add(user)
+        s.commit()
+        s.refresh(user)
+        rows = []
+        for i in range(count):
+            # история за ~3 года назад и немного будущих броней
+            start = today - timedelta(days=random.randint(-14, 1100), hours=-random.randint(9, 20))
+            rows.append({
+                "user_id": user.id,
+                "tg_user": 1,
+                "start_at": start,
+                "end_at": start + timedelta(hours=1),
+                "created_at": start,
+                "status": random.choice(("active", "active", "cancelled")),
+            })
+        s.execute(insert(Booking), rows)
+        s.commit()
+
+
+async def old_slots(day):
+    async with get_async_session() as s:
+        bookings = (await s.exec(select(Booking).where(Booking.status == "active"))).all()
+    bookings_today = [b for b in bookings if b.start_at.date() == day]
+    slots = []
+    for hour in range(9, 21):
+        start = datetime.combine(day, dtime(hour=hour))
+        slots.append(any(b.start_at <= start < b.end_at for b in bookings_today))
+    return slots
+
+
+async def new_slots(day, days):
+    async with get_async_session() as s:
+        return await load_days(s, day, days)
+
+
+async def timeit(label, fn, repeat):
+    await fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    print(f"  {label:<28} {(time.perf_counter() - t0) / repeat * 1000:8.2f} ms")
+
+
+async def run(repeat: int):
+    day = datetime.utcnow().date() + timedelta(days=1)
+    await timeit("full scan, 1 день", lambda: old_slots(day), repeat)
+    await timeit("load_days, 1 день", lambda: new_slots(day, 1), repeat)
+    await timeit("load_days, 7 дней", lambda: new_slots(day, 7), repeat)
+    await timeit("full scan x7, 7 дней", lambda: asyncio.gather(*(old_slots(day + timedelta(days=d)) for d in range(7))), max(1, repeat // 7))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    seed(args.bookings)
+    print(f"{args.bookings} броней в истории:")
+    asyncio.run(run(args.repeat))
@@ -0,0 +1,102 @@
+"""
+Пропускная способность генерации превью: N фотографий (JPEG 4000x3000) и M бинарных STL
+(тор на ~100k треугольников) через ThumbnailPool при разном числе процессов. Параллельно
+меряется задержка event loop — пул не должен его блокировать.
+
+    python -m bench.thumbnails --images 40 --stl 10 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+import thumbnails as th
+from storage import blob_path
+
+
+def torus_stl(segments: int = 224, tag: int = 0) -> bytes:
+    """Бинарный STL тора: segments^2 * 2 треугольников; tag в поле attr делает sha256 уникальным."""
+    u, v = np.meshgrid(np.linspace(0, 2 * np.pi, segments + 1), np.linspace(0, 2 * np.pi, segments + 1))
+    x = (30 + 10 * np.cos(v)) * np.cos(u)
+    y = (30 + 10 * np.cos(v)) * np.sin(u)
+    z = 10 * np.sin(v)
+    p = np.stack([x, y, z], axis=-1)
+    a, b, c, d = p[:-1, :-1], p[1:, :-1], p[1:, 1:], p[:-1, 1:]
+    tris = np.concatenate([np.stack([a, b, c], axis=-2), np.stack([a, c, d], axis=-2)]).reshape(-1, 3, 3)
+    rec = np.zeros(len(tris), dtype=th.STL_DTYPE)
+    rec["v"] = tris
+    rec["attr"][0] = tag
+    return b"\0" * 80 + len(tris).to_bytes(4, "little") + rec.tobytes()
+
+
+def photo_jpeg(seed: int, size=(4000, 3000)) -> bytes:
+    rng = np.random.default_rng(seed)
+    h, w = size[1], size[0]
+    gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 25, (h // 8, w // 8, 3)).repeat(8, 0).repeat(8, 1)
+    pixels = np.clip(gradient * [1.0, 0.6, 0.3] + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def put_blob(data: bytes) -> str:
+    sha = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return sha
+
+
+async def loop_lag(stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - t0 - 0.01)
+
+
+async def run_once(jobs, workers: int):
+    for _, sha in jobs:
+        for size in th.THUMB_SIZES:
+            th.thumb_path(sha, size).unlink(missing_ok=True)
+    pool = th.ThumbnailPool(workers)
+    # Прогрев: процессы spawn стартуют не мгновенно, это не часть пропускной способности
+    await asyncio.gather(*(asyncio.wrap_future(pool._executor().submit(int, 0)) for _ in range(workers)))
+    stop, lag = asyncio.Event(), []
+    probe = asyncio.create_task(loop_lag(stop, lag))
+    t0 = time.perf_counter()
+    ok = await asyncio.gather(*(pool.build(kind, sha) for kind, sha in jobs))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    pool.shutdown()
+    print(f"workers={workers}: {len(jobs)} исходников за {elapsed:.2f}s = {len(jobs) / elapsed:.1f}/s, "
+          f"ошибок {ok.count(False)}, задержка loop max {max(lag) * 1000:.1f} ms")
+
+
+async def main(images: int, stl: int, workers: list):
+    t0 = time.perf_counter()
+    jobs = [("image", put_blob(photo_jpeg(i))) for i in range(images)]
+    jobs += [("stl", put_blob(torus_stl(tag=i))) for i in range(stl)]
+    print(f"подготовлено {images} фото и {stl} STL за {time.perf_counter() - t0:.1f}s")
+    try:
+        for w in workers:
+            await run_once(jobs, w)
+    finally:
+        for _, sha in jobs:
+            blob_path(sha).unlink(missing_ok=True)
+            for size in th.THUMB_SIZES:
+                th.thumb_path(sha, size).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--stl", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    asyncio.run(main(args.images, args.stl, args.workers))
@@ -0,0 +1,104 @@
+"""
+Память при параллельных загрузках моделей: N одновременных запросов
+к /api/submit_model с файлом SIZE МБ. Пиковый RSS должен оставаться плоским,
+а не расти на N * SIZE.
+
+    DB_SQLITE=bench.db python -m bench.uploads --parallel 20 --size-mb 500
+
+Нужно ~2 * N * SIZE свободного места на диске (multipart-спул + итоговые файлы).
+Последним идёт запрос больше лимита: он должен получить 413, не передав тело.
+"""
+import argparse
+import asyncio
+import io
+import os
+import resource
+import tempfile
+import time
+
+import httpx
+
+import main
+from migrate import migrate
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def sample_rss(stop: asyncio.Event, out: list):
+    while not stop.is_set():
+        out.append(rss_mb())
+        await asyncio.sleep(0.1)
+
+
+async def upload(c: httpx.AsyncClient, path: str, i: int):
+    with open(path, "rb") as f:
+        r = await c.post(
+            "/api/submit_model",
+            data={"title": f"bench {i}", "tg_user": "1"},
+            files={"file": (f"bench_{i}.stl", f, "application/octet-stream")},
+            timeout=None,
+        )
+    r.raise_for_status()
+
+
+class CountingFile(io.FileIO):
+    """Файл, который считает, сколько из него прочитал клиент, — столько тела ушло серверу."""
+    consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+
+async def oversized(c: httpx.AsyncClient, directory: str):
+    """Загрузка больше main.UPLOAD_LIMIT: 413 должен прийти до того, как тело принято и записано на диск."""
+    with tempfile.NamedTemporaryFile(suffix=".stl", dir=directory) as src:
+        src.truncate(main.UPLOAD_LIMIT + 2**20)
+        with CountingFile(src.name) as f:
+            t0 = time.perf_counter()
+            r = await c.post(
+                "/api/submit_model",
+                data={"title": "bench oversized", "tg_user": "1"},
+                files={"file": ("bench_oversized.stl", f, "application/octet-stream")},
+                timeout=None,
+            )
+            elapsed = time.perf_counter() - t0
+    print(f"  больше лимита ({main.UPLOAD_LIMIT / 2**20:.0f} МБ): HTTP {r.status_code} за {elapsed * 1000:.0f} ms, "
+          f"передано {f.consumed / 2**20:.1f} МБ тела")
+
+
+async def run(parallel: int, size_mb: int):
+    migrate()
+    main.ensure_dirs()
+    with tempfile.NamedTemporaryFile(suffix=".stl") as src:
+        src.truncate(size_mb * 2**20)
+        samples = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(stop, samples))
+        base = rss_mb()
+        transport = httpx.ASGITransport(app=main.app)
+        t0 = time.perf_counter()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+            await asyncio.gather(*(upload(c, src.name, i) for i in range(parallel)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await sampler
+
+    total = parallel * size_mb
+    print(f"{parallel} x {size_mb} МБ = {total} МБ за {elapsed:.1f}s ({total / elapsed:.0f} МБ/s)")
+    print(f"  RSS: старт {base:.0f} МБ, пик {max(samples):.0f} МБ (+{max(samples) - base:.0f} МБ)")
+    print(f"  ru_maxrss: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as c:
+        await oversized(c, os.path.dirname(src.name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parallel", type=int, default=20)
+    parser.add_argument("--size-mb", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.parallel, args.size_mb))
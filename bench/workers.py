@@ -0,0 +1,129 @@
+"""
+Один процесс API против нескольких: для каждого числа воркеров запускает python main.py
+с WEB_CONCURRENCY=N, меряет время до готовности всех воркеров (до «Application startup complete»
+у каждого) и пропускную способность на смеси запросов мини-приложения (слоты, библиотека, брони)
+от --clients процессов-генераторов нагрузки.
+
+    python -m bench.workers --workers 1 2 4 --duration 15 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import httpx
+
+from migrate import migrate
+
+ROOT = Path(__file__).resolve().parent.parent
+READY_LINE = "Application startup complete"
+
+
+def start_server(workers: int, port: int):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port), HOST="127.0.0.1", LOG_LEVEL="WARNING")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    ready = threading.Event()
+
+    def watch():
+        count = 0
+        for line in proc.stderr:
+            if READY_LINE in line:
+                count += 1
+                if count == workers:
+                    ready.set()
+        ready.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    ready.wait(120)
+    if proc.poll() is not None:
+        raise RuntimeError(f"сервер с {workers} воркерами не запустился")
+    return proc, time.perf_counter() - t0
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def requests_mix(rng):
+    return rng.choice([
+        ("/api/slots", {"from": "0", "days": 7}),
+        ("/api/models", {}),
+        ("/api/bookings", {"tg_user": rng.randint(1, 500)}),
+        ("/api/printers", {}),
+    ])
+
+
+async def load(port: int, duration: float, concurrency: int, seed: int):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as c:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                url, params = requests_mix(rng)
+                t0 = time.perf_counter()
+                try:
+                    r = await c.get(url, params=params)
+                    r.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - t0)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def load_process(port: int, duration: float, concurrency: int, seed: int):
+    return asyncio.run(load(port, duration, concurrency, seed))
+
+
+def run_once(workers: int, port: int, duration: float, concurrency: int, clients: int):
+    proc, startup = start_server(workers, port)
+    try:
+        # Прогрев: соединения с БД и кэш библиотеки в каждом воркере
+        load_process(port, 2, concurrency, 0)
+        with ProcessPoolExecutor(clients) as pool:
+            parts = list(pool.map(
+                load_process, [port] * clients, [duration] * clients,
+                [max(1, concurrency // clients)] * clients, range(1, clients + 1),
+            ))
+    finally:
+        stop_server(proc)
+    latencies = sorted(x for lat, _ in parts for x in lat)
+    errors = sum(e for _, e in parts)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    print(f"workers={workers}: старт {startup:.1f}s, {len(latencies) / duration:.0f} req/s, "
+          f"p50 {statistics.median(latencies) * 1000 if latencies else 0:.1f} ms, p99 {p99 * 1000:.1f} ms, ошибок {errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+    migrate()
+    print(f"CPU: {os.cpu_count()}")
+    for n in args.workers:
+        run_once(n, args.port, args.duration, args.concurrency, args.clients)
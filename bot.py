@@ -0,0 +1,85 @@
+"""
+Telegram-бот мини-приложения. Работает отдельно от API, чтобы API можно было запускать
+в несколько процессов без нескольких одновременных long polling:
+
+    python bot.py                                   # long polling, один процесс
+    python bot.py --set-webhook https://example.com # BOT_MODE=webhook: апдейты принимает API
+    python bot.py --delete-webhook                  # вернуться к polling
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.filters import Command
+from aiogram.types import WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
+
+from auth import BOT_TOKEN
+
+logger = logging.getLogger("Bot")
+logger.setLevel(logging.INFO)
+
+WEBAPP_URL = os.getenv("WEBAPP_URL", "")
+# В режиме вебхука (BOT_MODE=webhook у API) Telegram шлёт апдейты в API на WEBHOOK_PATH
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+dp: Dispatcher = Dispatcher()
+
+
+@dp.message(Command("start"))
+async def cmd_start(message: types.Message):
+    if WEBAPP_URL:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Открыть приложение", web_app=WebAppInfo(url=WEBAPP_URL))]])
+        await message.answer("Открой мини-приложение:", reply_markup=keyboard)
+    else:
+        await message.answer("WEBAPP_URL не задан на сервере")
+
+
+def create_bot() -> Bot:
+    return Bot(token=BOT_TOKEN)
+
+
+async def run_polling():
+    bot = create_bot()
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
+    finally:
+        await bot.session.close()
+
+
+async def set_webhook(base_url: str):
+    bot = create_bot()
+    try:
+        await bot.set_webhook(
+            base_url.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            drop_pending_updates=True,
+        )
+        logger.info("Webhook set to %s%s", base_url.rstrip("/"), WEBHOOK_PATH)
+    finally:
+        await bot.session.close()
+
+
+async def delete_webhook():
+    bot = create_bot()
+    try:
+        await bot.delete_webhook()
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--set-webhook", metavar="BASE_URL")
+    parser.add_argument("--delete-webhook", action="store_true")
+    args = parser.parse_args()
+    if args.set_webhook:
+        asyncio.run(set_webhook(args.set_webhook))
+    elif args.delete_webhook:
+        asyncio.run(delete_webhook())
+    else:
+        asyncio.run(run_polling())
@@ -0,0 +1,64 @@
+import os
+import time
+from collections import OrderedDict
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+class MemoryCache:
+    """Кэш в памяти процесса с TTL и ограничением по числу записей. Интерфейс как у RedisCache."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    async def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires and expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float = None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        await self.set(key, value)
+        return value
+
+
+class RedisCache:
+    """
+    Тот же интерфейс поверх redis.asyncio (или любого совместимого клиента, например fakeredis).
+    Нужен, когда API запущено в несколько процессов и инвалидация должна быть общей.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str):
+        return await self.client.get(key)
+
+    async def set(self, key: str, value, ttl: float = None):
+        await self.client.set(key, value, ex=int(ttl) if ttl else None)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+
+def make_cache():
+    if REDIS_URL:
+        import redis.asyncio as redis
+        return RedisCache(redis.from_url(REDIS_URL))
+    return MemoryCache()
+
+
+cache = make_cache()
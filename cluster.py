@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import uuid
+
+from db import DATABASE_URL, DB_SQLITE, libpq_dsn
+
+logger = logging.getLogger("Cluster")
+logger.setLevel(logging.INFO)
+
+LEADER_LOCK = 7_310_002
+LEADER_RETRY = 5.0
+NOTIFY_LIMIT = 7900  # NOTIFY принимает до 8000 байт
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class Cluster:
+    """
+    Согласование нескольких процессов API (uvicorn --workers, gunicorn) через PostgreSQL.
+    У каждого процесса одно выделенное соединение asyncpg:
+    - лидер держит на нём advisory lock и один на всех запускает фоновые службы (очередь печати,
+      обслуживание броней); остальные раз в LEADER_RETRY секунд пробуют перехватить блокировку,
+      так что при падении лидера службы поднимутся в другом процессе;
+    - LISTEN/NOTIFY разносит события между процессами (SSE-подписчики сидят в разных воркерах).
+    С SQLite процесс один: он сразу лидер, а notify() никуда не отправляет.
+    """
+
+    def __init__(self, dsn: str = None, retry: float = LEADER_RETRY):
+        self.dsn = dsn
+        self.retry = retry
+        self.origin = uuid.uuid4().hex[:12]
+        self.is_leader = False
+        self._listeners = {}
+        self._services = []
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._outbox = None
+        self._tasks = []
+
+    def listen(self, channel: str, callback):
+        """callback(payload: str) — только для сообщений из других процессов."""
+        self._listeners[channel] = callback
+
+    def lead(self, start, stop):
+        """Служба, которая работает только в процессе-лидере: async start() / async stop()."""
+        self._services.append((start, stop))
+
+    def notify(self, channel: str, payload: str):
+        if self._outbox is None:
+            return
+        message = f"{self.origin}:{payload}"
+        if len(message.encode()) > NOTIFY_LIMIT:
+            logger.warning("Notify on %s dropped: %d bytes", channel, len(message))
+            return
+        self._outbox.put_nowait((channel, message))
+
+    async def start(self):
+        if not self.dsn:
+            if WEB_CONCURRENCY > 1:
+                logger.warning("SQLite и %d воркеров: фоновые службы запустятся в каждом процессе", WEB_CONCURRENCY)
+            await self._become_leader()
+            return
+        self._outbox = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._supervise()), asyncio.create_task(self._send())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._step_down()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _become_leader(self):
+        self.is_leader = True
+        logger.info("Process %s is the leader", self.origin)
+        for start, _ in self._services:
+            await start()
+
+    async def _step_down(self):
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        for _, stop in reversed(self._services):
+            try:
+                await stop()
+            except Exception:
+                logger.exception("Service stop failed")
+
+    def _on_notify(self, conn, pid, channel, message):
+        origin, _, payload = message.partition(":")
+        callback = self._listeners.get(channel)
+        if callback is None or origin == self.origin:
+            return
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Listener for %s failed", channel)
+
+    async def _connect(self):
+        import asyncpg
+        self._conn = await asyncpg.connect(self.dsn)
+        for channel in self._listeners:
+            await self._conn.add_listener(channel, self._on_notify)
+
+    async def _supervise(self):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    await self._step_down()
+                    await self._connect()
+                async with self._lock:
+                    if self.is_leader:
+                        await self._conn.fetchval("SELECT 1")
+                    elif await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", LEADER_LOCK):
+                        await self._become_leader()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Соединение потеряно — вместе с ним и блокировка: службы останавливаются
+                logger.warning("Cluster connection failed: %s", e)
+                await self._step_down()
+                if self._conn is not None:
+                    self._conn.terminate()
+                    self._conn = None
+            await asyncio.sleep(self.retry)
+
+    async def _send(self):
+        while True:
+            channel, message = await self._outbox.get()
+            if self._conn is None or self._conn.is_closed():
+                continue
+            try:
+                async with self._lock:
+                    await self._conn.execute("SELECT pg_notify($1, $2)", channel, message)
+            except Exception as e:
+                logger.warning("Notify on %s failed: %s", channel, e)
+
+
+cluster = Cluster(None if DB_SQLITE else libpq_dsn(DATABASE_URL))
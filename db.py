@@ -1,17 +1,84 @@
-from datetime import datetime
+import os
+from datetime import date, datetime
 from typing import Optional
 from sqlmodel import SQLModel, Field, create_engine, Session, select
-from sqlalchemy import BigInteger, Column
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import URL, BigInteger, Column, Index, String, event, make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
-DB_HOST = "localhost"
-DB_PORT = 5432
-DB_USER = "postgres"
-DB_PASS = "Oleg1101"
-DB_NAME = "printerdb"
+# Подключение: DATABASE_URL целиком или по частям DB_HOST/DB_PORT/DB_USER/DB_PASS/DB_NAME
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "")
+DB_NAME = os.getenv("DB_NAME", "printerdb")
+# Реплика только для чтения: поиск, слоты, архив и выгрузка броней. Без неё всё идёт в основную БД
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Пул на процесс: при WEB_CONCURRENCY воркерах к БД до WEB_CONCURRENCY * (size + overflow) соединений.
+# Ожидание свободного соединения дольше DB_POOL_TIMEOUT — 503 (см. main.py), а не очередь без конца.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Проверка соединения перед каждой выдачей из пула — лишний round trip на запрос. Без неё оборванное
+# соединение даёт одну ошибку, после которой SQLAlchemy сбрасывает весь пул; старые закрывает recycle.
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
 
-engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
+# Для локальной проверки без PostgreSQL: DB_SQLITE=printer.db
+DB_SQLITE = os.getenv("DB_SQLITE")
+
+if DB_SQLITE:
+    DATABASE_URL = f"sqlite:///{DB_SQLITE}"
+    DATABASE_REPLICA_URL = None
+else:
+    DATABASE_URL = os.getenv("DATABASE_URL") or str(URL.create(
+        "postgresql", DB_USER, DB_PASS or None, DB_HOST, DB_PORT, DB_NAME
+    ).render_as_string(hide_password=False))
+
+
+def async_url(url: str) -> str:
+    url = make_url(url)
+    driver = "sqlite+aiosqlite" if url.get_backend_name() == "sqlite" else "postgresql+asyncpg"
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def libpq_dsn(url: str) -> str:
+    """DSN без указания драйвера — для прямого asyncpg.connect (cluster.py)."""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+ASYNC_DATABASE_URL = async_url(DATABASE_URL)
+# Синхронный engine нужен только migrate.py и bench: соединения не держит
+engine = create_engine(DATABASE_URL, echo=False, poolclass=NullPool)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **pool_options())
+async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+if DATABASE_REPLICA_URL:
+    read_engine = create_async_engine(async_url(DATABASE_REPLICA_URL), echo=False, **pool_options())
+    read_session_factory = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+else:
+    read_engine = async_engine
+    read_session_factory = async_session_factory
+
+
+def _sqlite_functions(dbapi_conn, _):
+    # lower() в SQLite понимает только ASCII; для поиска по кириллице (search.py) нужен свой
+    dbapi_conn.create_function("unicode_lower", 1, lambda v: v.lower() if v else v, deterministic=True)
+
+if DB_SQLITE:
+    event.listen(engine, "connect", _sqlite_functions)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_functions)
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -23,14 +90,35 @@ class User(SQLModel, table=True):
     nickname: Optional[str] = None
 
 
-class ModelItem(SQLModel, table=True):
+class ModelMeta(SQLModel):
+    """Что известно о файле модели после разбора (см. meta.py): габариты в мм, объём в мм³, время в секундах."""
+    size_x: Optional[float] = None
+    size_y: Optional[float] = None
+    size_z: Optional[float] = None
+    triangles: Optional[int] = None
+    volume: Optional[float] = None
+    print_time: Optional[int] = None
+    filament_mm: Optional[float] = None
+    filament_g: Optional[float] = None
+
+
+class ModelItem(ModelMeta, table=True):
+    __table_args__ = (
+        Index("ix_modelitem_uploaded_id", "uploaded_at", "id"),
+        Index("ix_modelitem_print_time", "print_time"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     filename: str
     image: Optional[str] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
+    file_hash: Optional[str] = Field(default=None, index=True)
+    file_size: Optional[int] = None
+    image_hash: Optional[str] = None
+    thumb_hash: Optional[str] = None
 
-class PendingModel(SQLModel, table=True):
+class PendingModel(ModelMeta, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     submitter_tg: Optional[int]
     title: str
@@ -38,18 +126,194 @@ class PendingModel(SQLModel, table=True):
     image: Optional[str]
     created_at: datetime = Field(default_factory=datetime.utcnow)
     moderated: bool = False
+    file_hash: Optional[str] = Field(default=None, index=True)
+    file_size: Optional[int] = None
+    image_hash: Optional[str] = None
+    thumb_hash: Optional[str] = None
 
 class Booking(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_booking_status_start_end", "status", "start_at", "end_at"),
+        Index("ix_booking_tg_user_start", "tg_user", "start_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     tg_user: int = Field(sa_column=Column(BigInteger))
+    printer_id: int = Field(default=1, index=True)
     start_at: datetime
     end_at: datetime
     created_at: datetime = Field(default_factory=datetime.utcnow)
     status: str = Field(default="active")
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+class BookingArchive(SQLModel, table=True):
+    """
+    Завершённые и отменённые брони старше ARCHIVE_AFTER (см. lifecycle.py) — переносятся сюда
+    из Booking, чтобы рабочая таблица оставалась маленькой. В PostgreSQL таблица секционирована
+    по месяцам start_at, поэтому первичный ключ включает start_at; id сохраняется из Booking.
+    """
+    __table_args__ = (
+        Index("ix_bookingarchive_tg_user_start", "tg_user", "start_at"),
+        {"postgresql_partition_by": "RANGE (start_at)"},
+    )
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    start_at: datetime = Field(primary_key=True)
+    user_id: Optional[int] = None
+    tg_user: int = Field(sa_column=Column(BigInteger))
+    printer_id: int = 1
+    end_at: datetime
+    created_at: datetime
+    status: str
+
+# Пересечение активных броней одного принтера запрещено на уровне БД, без SELECT перед INSERT.
+# PostgreSQL: диапазон during и GiST exclusion constraint; SQLite (локально): триггер,
+# который выполняется под единственной блокировкой записи. Нарушение в обоих случаях —
+# IntegrityError с именем booking_no_overlap в тексте.
+# Время в таблице хранится как UTC без зоны, поэтому диапазон — tsrange, а не tstzrange.
+# Равенство принтера выражено через int4range: так хватает встроенного GiST range_ops
+# и не нужно расширение btree_gist (его нет у многих хостингов PostgreSQL).
+BOOKING_OVERLAP_CONSTRAINT = "booking_no_overlap"
+
+BOOKING_OVERLAP_DDL = {
+    "postgresql": [
+        "ALTER TABLE booking ADD COLUMN IF NOT EXISTS during tsrange "
+        "GENERATED ALWAYS AS (tsrange(start_at, end_at, '[)')) STORED",
+        """
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'booking_no_overlap') THEN
+                ALTER TABLE booking ADD CONSTRAINT booking_no_overlap
+                    EXCLUDE USING gist (int4range(printer_id, printer_id, '[]') WITH =, during WITH &&)
+                    WHERE (status = 'active');
+            END IF;
+        END $$
+        """,
+    ],
+    "sqlite": [
+        """
+        CREATE TRIGGER IF NOT EXISTS booking_no_overlap
+        BEFORE INSERT ON booking
+        WHEN NEW.status = 'active' AND EXISTS (
+            SELECT 1 FROM booking
+            WHERE printer_id = NEW.printer_id AND status = 'active'
+              AND start_at < NEW.end_at AND end_at > NEW.start_at
+        )
+        BEGIN
+            SELECT RAISE(ABORT, 'booking_no_overlap');
+        END
+        """,
+    ],
+}
+
+
+def ensure_booking_constraints(conn):
+    for statement in BOOKING_OVERLAP_DDL.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+class Printer(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    # Без адреса принтер работает в режиме симуляции (см. octoprint.send_to_printer)
+    octoprint_url: Optional[str] = None
+    api_key: Optional[str] = None
+    enabled: bool = True
+
+class PrintJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    printer_id: int = Field(foreign_key="printer.id", index=True)
+    booking_id: Optional[int] = Field(default=None, foreign_key="booking.id")
+    tg_user: int = Field(sa_column=Column(BigInteger))
+    file_path: str
+    # queued -> sending -> printing -> done | failed
+    status: str = Field(default="queued", index=True)
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+event.listen(Booking.__table__, "after_create", lambda target, conn, **kw: ensure_booking_constraints(conn))
+
+# Поиск по библиотеке. PostgreSQL: tsvector по названию и имени файла (GIN) и, если доступно
+# расширение pg_trgm, триграммный индекс для поиска по подстроке; без него ILIKE идёт перебором.
+# SQLite (локально) ищет только LIKE.
+MODEL_SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE modelitem ADD COLUMN IF NOT EXISTS search tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(filename, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_modelitem_search ON modelitem USING gin (search)",
+        """
+        DO $$ BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS ix_modelitem_title_trgm ON modelitem USING gin (title gin_trgm_ops);
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'pg_trgm недоступен, поиск по подстроке без индекса';
+        END $$
+        """,
+    ],
+}
+
+
+def ensure_model_search(conn):
+    for statement in MODEL_SEARCH_DDL.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+event.listen(ModelItem.__table__, "after_create", lambda target, conn, **kw: ensure_model_search(conn))
+
+class Notification(SQLModel, table=True):
+    """
+    Исходящее сообщение в Telegram (см. notify.py). Пишется в той же транзакции, что и изменение,
+    о котором сообщает, и лежит в БД до отправки — очередь переживает перезапуск.
+    """
+    __table_args__ = (Index("ix_notification_status_send_after", "status", "send_after"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chat_id: int = Field(sa_column=Column(BigInteger, nullable=False))
+    text: str
+    # Ключ от повторов: одно напоминание на бронь, сколько бы раз планировщик её ни увидел
+    key: Optional[str] = Field(default=None, sa_column=Column(String, unique=True))
+    status: str = Field(default="pending")  # pending, sent, failed
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    send_after: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
+
+class UsageDaily(SQLModel, table=True):
+    """
+    Сводка загрузки принтера (см. analytics.py): минуты броней, пришедшиеся на час hour дня day.
+    Обновляется в транзакции брони; при отмене минуты переходят из booked_min в cancelled_min.
+    """
+    day: date = Field(primary_key=True)
+    printer_id: int = Field(primary_key=True)
+    hour: int = Field(primary_key=True)
+    booked_min: int = 0
+    cancelled_min: int = 0
+
+class UserDaily(SQLModel, table=True):
+    """Брони пользователя по дню начала: создано, из них отменено, минуты неотменённых и брони с печатью."""
+    day: date = Field(primary_key=True)
+    tg_user: int = Field(sa_column=Column(BigInteger, primary_key=True))
+    bookings: int = 0
+    cancelled: int = 0
+    minutes: int = 0
+    printed: int = 0
+
+class SchemaVersion(SQLModel, table=True):
+    """Версия схемы, до которой БД доведена migrate.py; одна строка с id=1."""
+    id: int = Field(default=1, primary_key=True)
+    version: int
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
 
 def get_session():
     return Session(engine)
+
+def get_async_session():
+    return async_session_factory()
+
+async def read_db_session():
+    """
+    Зависимость FastAPI для GET-списков: сессия на реплике, если она задана, закрывается и при исключении.
+    Данные могут отставать на доли секунды — не для проверок перед записью.
+    """
+    async with read_session_factory() as session:
+        yield session
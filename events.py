@@ -0,0 +1,91 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+QUEUE_SIZE = 64
+HEARTBEAT_SEC = 15
+
+# Отправляется клиенту, который не успевал читать поток: накопленные события
+# выброшены, и ему проще один раз перечитать состояние целиком.
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+def sse_frame(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+        self.dropped = 0
+
+    def push(self, frame: str):
+        if self.overflowed:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self) -> str:
+        frame = await self.queue.get()
+        if frame is RESYNC:
+            self.overflowed = False
+        return frame
+
+
+class EventBroker:
+    """
+    Внутрипроцессная шина событий для живых обновлений мини-приложения.
+    publish() не ждёт подписчиков: у каждого соединения своя ограниченная очередь,
+    медленный клиент получает resync вместо того, чтобы тормозить остальных.
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        # relay(frame) пересылает событие другим процессам API (см. cluster.py)
+        self.relay = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data: dict):
+        frame = sse_frame(event_type, data)
+        self.deliver(frame)
+        if self.relay is not None:
+            self.relay(frame)
+
+    def deliver(self, frame: str):
+        for sub in self._subscribers:
+            sub.push(frame)
+
+    @asynccontextmanager
+    async def subscribe(self):
+        sub = Subscription(self.queue_size)
+        self._subscribers.add(sub)
+        try:
+            yield sub
+        finally:
+            self._subscribers.discard(sub)
+
+    async def stream(self, request):
+        async with self.subscribe() as sub:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.get(), HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    frame = ": ping\n\n"
+                if await request.is_disconnected():
+                    break
+                yield frame
+
+
+broker = EventBroker()
@@ -0,0 +1,122 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+from openpyxl import Workbook
+from sqlmodel import select
+
+from db import User, read_engine
+from lifecycle import booking_history
+
+BATCH_ROWS = 2000
+FILE_CHUNK = 256 * 1024
+
+EXPORT_COLUMNS = [
+    ("id", "ID брони"),
+    ("printer_id", "Принтер"),
+    ("tg_user", "Telegram ID"),
+    ("username", "Username"),
+    ("first_name", "Имя"),
+    ("nickname", "Ник"),
+    ("start_at", "Начало"),
+    ("end_at", "Конец"),
+    ("hours", "Часов"),
+    ("status", "Статус"),
+    ("created_at", "Создана"),
+]
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def export_query(date_from: date = None, date_to: date = None, printer_id: int = None, status: str = None):
+    """Брони (вместе с архивом) с пользователями; date_to включительно, фильтр по дате начала брони."""
+    b = booking_history().c
+    q = (
+        select(
+            b.id, b.printer_id, b.tg_user,
+            User.username, User.first_name, User.nickname,
+            b.start_at, b.end_at, b.status, b.created_at,
+        )
+        .join(User, User.id == b.user_id, isouter=True)
+    )
+    if date_from:
+        q = q.where(b.start_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        q = q.where(b.start_at < datetime.combine(date_to + timedelta(days=1), time.min))
+    if printer_id is not None:
+        q = q.where(b.printer_id == printer_id)
+    if status:
+        q = q.where(b.status == status)
+    return q.order_by(b.start_at, b.id)
+
+
+def export_row(r):
+    return [
+        r.id, r.printer_id, r.tg_user, r.username, r.first_name, r.nickname,
+        r.start_at, r.end_at, round((r.end_at - r.start_at).total_seconds() / 3600, 2),
+        r.status, r.created_at,
+    ]
+
+
+async def fetch_batches(query, batch_rows: int = BATCH_ROWS):
+    """
+    Строки пачками через серверный курсор (yield_per): в памяти не больше одной пачки,
+    сколько бы лет архива ни попало в выборку. Читает с реплики, если она задана.
+    """
+    async with read_engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=batch_rows))
+        async for part in result.partitions():
+            yield [export_row(r) for r in part]
+
+
+def _csv_value(v):
+    return v.isoformat(sep=" ") if isinstance(v, datetime) else v
+
+
+async def csv_stream(query):
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    # BOM — чтобы Excel открыл кириллицу без мастера импорта
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    yield ("\ufeff" + buf.getvalue()).encode()
+    async for batch in fetch_batches(query):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([_csv_value(v) for v in row] for row in batch)
+        yield buf.getvalue().encode()
+
+
+async def xlsx_stream(query):
+    """
+    XLSX в режиме write-only: openpyxl пишет строки во временный XML на диске, а не держит
+    ячейки в памяти. ZIP собирается только целиком, поэтому файл отдаётся после сборки.
+    Запись строк и сохранение идут в потоке, чтобы не блокировать event loop.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Бронирования")
+    ws.append([title for _, title in EXPORT_COLUMNS])
+
+    def append(batch):
+        for row in batch:
+            ws.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        async for batch in fetch_batches(query):
+            await asyncio.to_thread(append, batch)
+        await asyncio.to_thread(wb.save, path)
+        with open(path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, FILE_CHUNK):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def export_stream(fmt: str, query):
+    return xlsx_stream(query) if fmt == "xlsx" else csv_stream(query)
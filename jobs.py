@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlmodel import select
+
+from db import Printer, PrintJob, get_async_session
+from octoprint import printer_busy, send_to_printer
+
+logger = logging.getLogger("PrintScheduler")
+logger.setLevel(logging.INFO)
+
+POLL_INTERVAL = 5.0
+ACTIVE_STATES = ("sending", "printing")
+MAX_BACKOFF = 60.0
+
+
+class PrintScheduler:
+    """
+    Очередь печати поверх таблицы PrintJob.
+    На каждый принтер — свой воркер, который берёт задания только своего принтера,
+    поэтому долгая печать или недоступный OctoPrint не задерживают остальные принтеры.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._wake = {}
+        self._tasks = {}
+        self._starting = {}
+        self._running = False
+
+    async def start(self):
+        async with get_async_session() as s:
+            if not (await s.exec(select(Printer.id).limit(1))).first():
+                s.add(Printer(name="Принтер 1"))
+            # Задания, прерванные перезапуском, возвращаются в очередь
+            await s.execute(update(PrintJob).where(PrintJob.status == "sending").values(status="queued"))
+            await s.commit()
+            printers = (await s.exec(select(Printer).where(Printer.enabled == True))).all()
+        self._running = True
+        for printer in printers:
+            self._spawn(printer)
+        logger.info("Print scheduler started for %d printer(s)", len(printers))
+
+    async def stop(self):
+        self._running = False
+        for task in list(self._starting.values()):
+            task.cancel()
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        self._wake.clear()
+
+    def _spawn(self, printer: Printer):
+        self._wake[printer.id] = asyncio.Event()
+        self._tasks[printer.id] = asyncio.create_task(self._worker(printer))
+
+    async def _spawn_for(self, printer_id: int):
+        try:
+            async with get_async_session() as s:
+                printer = await s.get(Printer, printer_id)
+            if self._running and printer is not None and printer_id not in self._tasks:
+                logger.info("Starting worker for %s", printer.name)
+                self._spawn(printer)
+        except Exception:
+            # Следующее задание этого принтера попробует снова
+            logger.exception("Failed to start worker for printer %s", printer_id)
+        finally:
+            self._starting.pop(printer_id, None)
+
+    def notify(self, printer_id: int):
+        event = self._wake.get(printer_id)
+        if event:
+            event.set()
+        elif self._running and printer_id not in self._starting:
+            # Принтер добавлен или включён после старта планировщика: воркер поднимается по первому заданию
+            self._starting[printer_id] = asyncio.create_task(self._spawn_for(printer_id))
+
+    async def _claim(self, printer_id: int):
+        async with get_async_session() as s:
+            while True:
+                job = (await s.exec(
+                    select(PrintJob)
+                    .where(PrintJob.printer_id == printer_id, PrintJob.status == "queued")
+                    .order_by(PrintJob.id)
+                    .limit(1)
+                )).first()
+                if job is None:
+                    return None
+                res = await s.execute(
+                    update(PrintJob)
+                    .where(PrintJob.id == job.id, PrintJob.status == "queued")
+                    .values(status="sending", started_at=datetime.utcnow())
+                )
+                await s.commit()
+                if res.rowcount == 1:
+                    await s.refresh(job)
+                    return job
+
+    async def _retry(self, what: str, fn, *args):
+        """
+        Повторяет fn, пока не удастся: сбой БД не должен ронять воркер принтера —
+        его никто не перезапустит, и задания принтера остались бы в очереди навсегда.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args)
+            except Exception:
+                logger.exception(what)
+            await asyncio.sleep(min(self.poll_interval * 2 ** attempt, MAX_BACKOFF))
+            attempt += 1
+
+    async def _finish(self, job_id: int, status: str, error: str = None):
+        await self._retry(f"failed to mark job {job_id} as {status}", self._set_status, job_id, status, error)
+
+    async def _set_status(self, job_id: int, status: str, error: str = None):
+        async with get_async_session() as s:
+            values = {"status": status, "error": error}
+            if status != "printing":
+                values["finished_at"] = datetime.utcnow()
+            await s.execute(update(PrintJob).where(PrintJob.id == job_id).values(**values))
+            await s.commit()
+
+    async def _idle(self, printer_id: int):
+        event = self._wake[printer_id]
+        try:
+            await asyncio.wait_for(event.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    async def _printing(self, printer_id: int):
+        async with get_async_session() as s:
+            return (await s.exec(
+                select(PrintJob.id).where(PrintJob.printer_id == printer_id, PrintJob.status == "printing")
+            )).all()
+
+    async def _worker(self, printer: Printer):
+        # Если после перезапуска на принтере что-то уже печатается — дожидаемся
+        current = await self._retry(f"{printer.name}: failed to load printing jobs", self._printing, printer.id)
+        for job_id in current:
+            await self._wait_done(printer, job_id)
+
+        while True:
+            try:
+                job = await self._claim(printer.id)
+            except Exception:
+                logger.exception("%s: failed to claim a job", printer.name)
+                job = None
+            if job is None:
+                await self._idle(printer.id)
+                continue
+            try:
+                await send_to_printer(job.file_path, job.tg_user, printer)
+            except Exception as e:
+                logger.warning("%s: job %s failed: %s", printer.name, job.id, e)
+                await self._finish(job.id, "failed", str(e))
+                continue
+            await self._finish(job.id, "printing")
+            await self._wait_done(printer, job.id)
+
+    async def _wait_done(self, printer: Printer, job_id: int):
+        while True:
+            try:
+                if not await printer_busy(printer):
+                    break
+            except Exception as e:
+                logger.warning("%s: status poll failed: %s", printer.name, e)
+            await asyncio.sleep(self.poll_interval)
+        await self._finish(job_id, "done")
+
+
+scheduler = PrintScheduler()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, text, union_all, update
+from sqlmodel import select
+
+from db import Booking, BookingArchive, PrintJob, async_engine
+
+logger = logging.getLogger("BookingLifecycle")
+logger.setLevel(logging.INFO)
+
+LIFECYCLE_INTERVAL = float(os.getenv("LIFECYCLE_INTERVAL", "60"))
+ARCHIVE_AFTER = timedelta(days=int(os.getenv("ARCHIVE_AFTER_DAYS", "30")))
+BATCH_SIZE = 5000
+FINISHED_STATUSES = ("completed", "cancelled")
+HISTORY_COLUMNS = ("id", "user_id", "tg_user", "printer_id", "start_at", "end_at", "created_at", "status")
+
+
+def booking_history():
+    """
+    Все брони — рабочая таблица и архив — одним подзапросом с колонками HISTORY_COLUMNS.
+    Условия на него PostgreSQL проталкивает в обе ветки UNION ALL, по start_at — с отсечением секций.
+    """
+    live = select(*(getattr(Booking, c) for c in HISTORY_COLUMNS))
+    archived = select(*(getattr(BookingArchive, c) for c in HISTORY_COLUMNS))
+    return union_all(live, archived).subquery("booking_history")
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(moment: datetime) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+
+class BookingLifecycle:
+    """
+    Фоновое обслуживание таблицы Booking:
+    активные брони после end_at помечаются completed, а завершённые и отменённые старше
+    ARCHIVE_AFTER переносятся в BookingArchive (в PostgreSQL — помесячные секции по start_at).
+    Всё идёт пачками по batch_size строк в отдельных транзакциях, без долгих блокировок.
+    """
+
+    def __init__(self, interval: float = LIFECYCLE_INTERVAL, archive_after: timedelta = ARCHIVE_AFTER,
+                 batch_size: int = BATCH_SIZE):
+        self.interval = interval
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self._partitions = set()
+        self._task = None
+
+    async def complete(self, now: datetime = None) -> int:
+        now = now or datetime.utcnow()
+        total = 0
+        while True:
+            batch = (
+                select(Booking.id)
+                .where(Booking.status == "active", Booking.start_at < now, Booking.end_at <= now)
+                .limit(self.batch_size)
+            )
+            async with async_engine.begin() as conn:
+                res = await conn.execute(
+                    update(Booking).where(Booking.id.in_(batch.scalar_subquery())).values(status="completed")
+                )
+            total += res.rowcount
+            if res.rowcount < self.batch_size:
+                return total
+
+    async def ensure_partition(self, conn, month: datetime):
+        """Секция архива на месяц month (только PostgreSQL)."""
+        name = f"bookingarchive_{month:%Y_%m}"
+        if conn.dialect.name != "postgresql" or name in self._partitions:
+            return
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF bookingarchive "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+        ))
+        self._partitions.add(name)
+
+    async def archive(self, now: datetime = None) -> int:
+        """
+        Перенос идёт помесячно: каждая пачка — строки одного месяца и одной секции архива.
+        Выборка без ORDER BY по диапазону индекса (status, start_at, end_at); сортировка всех
+        подходящих строк ради каждой пачки на миллионах броней стоила дороже самого переноса.
+        """
+        cutoff = (now or datetime.utcnow()) - self.archive_after
+        finished = (Booking.status.in_(FINISHED_STATUSES), Booking.start_at < cutoff, Booking.end_at < cutoff)
+        total = 0
+        month = datetime.min
+        while True:
+            async with async_engine.connect() as conn:
+                first = (await conn.execute(
+                    select(func.min(Booking.start_at)).where(*finished, Booking.start_at >= month)
+                )).scalar()
+            if first is None:
+                return total
+            month = month_start(first)
+            total += await self._archive_month(month, finished)
+            month = next_month(month)
+
+    async def _archive_month(self, month: datetime, finished) -> int:
+        columns = [getattr(Booking, c) for c in HISTORY_COLUMNS]
+        total = 0
+        while True:
+            async with async_engine.begin() as conn:
+                ids = (await conn.execute(
+                    select(Booking.id)
+                    .where(*finished, Booking.start_at >= month, Booking.start_at < next_month(month))
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )).scalars().all()
+                if not ids:
+                    return total
+                await self.ensure_partition(conn, month)
+                await conn.execute(
+                    insert(BookingArchive).from_select(HISTORY_COLUMNS, select(*columns).where(Booking.id.in_(ids)))
+                )
+                # Задания печати давно завершены; ссылка на бронь снимается, иначе не пустит внешний ключ
+                await conn.execute(update(PrintJob).where(PrintJob.booking_id.in_(ids)).values(booking_id=None))
+                await conn.execute(delete(Booking).where(Booking.id.in_(ids)))
+            total += len(ids)
+            if len(ids) < self.batch_size:
+                return total
+
+    async def run_once(self, now: datetime = None):
+        completed = await self.complete(now)
+        archived = await self.archive(now)
+        if completed or archived:
+            logger.info("Bookings: %d completed, %d archived", completed, archived)
+        return completed, archived
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Booking lifecycle failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+lifecycle = BookingLifecycle()
@@ -1,70 +1,197 @@
 import asyncio
+import base64
+import hashlib
+import logging
+import os
+from contextlib import asynccontextmanager
 from typing import Optional
 
-import nest_asyncio
 from datetime import timedelta, time as dtime, datetime
 from pathlib import Path
 
-from fastapi import FastAPI, UploadFile, File, Form, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import aiofiles
-import openpyxl
-from sqlmodel import Session, select
+from sqlalchemy import Integer, cast, insert, tuple_, update
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from db import (
-    create_db_and_tables,
-    get_session,
+    get_async_session,
     User,
     ModelItem,
     PendingModel,
-    Booking, engine,
+    Booking,
+    Printer,
+    PrintJob,
+    BOOKING_OVERLAP_CONSTRAINT,
+    async_engine,
+    engine,
+    read_db_session,
+    read_engine,
 )
 
-from octoprint import send_to_printer
+import analytics
+from assets import HtmlPage, StaticAssets
+from auth import admins, identities
+from cache import REDIS_URL, cache
+from cluster import WEB_CONCURRENCY, cluster
+from events import broker
+from export import EXPORT_FORMATS, export_query, export_stream
+from jobs import scheduler
+from lifecycle import booking_history, lifecycle
+from meta import META_FIELDS, analyze_model
+from metrics import CONTENT_TYPE, METRICS_DIR, MetricsMiddleware, instrument_engine, registry
+from migrate import MIGRATE_ON_START, check_schema, migrate
+from moderation import PendingSweeper, blob_files, files, unreferenced, unreferenced_pending
+from notify import approved_text, cancelled_text, enqueue, enqueue_many, notifier, rejected_text
+from octoprint import close_clients, poll_printers
+from profiler import profiler
+from profiles import profiles
+from search import has_trigram_index, search_query
+from serialize import NDJSON, check_format, encode_rows, query_fields, rows_response, stream_rows
+from slots import (
+    SLOT_DURATION_MIN, OPEN_HOUR, CLOSE_HOUR, MAX_BOOKING_SPAN, MAX_DAYS, MAX_BATCH, RECURRENCE_STEP,
+    expand_recurrence, find_conflicts, load_busy, load_days,
+)
+from storage import (
+    BLOB_DIR,
+    BLOB_HASH_RE,
+    IMMUTABLE_CACHE,
+    FORM_OVERHEAD,
+    MAX_IMAGE_SIZE,
+    MAX_MODEL_SIZE,
+    UploadLimitMiddleware,
+    blob_path,
+    blob_url,
+    etag_matches,
+    store_blob,
+)
+from thumbnails import THUMB_NAME_RE, thumb_path, thumb_source, thumb_urls, thumbnails
 
-BOT_TOKEN = ""
-WEBAPP_URL = ""
-ADMIN_IDS = []
+logger = logging.getLogger("PrinterApp")
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
 BASE_DIR = Path(__file__).parent
 UPLOADS_MODELS = BASE_DIR / "uploads" / "models"
 UPLOADS_IMAGES = BASE_DIR / "uploads" / "images"
 PENDING_DIR = BASE_DIR / "uploads" / "pending"
-for p in (UPLOADS_MODELS, UPLOADS_IMAGES, PENDING_DIR):
-    p.mkdir(parents=True, exist_ok=True)
 
-create_db_and_tables()
+# polling — бот работает отдельным процессом (python bot.py); webhook — апдейты принимает API
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+EVENTS_CHANNEL = "printer_events"
+PRINT_QUEUE_CHANNEL = "print_queue"
+NOTIFY_CHANNEL = "notifications"
+MAX_MODERATION_BATCH = 1000
 
-app = FastAPI(title="3D Printer MiniApp Backend")
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "webapp" / "static")), name="static")
-app.mount("/storage/models", StaticFiles(directory=str(UPLOADS_MODELS)), name="models")
-app.mount("/storage/images", StaticFiles(directory=str(UPLOADS_IMAGES)), name="images")
-app.mount("/storage/pending", StaticFiles(directory=str(PENDING_DIR)), name="pending")
 
-SLOT_DURATION_MIN = 60
-OPEN_HOUR = 9
-CLOSE_HOUR = 21
+def ensure_dirs():
+    for p in (UPLOADS_MODELS, UPLOADS_IMAGES, PENDING_DIR, BLOB_DIR):
+        p.mkdir(parents=True, exist_ok=True)
 
-def is_request_admin(request: Request):
+
+sweeper = PendingSweeper(PENDING_DIR, UPLOADS_MODELS)
+
+
+async def start_lifecycle():
+    lifecycle.start()
+
+
+def wake_scheduler(printer_id: int):
+    # Очередь печати работает только в процессе-лидере; остальных он услышит через NOTIFY
+    scheduler.notify(printer_id)
+    cluster.notify(PRINT_QUEUE_CHANNEL, str(printer_id))
+
+
+def wake_notifier():
+    notifier.wake()
+    cluster.notify(NOTIFY_CHANNEL, "")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     """
-    Проверка администратора по заголовку X-TG-ID.
-    Фронтенд должен передавать идентификатор пользователя Telegram (initDataUnsafe.user.id) в заголовке X-TG-ID.
-    Если заголовок отсутствует или его значение не числовой идентификатор, функция возвращает False.
-    Также возвращает False, если пользователь с таким ID не находится в списке ADMIN_IDS.
-    Используется для защиты административных маршрутов.
+    Всё, что раньше выполнялось при импорте, — здесь, в каждом процессе API.
+    Схему создаёт отдельный шаг (python -m migrate), здесь она только сверяется.
+    Очередь печати и обслуживание броней запускает один процесс-лидер (cluster.py).
     """
+    ensure_dirs()
+    if MIGRATE_ON_START:
+        await asyncio.to_thread(migrate)
+    await check_schema()
+    if WEB_CONCURRENCY > 1 and not REDIS_URL:
+        logger.warning("Несколько воркеров без REDIS_URL: кэш библиотеки у каждого процесса свой")
+
+    broker.relay = lambda frame: cluster.notify(EVENTS_CHANNEL, frame)
+    cluster.listen(EVENTS_CHANNEL, broker.deliver)
+    cluster.listen(PRINT_QUEUE_CHANNEL, lambda printer_id: scheduler.notify(int(printer_id)))
+    cluster.listen(NOTIFY_CHANNEL, lambda _: notifier.wake())
+    cluster.lead(scheduler.start, scheduler.stop)
+    cluster.lead(start_lifecycle, lifecycle.stop)
+    cluster.lead(notifier.start, notifier.stop)
+    cluster.lead(sweeper.start, sweeper.stop)
+    await cluster.start()
+    profiles.start()
+    dump_task = asyncio.create_task(registry.dump_loop()) if METRICS_DIR else None
+    app.state.bot = None
+    if BOT_MODE == "webhook":
+        from bot import create_bot
+        app.state.bot = create_bot()
     try:
-        if request is None:
-            return False
-        tg_id = request.headers.get("X-TG-ID")
-        if not tg_id:
-            return False
-        return int(tg_id) in ADMIN_IDS
-    except Exception:
-        return False
+        yield
+    finally:
+        if dump_task is not None:
+            dump_task.cancel()
+        await cluster.stop()
+        await profiles.stop()
+        thumbnails.shutdown()
+        files.shutdown()
+        await close_clients()
+        if app.state.bot is not None:
+            await app.state.bot.session.close()
+
+
+app = FastAPI(title="3D Printer MiniApp Backend", lifespan=lifespan)
+# Лимит на тело загрузки до разбора multipart (см. storage.UploadLimitMiddleware); внутри CORS — у 413 есть его заголовки
+UPLOAD_LIMIT = MAX_MODEL_SIZE + MAX_IMAGE_SIZE + FORM_OVERHEAD
+app.add_middleware(UploadLimitMiddleware, limits={"/api/submit_model": UPLOAD_LIMIT, "/api/models/upload": UPLOAD_LIMIT})
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor", "X-Profile-Id"])
+# X-Profile: профиль запроса сэмплирующим профайлером, только для администраторов (см. /debug/profiles)
+app.add_middleware(MetricsMiddleware, profiler=profiler, allow_profile=lambda scope: identities.is_admin(Request(scope)))
+instrument_engine("async", async_engine.sync_engine)
+instrument_engine("sync", engine)
+if read_engine is not async_engine:
+    instrument_engine("replica", read_engine.sync_engine)
+
+# Сессия с реплики для GET-выдачи, где отставание на доли секунды не страшно. scope="function":
+# соединение возвращается в пул сразу после обработчика, а не после отправки ответа
+ReadSession = Depends(read_db_session, scope="function")
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Все соединения пула заняты дольше DB_POOL_TIMEOUT: клиенту лучше повторить, чем ждать дальше
+    logger.warning("DB pool exhausted: %s %s", request.method, request.url.path)
+    return JSONResponse({"detail": "Сервер перегружен, повторите запрос"}, status_code=503, headers={"Retry-After": "1"})
+
+
+# Каталоги создаются в lifespan, поэтому check_dir=False
+app.mount("/storage/models", StaticFiles(directory=str(UPLOADS_MODELS), check_dir=False), name="models")
+app.mount("/storage/images", StaticFiles(directory=str(UPLOADS_IMAGES), check_dir=False), name="images")
+app.mount("/storage/pending", StaticFiles(directory=str(PENDING_DIR), check_dir=False), name="pending")
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def is_request_admin(request: Request):
+    """
+    Проверка администратора для защиты административных маршрутов.
+    Личность берётся из подписанного initData (X-TG-Init-Data), без BOT_TOKEN — из X-TG-ID (см. auth.py).
+    Возвращает False, если пользователь не определён или его нет в списке администраторов.
+    """
+    return identities.is_admin(request)
 
 
 def generate_day_slots(day_offset=0):
@@ -78,26 +205,227 @@ def generate_day_slots(day_offset=0):
             slots.append({"start": start.isoformat(), "end": end.isoformat()})
     return slots
 
-def is_conflict(start_dt, end_dt):
-    with get_session() as s:
-        q = select(Booking).where((Booking.start_at < end_dt) & (Booking.end_at > start_dt))
-        return s.exec(q).scalars().first() is not None
+# Колонки карточки модели; library_row берёт их по позиции — поиск поля Row по имени заметно дороже
+LIBRARY_FIELDS = ("id", "title", "file", "image", "thumbs", "meta")
+MODEL_COLUMNS = ("id", "title", "filename", "image", "file_hash", "image_hash", "thumb_hash", *META_FIELDS)
+
+def model_columns(model):
+    return [getattr(model, c) for c in MODEL_COLUMNS]
+
+def library_row(row, legacy_dir: str = "models"):
+    """Карточка модели (поля LIBRARY_FIELDS) из строки select(*model_columns(...), ...)."""
+    item_id, title, filename, image, file_hash, image_hash, thumb_hash = row[:7]
+    meta = {f: v for f, v in zip(META_FIELDS, row[7:len(MODEL_COLUMNS)]) if v is not None}
+    if file_hash:
+        file_url = blob_url(file_hash, filename)
+    else:
+        file_url = f"/storage/{legacy_dir}/{filename}"
+    if image_hash:
+        image_url = blob_url(image_hash, image)
+    else:
+        image_url = f"/storage/images/{image}" if image else None
+    return item_id, title, file_url, image_url, thumb_urls(thumb_hash), meta or None
+
+def booking_event(booking: Booking):
+    return {
+        "id": booking.id,
+        "tg_user": booking.tg_user,
+        "printer_id": booking.printer_id,
+        "start": booking.start_at.isoformat(),
+        "end": booking.end_at.isoformat(),
+        "status": booking.status,
+    }
+
+static_assets = StaticAssets(BASE_DIR / "webapp" / "static")
+index_page = HtmlPage(BASE_DIR / "webapp" / "index.html", static_assets)
+library_page = HtmlPage(BASE_DIR / "webapp" / "library.html", static_assets)
 
 @app.get("/", response_class=HTMLResponse)
-async def index():
-    return (BASE_DIR / "webapp" / "index.html").read_text(encoding="utf-8")
+async def index(request: Request):
+    return index_page.response(request)
 
 @app.get("/library", response_class=HTMLResponse)
-async def library():
-    return (BASE_DIR / "webapp" / "library.html").read_text(encoding="utf-8")
+async def library(request: Request):
+    return library_page.response(request)
+
+@app.get("/static/{path:path}")
+async def static(path: str, request: Request):
+    return static_assets.response(request, path)
+
+
+@app.get("/storage/blob/{sha256}")
+async def storage_blob(sha256: str, request: Request, name: Optional[str] = None):
+    if not BLOB_HASH_RE.fullmatch(sha256):
+        raise HTTPException(404, "Not found")
+    path = blob_path(sha256)
+    if not path.is_file():
+        raise HTTPException(404, "Not found")
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, filename=name, content_disposition_type="inline")
+
+
+@app.get("/storage/thumb/{name}")
+async def storage_thumb(name: str, request: Request):
+    m = THUMB_NAME_RE.fullmatch(name)
+    if not m:
+        raise HTTPException(404, "Not found")
+    path = thumb_path(m.group(1), int(m.group(2)))
+    if not path.is_file():
+        raise HTTPException(404, "Not found")
+    etag = f'"{name}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, media_type="image/webp")
+
+
+@app.get("/api/events")
+async def api_events(request: Request):
+    """
+    Поток живых обновлений (Server-Sent Events) вместо периодического опроса.
+    События: booking.created, booking.cancelled, model.approved, model.rejected, resync.
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(broker.stream(request), media_type="text/event-stream", headers=headers)
+
+
+LIBRARY_PAGE_SIZE = 50
+LIBRARY_CACHE_TTL = 300
+LIBRARY_VERSION_KEY = "library:version"
 
+def encode_cursor(uploaded_at: datetime, item_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{uploaded_at.isoformat()}|{item_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, item_id = raw.split("|")
+        return datetime.fromisoformat(ts), int(item_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+async def load_library_page(cursor: Optional[str], limit: int, format: str = "json"):
+    """Страница библиотеки: (etag, следующий курсор, тело в формате format). Читается через кэш."""
+    version = int(await cache.get(LIBRARY_VERSION_KEY) or 0)
+    key = f"library:{version}:{format}:{cursor or ''}:{limit}"
+    cached = await cache.get(key)
+    if cached is not None:
+        etag, next_cursor, body = cached.split(b"\n", 2)
+        return etag.decode(), next_cursor.decode() or None, body
+
+    q = (
+        select(*model_columns(ModelItem), ModelItem.uploaded_at)
+        .order_by(ModelItem.uploaded_at.desc(), ModelItem.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        q = q.where(tuple_(ModelItem.uploaded_at, ModelItem.id) < decode_cursor(cursor))
+    async with get_async_session() as s:
+        rows = (await s.exec(q)).all()
+    next_cursor = encode_cursor(rows[limit - 1].uploaded_at, rows[limit - 1].id) if len(rows) > limit else None
+    body = encode_rows(LIBRARY_FIELDS, [library_row(r) for r in rows[:limit]], format)
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    await cache.set(key, b"\n".join((etag.encode(), (next_cursor or "").encode(), body)), ttl=LIBRARY_CACHE_TTL)
+    return etag, next_cursor, body
 
 @app.get("/api/models")
-async def api_models():
-    with get_session() as s:
-        rows = s.exec(select(ModelItem).order_by(ModelItem.uploaded_at.desc())).all()
-    out = [{"id": r.id, "title": r.title, "file": f"/storage/models/{r.filename}", "image": (f"/storage/images/{r.image}" if r.image else None)} for r in rows]
-    return JSONResponse(out)
+async def api_models(request: Request, cursor: Optional[str] = None, limit: int = LIBRARY_PAGE_SIZE, format: str = "json"):
+    """
+    Библиотека моделей, новые сверху. Постраничная выдача по курсору:
+    курсор следующей страницы приходит в заголовке X-Next-Cursor. format — см. serialize.py.
+    """
+    limit, _ = page_bounds(limit, 0)
+    check_format(format)
+    etag, next_cursor, body = await load_library_page(cursor, limit, format)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=NDJSON if format == "ndjson" else "application/json", headers=headers)
+
+ingest_tasks = set()
+
+
+def run_ingest(coro):
+    task = asyncio.create_task(coro)
+    ingest_tasks.add(task)
+    task.add_done_callback(ingest_tasks.discard)
+
+
+async def make_thumbnails(kind: str, sha256: str):
+    """Превью в пуле процессов; по готовности thumb_hash проставляется всем записям с этим исходником."""
+    if not await thumbnails.build(kind, sha256):
+        return
+    async with get_async_session() as s:
+        for model in (PendingModel, ModelItem):
+            if kind == "image":
+                source = model.image_hash == sha256
+            else:
+                source = (model.file_hash == sha256) & (model.image_hash == None)
+            res = await s.execute(update(model).where(source, model.thumb_hash == None).values(thumb_hash=sha256))
+        await s.commit()
+    # Модель могла быть одобрена раньше, чем превью готово
+    if res.rowcount:
+        await cache.incr(LIBRARY_VERSION_KEY)
+
+
+async def record_meta(filename: str, sha256: str):
+    """Разбор файла модели (габариты STL, время и филамент из G-code) в потоке; результат — в записи с этим файлом."""
+    try:
+        meta = await asyncio.to_thread(analyze_model, blob_path(sha256), filename)
+    except Exception as e:
+        logger.warning("Model analysis failed for %s (%s): %s", filename, sha256, e)
+        return
+    if not meta:
+        return
+    async with get_async_session() as s:
+        await s.execute(update(PendingModel).where(PendingModel.file_hash == sha256).values(**meta))
+        res = await s.execute(update(ModelItem).where(ModelItem.file_hash == sha256).values(**meta))
+        await s.commit()
+    if res.rowcount:
+        await cache.incr(LIBRARY_VERSION_KEY)
+
+
+def start_ingest(item):
+    """Фоновые превью и разбор файла для записи, у которой их ещё нет."""
+    if not item.file_hash:
+        return
+    source = thumb_source(item.filename, item.file_hash, item.image_hash)
+    if source and not item.thumb_hash:
+        run_ingest(make_thumbnails(*source))
+    if all(getattr(item, f) is None for f in META_FIELDS):
+        run_ingest(record_meta(item.filename, item.file_hash))
+
+
+@app.get("/api/models/search")
+async def api_models_search(
+    q: Optional[str] = None,
+    max_x: Optional[float] = None,
+    max_y: Optional[float] = None,
+    max_z: Optional[float] = None,
+    min_time: Optional[int] = None,
+    max_time: Optional[int] = None,
+    limit: int = LIBRARY_PAGE_SIZE,
+    offset: int = 0,
+    format: str = "json",
+    s: AsyncSession = ReadSession,
+):
+    """
+    Поиск по библиотеке: q — слова из названия или имени файла (можно начало слова),
+    max_x/max_y/max_z — габариты в мм, min_time/max_time — время печати в секундах.
+    """
+    limit, offset = page_bounds(limit, offset)
+    check_format(format)
+    dialect = read_engine.dialect.name
+    substring = dialect == "postgresql" and await has_trigram_index(s)
+    query = search_query(dialect, q, max_x, max_y, max_z, min_time, max_time, substring, model_columns(ModelItem))
+    rows = (await s.exec(query.offset(offset).limit(limit))).all()
+    return rows_response(LIBRARY_FIELDS, [library_row(r) for r in rows], format)
+
 
 @app.post("/api/submit_model")
 async def api_submit_model(
@@ -109,51 +437,121 @@ async def api_submit_model(
     if not tg_user:
         raise HTTPException(status_code=400, detail="tg_user required")
 
-    ts = int(datetime.now().timestamp())
-    fname = f"{ts}_{file.filename}"
-    fpath = PENDING_DIR / fname
-    async with aiofiles.open(fpath, "wb") as out:
-        await out.write(await file.read())
-    imgname = None
+    fname = Path(file.filename or "model").name
+    sha256, size = await store_blob(file, MAX_MODEL_SIZE)
+    imgname = image_hash = None
     if image:
-        imgname = f"{ts}_{image.filename}"
-        ipath = UPLOADS_IMAGES / imgname
-        async with aiofiles.open(ipath, "wb") as out:
-            await out.write(await image.read())
-    with get_session() as s:
-        pm = PendingModel(submitter_tg=tg_user, title=title, filename=fname, image=imgname)
+        imgname = Path(image.filename or "image").name
+        image_hash, _ = await store_blob(image, MAX_IMAGE_SIZE)
+    async with get_async_session() as s:
+        pm = PendingModel(
+            submitter_tg=tg_user, title=title, filename=fname, image=imgname,
+            file_hash=sha256, file_size=size, image_hash=image_hash,
+        )
         s.add(pm)
-        s.commit()
-        s.refresh(pm)
+        await s.commit()
+        await s.refresh(pm)
 
-    return JSONResponse(content={"success": True, "message": "Модель отправлена на модерацию", "pending_id": pm.id})
+    logger.info("Pending model %s: %s (%d bytes, sha256=%s)", pm.id, fname, size, sha256)
+    start_ingest(pm)
+    return JSONResponse(content={"success": True, "message": "Модель отправлена на модерацию", "pending_id": pm.id, "sha256": sha256})
+
+
+def job_out(job: PrintJob):
+    return {
+        "id": job.id,
+        "printer_id": job.printer_id,
+        "booking_id": job.booking_id,
+        "status": job.status,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
 
 
 @app.post("/api/print/start")
-async def start_print(booking_id: int, request: Request, session=Depends(get_session)):
+async def start_print(booking_id: int, request: Request):
     """
-    Маршрут, имитирующий отправку модели в OctoPrint.
+    Ставит печать по брони в очередь принтера и сразу возвращает id задания.
+    Отправкой в OctoPrint занимается фоновый планировщик (jobs.PrintScheduler).
     Показывается кнопкой в личном кабинете.
     """
-    user_id = int(request.headers.get("X-TG-ID"))
-
-    booking = session.get(Booking, booking_id)
-    if not booking:
-        raise HTTPException(status_code=404, detail="Бронь не найдена")
-
-    if booking.user_id != user_id:
-        raise HTTPException(status_code=403, detail="Это не ваша бронь")
-
-    file_path = f"models/{booking_id}.gcode"
-    result = await send_to_printer(file_path, user_id)
+    identity = identities.resolve(request)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Пользователь не определён")
+    user_id = identity.tg_id
+
+    async with get_async_session() as session:
+        booking = await session.get(Booking, booking_id)
+        if not booking:
+            raise HTTPException(status_code=404, detail="Бронь не найдена")
+
+        if booking.tg_user != user_id:
+            raise HTTPException(status_code=403, detail="Это не ваша бронь")
+
+        printer = await session.get(Printer, booking.printer_id)
+        if not printer or not printer.enabled:
+            raise HTTPException(status_code=409, detail="Принтер недоступен")
+
+        first = (await session.exec(select(PrintJob.id).where(PrintJob.booking_id == booking.id).limit(1))).first() is None
+        job = PrintJob(
+            printer_id=printer.id,
+            booking_id=booking.id,
+            tg_user=user_id,
+            file_path=f"models/{booking_id}.gcode",
+        )
+        session.add(job)
+        if first:
+            await analytics.record_printed(session, booking)
+        await session.commit()
+        await session.refresh(job)
 
+    wake_scheduler(job.printer_id)
     return {
         "success": True,
-        "message": "Модель отправлена на печать (симуляция)",
-        "octoprint": result
+        "message": "Модель поставлена в очередь печати",
+        "job_id": job.id,
+        "status": job.status,
     }
 
 
+@app.get("/api/print/jobs/{job_id}")
+async def api_print_job(job_id: int):
+    async with get_async_session() as s:
+        job = await s.get(PrintJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job_out(job)
+
+
+@app.get("/api/printers")
+async def api_printers():
+    async with get_async_session() as s:
+        printers = (await s.exec(select(Printer).order_by(Printer.id))).all()
+        jobs = (await s.exec(
+            select(PrintJob)
+            .where(PrintJob.status.in_(("queued", "sending", "printing")))
+            .order_by(PrintJob.id)
+        )).all()
+    live = await poll_printers([p for p in printers if p.enabled])
+
+    out = []
+    for p in printers:
+        own = [j for j in jobs if j.printer_id == p.id]
+        current = next((j for j in own if j.status != "queued"), None)
+        out.append({
+            "id": p.id,
+            "name": p.name,
+            "enabled": p.enabled,
+            "status": "busy" if current else "idle",
+            "state": live.get(p.id, {}).get("state"),
+            "current_job": job_out(current) if current else None,
+            "queued": sum(1 for j in own if j.status == "queued"),
+        })
+    return out
+
+
 @app.post("/api/models/upload")
 async def api_models_upload(
     title: str = Form(...),
@@ -169,14 +567,99 @@ async def api_models_upload(
     return await api_submit_model(title=title, file=file, image=image, tg_user=tg_user)
 
 @app.get("/api/pending_models")
-async def api_pending_models(request: Request):
+async def api_pending_models(request: Request, format: str = "json"):
     if not is_request_admin(request):
         raise HTTPException(status_code=403, detail="Forbidden")
+    check_format(format)
+
+    async with get_async_session() as s:
+        rows = (await s.exec(
+            select(*model_columns(PendingModel), PendingModel.submitter_tg)
+            .where(PendingModel.moderated == False)
+            .order_by(PendingModel.created_at.desc())
+        )).all()
+    out = [library_row(r, "pending") + (r.submitter_tg,) for r in rows]
+    return rows_response(LIBRARY_FIELDS + ("submitter",), out, format)
+
+def moderation_ids(payload: dict) -> list:
+    ids = payload.get("ids") or payload.get("pending_ids")
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(400, "ids required")
+    if len(ids) > MAX_MODERATION_BATCH:
+        raise HTTPException(400, f"Не больше {MAX_MODERATION_BATCH} заявок за раз")
+    try:
+        return list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        raise HTTPException(400, "ids must be integers")
+
+
+async def claim_pending(s: AsyncSession, ids: list):
+    """Заявки из ids, ещё не прошедшие модерацию; помечаются moderated в транзакции s, повторно не берутся."""
+    claimed = (await s.execute(
+        update(PendingModel)
+        .where(PendingModel.id.in_(ids), PendingModel.moderated == False)
+        .values(moderated=True)
+        .returning(PendingModel.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all()
+    if not claimed:
+        return []
+    return (await s.exec(select(PendingModel).where(PendingModel.id.in_(claimed)).order_by(PendingModel.id))).all()
+
+
+async def approve_pending(ids: list):
+    """
+    Одобрение заявок одной транзакцией: модели и уведомления вставляются пачкой, без ORM-объекта
+    на каждую. Файлы старых загрузок переносятся после коммита в пуле потоков.
+    Возвращает заявки и id созданных для них моделей.
+    """
+    async with get_async_session() as s:
+        pms = await claim_pending(s, ids)
+        model_ids = []
+        if pms:
+            # CAST: SQLite в RETURNING отдаёт id как REAL, если в таблице перед ним есть колонка REAL
+            model_ids = (await s.execute(
+                insert(ModelItem.__table__).returning(cast(ModelItem.id, Integer), sort_by_parameter_order=True),
+                [
+                    {
+                        "title": pm.title, "filename": pm.filename, "image": pm.image, "uploaded_at": datetime.utcnow(),
+                        "file_hash": pm.file_hash, "file_size": pm.file_size, "image_hash": pm.image_hash,
+                        "thumb_hash": pm.thumb_hash, **{f: getattr(pm, f) for f in META_FIELDS},
+                    }
+                    for pm in pms
+                ],
+            )).scalars().all()
+            await enqueue_many(s, [(pm.submitter_tg, approved_text(pm.title)) for pm in pms])
+        await s.commit()
+    if not pms:
+        return pms, model_ids
+    # Старые загрузки лежат по имени в uploads/pending, новые — в хранилище блобов.
+    # Если перенос не случится (падение процесса), его доделает sweeper
+    await files.move((PENDING_DIR / pm.filename, UPLOADS_MODELS / pm.filename) for pm in pms if not pm.file_hash)
+    wake_notifier()
+    # Превью и разбор могли завершиться между чтением pm и вставкой модели: повторный запуск
+    # дешёвый (готовые превью не пересоздаются) и просто проставит поля в новой записи
+    for pm in pms:
+        start_ingest(pm)
+    await cache.incr(LIBRARY_VERSION_KEY)
+    return pms, model_ids
+
+
+async def reject_pending(ids: list):
+    """Отклонение заявок одной транзакцией; файлы, больше никому не нужные, удаляются в пуле потоков."""
+    async with get_async_session() as s:
+        pms = await claim_pending(s, ids)
+        await enqueue_many(s, [(pm.submitter_tg, rejected_text(pm.title)) for pm in pms])
+        # Ссылки проверяются в той же транзакции, уже без отклонённых заявок
+        hashes = await unreferenced(s, [h for pm in pms for h in (pm.file_hash, pm.image_hash)])
+        legacy = await unreferenced_pending(s, PENDING_DIR, [pm.filename for pm in pms if not pm.file_hash])
+        await s.commit()
+    if not pms:
+        return pms, 0
+    wake_notifier()
+    removed = await files.remove([*legacy, *(f for h in hashes for f in blob_files(h))])
+    return pms, removed
 
-    with get_session() as s:
-        rows = s.exec(select(PendingModel).where(PendingModel.moderated == False).order_by(PendingModel.created_at.desc())).all()
-    out = [{"id": r.id, "title": r.title, "file": f"/storage/pending/{r.filename}", "image": (f"/storage/images/{r.image}" if r.image else None), "submitter": r.submitter_tg} for r in rows]
-    return JSONResponse(out)
 
 @app.post("/api/admin/approve_model")
 async def api_approve_model(payload: dict, request: Request):
@@ -186,21 +669,11 @@ async def api_approve_model(payload: dict, request: Request):
     pend_id = payload.get("pending_id") or payload.get("id") or payload.get("pendingId")
     if pend_id is None:
         raise HTTPException(400, "pending_id required")
-    with get_session() as s:
-        pm = s.get(PendingModel, int(pend_id))
-        if not pm:
-            raise HTTPException(404, "Not found")
-        src = PENDING_DIR / pm.filename
-        dst = UPLOADS_MODELS / pm.filename
-        if src.exists():
-            src.replace(dst)
-        lib = ModelItem(title=pm.title, filename=pm.filename, image=pm.image)
-        s.add(lib)
-        pm.moderated = True
-        s.add(pm)
-        s.commit()
-        s.refresh(lib)
-    return {"ok": True, "model_id": lib.id}
+    pms, model_ids = await approve_pending([int(pend_id)])
+    if not pms:
+        raise HTTPException(404, "Not found")
+    broker.publish("model.approved", {"id": model_ids[0], "pending_id": pms[0].id, "title": pms[0].title})
+    return {"ok": True, "model_id": model_ids[0]}
 
 @app.post("/api/admin/reject_model")
 async def api_reject_model(payload: dict, request: Request):
@@ -209,259 +682,398 @@ async def api_reject_model(payload: dict, request: Request):
     pend_id = payload.get("pending_id")
     if pend_id is None:
         raise HTTPException(400, "pending_id required")
-    with get_session() as s:
-        pm = s.get(PendingModel, int(pend_id))
-        if not pm:
-            raise HTTPException(404, "Not found")
-        pm.moderated = True
-        s.add(pm)
-        s.commit()
+    pms, _ = await reject_pending([int(pend_id)])
+    if not pms:
+        raise HTTPException(404, "Not found")
+    broker.publish("model.rejected", {"pending_id": pms[0].id})
     return {"ok": True}
 
-@app.get("/api/admin/bookings")
-async def api_admin_bookings(request: Request):
+@app.post("/api/admin/approve_models")
+async def api_approve_models(payload: dict, request: Request):
+    """
+    Пакетное одобрение: {"ids": [...]}, до MAX_MODERATION_BATCH заявок одной транзакцией.
+    skipped — заявки, которых нет или которые уже обработаны.
+    """
     if not is_request_admin(request):
         raise HTTPException(status_code=403, detail="Forbidden")
+    ids = moderation_ids(payload)
+    pms, model_ids = await approve_pending(ids)
+    if pms:
+        # Одно событие на пакет: клиенты всё равно перезагружают список целиком
+        broker.publish("model.approved", {"count": len(pms)})
+    done = {pm.id for pm in pms}
+    return {
+        "ok": True,
+        "approved": [{"pending_id": pm.id, "model_id": model_id} for pm, model_id in zip(pms, model_ids)],
+        "skipped": [i for i in ids if i not in done],
+    }
 
-    now = datetime.utcnow()
+@app.post("/api/admin/reject_models")
+async def api_reject_models(payload: dict, request: Request):
+    """Пакетное отклонение: {"ids": [...]}; files_removed — сколько файлов удалено с диска."""
+    if not is_request_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    ids = moderation_ids(payload)
+    pms, removed = await reject_pending(ids)
+    if pms:
+        broker.publish("model.rejected", {"count": len(pms)})
+    done = {pm.id for pm in pms}
+    return {
+        "ok": True,
+        "rejected": [pm.id for pm in pms],
+        "skipped": [i for i in ids if i not in done],
+        "files_removed": removed,
+    }
 
-    with get_session() as s:
-        rows = s.exec(
-            select(Booking)
-            .where(
-                Booking.status == "active",
-                Booking.end_at > now
-            )
-            .order_by(Booking.start_at)
-        ).all()
+@app.get("/api/admin/bookings")
+async def api_admin_bookings(request: Request, format: str = "json"):
+    if not is_request_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    check_format(format)
 
-    out = []
-    for r in rows:
-        out.append({
-            "id": r.id,
-            "tg_user": r.tg_user,
-            "start": r.start_at.isoformat(),
-            "end": r.end_at.isoformat(),
-            "status": r.status
-        })
-    return out
+    now = datetime.utcnow()
+    q = (
+        select(Booking.id, Booking.tg_user, Booking.start_at.label("start"), Booking.end_at.label("end"), Booking.status)
+        .where(
+            Booking.status == "active",
+            Booking.end_at > now
+        )
+        .order_by(Booking.start_at)
+    )
+    if format == "ndjson":
+        return stream_rows(async_engine, q)
+    async with get_async_session() as s:
+        rows = (await s.exec(q)).all()
+    return rows_response(query_fields(q), rows, format)
 
 
 
 @app.post("/api/book/cancel")
-async def cancel_booking_client(data: dict, session: Session = Depends(get_session)):
+async def cancel_booking_client(data: dict, request: Request):
     booking_id = data.get("booking_id")
     tg_user = data.get("tg_user")
 
     if not booking_id:
         return {"error": "Не указан ID бронирования"}
 
-    booking = session.get(Booking, booking_id)
-    if not booking:
-        return {"error": "Бронирование не найдено"}
-
-    if tg_user and booking.tg_user != int(tg_user):
-        return {"error": "Вы не можете отменить чужое бронирование"}
-
-    booking.status = "cancelled"
-    session.add(booking)
-    session.commit()
-    session.refresh(booking)
+    async with get_async_session() as session:
+        booking = await session.get(Booking, booking_id)
+        if not booking:
+            return {"error": "Бронирование не найдено"}
+
+        # Подписанная личность обязана совпасть с владельцем; без BOT_TOKEN — X-TG-ID или tg_user из тела
+        identity = identities.check_owner(request, booking.tg_user)
+        owner = identity.tg_id if identity else tg_user
+        if owner is None or str(owner) != str(booking.tg_user):
+            return {"error": "Вы не можете отменить чужое бронирование"}
+
+        # Условный UPDATE: при двух одновременных отменах в сводки аналитики попадает одна,
+        # а завершённую lifecycle бронь отменить уже нельзя
+        res = await session.execute(
+            update(Booking).where(Booking.id == booking.id, Booking.status == "active").values(status="cancelled")
+        )
+        if not res.rowcount:
+            return {"error": "Бронь уже отменена или завершена"}
+        await analytics.record_cancelled(session, [booking])
+        await session.commit()
+        booking.status = "cancelled"
+    broker.publish("booking.cancelled", booking_event(booking))
 
     return {"ok": True, "message": "Бронирование успешно отменено"}
 
-@app.get("/api/slots/{day}")
-async def api_slots(day: str, s: Session = Depends(get_session)):
-    from datetime import datetime, timedelta, time
-
+def parse_day(day: str):
     try:
         if day.isdigit():
-            date_obj = (datetime.utcnow().date() + timedelta(days=int(day)))
-        else:
-            date_obj = datetime.strptime(day, "%Y-%m-%d").date()
+            return datetime.utcnow().date() + timedelta(days=int(day))
+        return datetime.strptime(day, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format, expected YYYY-MM-DD")
 
-    # Берём только активные бронирования
-    bookings = s.exec(select(Booking).where(Booking.status == "active")).all()
-    bookings_today = [b for b in bookings if b.start_at.date() == date_obj]
 
-    now = datetime.utcnow()
-    slots = []
+@app.get("/api/slots")
+async def api_slots_range(
+    day_from: str = Query("0", alias="from"), days: int = 7, printer_id: int = 1, s: AsyncSession = ReadSession
+):
+    # Слот, который реплика ещё показывает свободным, отклонит проверка пересечений при бронировании
+    if not 1 <= days <= MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_DAYS}")
+    first_day = parse_day(day_from)
+    result = await load_days(s, first_day, days, printer_id=printer_id)
+    return JSONResponse(result)
 
-    for hour in range(9, 21):
-        start = datetime.combine(date_obj, time(hour=hour))
-        end = datetime.combine(date_obj, time(hour=hour + 1))
 
-        busy = any(b.start_at <= start < b.end_at for b in bookings_today)
-        occupied = busy
-        if date_obj == now.date() and start <= now:
-            occupied = True
+@app.get("/api/slots/{day}")
+async def api_slots(day: str, printer_id: int = 1, s: AsyncSession = ReadSession):
+    date_obj = parse_day(day)
+    result = await load_days(s, date_obj, 1, printer_id=printer_id)
+    return JSONResponse(result[0]["slots"])
 
-        slots.append({
-            "start": start.isoformat(),
-            "end": end.isoformat(),
-            "occupied": occupied
-        })
 
-    return JSONResponse(slots)
+def parse_interval(start, end):
+    try:
+        start_dt = datetime.fromisoformat(start)
+        end_dt = datetime.fromisoformat(end)
+    except (TypeError, ValueError):
+        raise HTTPException(400, "Некорректный формат даты")
+    if not start_dt < end_dt <= start_dt + MAX_BOOKING_SPAN:
+        raise HTTPException(400, "Некорректный интервал бронирования")
+    return start_dt, end_dt
 
 
-@app.post("/api/book")
-async def create_booking(data: dict, session: Session = Depends(get_session)):
+def parse_booking_owner(data: dict):
     tg_user = data.get("tg_user")
-    username = data.get("username")
-    first_name = data.get("first_name")
-    nickname = data.get("nickname")
-    printer_id = data.get("printer_id", 1)
-    start = data.get("start") or data.get("start_time")
-    end = data.get("end") or data.get("end_time")
-
-    if not all([tg_user, start, end]):
+    if not tg_user:
         raise HTTPException(400, "Отсутствуют обязательные поля (tg_user, start, end)")
-
     try:
-        tg_user = int(tg_user)
+        return int(tg_user), int(data.get("printer_id") or 1)
     except Exception:
-        raise HTTPException(400, "tg_user должен быть числом")
-
-    statement = select(User).where(User.tg_id == tg_user)
-    user = session.exec(statement).first()
-
-    if not user:
-        # Создаем нового пользователя
-        user = User(
-            tg_id=tg_user,
-            username=username or f"user_{tg_user}",
-            first_name=first_name,
-            nickname=nickname
+        raise HTTPException(400, "tg_user и printer_id должны быть числами")
+
+
+async def check_printer(session, printer_id: int):
+    # У Booking.printer_id нет внешнего ключа: бронь на несуществующий или выключенный принтер
+    # заняла бы слоты, которые потом не напечатать
+    printer = await session.get(Printer, printer_id)
+    if not printer:
+        raise HTTPException(404, "Принтер не найден")
+    if not printer.enabled:
+        raise HTTPException(409, "Принтер недоступен")
+
+
+def booking_profile(data: dict, identity):
+    # Подписанные данные Telegram надёжнее присланных в теле запроса
+    username = identity.username if identity and identity.verified and identity.username else data.get("username")
+    first_name = identity.first_name if identity and identity.verified and identity.first_name else data.get("first_name")
+    return username, first_name, data.get("nickname")
+
+
+async def commit_bookings(session, bookings):
+    # Пересечения проверяет сама БД (см. db.BOOKING_OVERLAP_DDL): нарушение всплывает уже на flush
+    try:
+        await session.flush()
+        await analytics.record_created(session, bookings)
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if BOOKING_OVERLAP_CONSTRAINT in str(e.orig):
+            raise HTTPException(409, "Это время уже занято")
+        raise
+
+
+@app.post("/api/book")
+async def create_booking(data: dict, request: Request):
+    start = data.get("start") or data.get("start_time")
+    end = data.get("end") or data.get("end_time")
+    tg_user, printer_id = parse_booking_owner(data)
+    identity = identities.check_owner(request, tg_user)
+    if not all([start, end]):
+        raise HTTPException(400, "Отсутствуют обязательные поля (tg_user, start, end)")
+    start_dt, end_dt = parse_interval(start, end)
+
+    async with get_async_session() as session:
+        await check_printer(session, printer_id)
+        user_id = await profiles.user_id(session, tg_user, *booking_profile(data, identity))
+        booking = Booking(
+            user_id=user_id,
+            tg_user=tg_user,
+            printer_id=printer_id,
+            start_at=start_dt,
+            end_at=end_dt,
+            created_at=datetime.utcnow(),
+            status="active"
         )
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+        session.add(booking)
+        await commit_bookings(session, [booking])
+        profiles.remember(session)
+
+    logger.info("New booking: id=%s, tg_user=%s, start=%s", booking.id, booking.tg_user, booking.start_at)
+    broker.publish("booking.created", booking_event(booking))
+
+    return {"ok": True, "booking_id": booking.id}
+
+
+def batch_intervals(data: dict):
+    """Интервалы пакетной брони: явный список intervals или правило recurrence."""
+    rule = data.get("recurrence")
+    if rule:
+        if not isinstance(rule, dict):
+            raise HTTPException(400, "recurrence должен быть объектом")
+        start_dt, end_dt = parse_interval(rule.get("start"), rule.get("end"))
+        freq = rule.get("freq", "weekly")
+        if freq not in RECURRENCE_STEP:
+            raise HTTPException(400, "freq должен быть daily или weekly")
+        try:
+            count = int(rule.get("count") or 0)
+            step = int(rule.get("interval") or 1)
+        except (TypeError, ValueError):
+            raise HTTPException(400, "count и interval должны быть числами")
+        if not 0 < count <= MAX_BATCH or step < 1:
+            raise HTTPException(400, f"count должен быть от 1 до {MAX_BATCH}")
+        intervals = expand_recurrence(start_dt, end_dt, freq, count, step)
     else:
-        # Обновляем пользователя, если есть новые данные и они отличаются
-        updated = False
-        if username and username != user.username:
-            user.username = username
-            updated = True
-        if first_name and first_name != user.first_name:
-            user.first_name = first_name
-            updated = True
-        if nickname and nickname != user.nickname:
-            user.nickname = nickname
-            updated = True
-        if updated:
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-
-    start_dt = datetime.fromisoformat(start)
-    end_dt = datetime.fromisoformat(end)
-
-    overlap = session.exec(
-        select(Booking).where(
-            Booking.start_at < end_dt,
-            Booking.end_at > start_dt,
-            Booking.status == "active"
-        )
-    ).first()
-    if overlap:
-        raise HTTPException(400, "Это время уже занято")
-
-    booking = Booking(
-        user_id=user.id,
-        tg_user=tg_user,
-        printer_id=printer_id,
-        start_at=start_dt,
-        end_at=end_dt,
-        created_at=datetime.utcnow(),
-        status="active"
-    )
+        raw = data.get("intervals") or []
+        if not isinstance(raw, list) or not all(isinstance(i, dict) for i in raw):
+            raise HTTPException(400, "intervals должен быть списком объектов {start, end}")
+        if not 0 < len(raw) <= MAX_BATCH:
+            raise HTTPException(400, f"Нужно от 1 до {MAX_BATCH} интервалов")
+        intervals = [parse_interval(i.get("start"), i.get("end")) for i in raw]
+
+    intervals.sort()
+    for (_, prev_end), (start, _) in zip(intervals, intervals[1:]):
+        if start < prev_end:
+            raise HTTPException(400, "Интервалы в запросе пересекаются между собой")
+    return intervals
+
+
+@app.post("/api/book/batch")
+async def create_bookings_batch(data: dict, request: Request):
+    tg_user, printer_id = parse_booking_owner(data)
+    identity = identities.check_owner(request, tg_user)
+    intervals = batch_intervals(data)
+
+    async with get_async_session() as session:
+        await check_printer(session, printer_id)
+        # Одна выборка по всему диапазону вместо запроса на каждый интервал
+        busy = await load_busy(session, intervals[0][0], intervals[-1][1], printer_id)
+        conflicts = find_conflicts(intervals, busy)
+        if conflicts:
+            raise HTTPException(409, {
+                "message": "Часть интервалов уже занята",
+                "conflicts": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in conflicts],
+            })
 
-    session.add(booking)
-    session.commit()
-    session.refresh(booking)
+        user_id = await profiles.user_id(session, tg_user, *booking_profile(data, identity))
+        now = datetime.utcnow()
+        bookings = [
+            Booking(
+                user_id=user_id,
+                tg_user=tg_user,
+                printer_id=printer_id,
+                start_at=start,
+                end_at=end,
+                created_at=now,
+                status="active"
+            )
+            for start, end in intervals
+        ]
+        session.add_all(bookings)
+        # Всё или ничего: гонку между проверкой и вставкой ловит ограничение БД
+        await commit_bookings(session, bookings)
+        profiles.remember(session)
 
-    print(f"NEW BOOKING: id={booking.id}, tg_user={booking.tg_user}, start={booking.start_at}")
+    logger.info("New bookings: %d, tg_user=%s, printer=%s", len(bookings), tg_user, printer_id)
+    for booking in bookings:
+        broker.publish("booking.created", booking_event(booking))
+
+    return {"ok": True, "booking_ids": [b.id for b in bookings]}
+
+
+def page_bounds(limit: int, offset: int):
+    return max(1, min(limit, MAX_PAGE_SIZE)), max(0, offset)
 
-    return {"ok": True, "booking_id": booking.id}
 
+BOOKING_FIELDS = ("id", "tg_user", "user_name", "start", "end", "title", "status")
 
 @app.get("/api/bookings")
-async def api_bookings(all: bool = False, tg_user: int = None):
+async def api_bookings(
+    all: bool = False, tg_user: int = None, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0, format: str = "json"
+):
     from datetime import datetime
-    def get_user_name(user, fallback_tg_id):
-        if user:
-            for name in (user.username, user.first_name, user.nickname):
+    def get_user_name(row):
+        if row.user_id is not None:
+            for name in (row.username, row.first_name, row.nickname):
                 if name and name.strip():
                     return name
-            return f"user_{fallback_tg_id}"
+            return f"user_{row.tg_user}"
         return "неизвестно"
+    check_format(format)
     if not tg_user:
-        return JSONResponse([])
-
-    with get_session() as s:
-        q = select(Booking).where(Booking.tg_user == int(tg_user))
+        return rows_response(BOOKING_FIELDS, [], format)
+    limit, offset = page_bounds(limit, offset)
+
+    # Текущие брони всегда в рабочей таблице; история целиком — вместе с архивом
+    b = booking_history().c if all else Booking
+    async with get_async_session() as s:
+        q = (
+            select(
+                b.id, b.tg_user, b.start_at, b.end_at, b.status,
+                User.id.label("user_id"), User.username, User.first_name, User.nickname,
+            )
+            .join(User, User.id == b.user_id, isouter=True)
+            .where(b.tg_user == int(tg_user))
+        )
         if not all:
             q = q.where(
                 Booking.status == "active",
                 Booking.end_at > datetime.utcnow()
             )
-        q = q.order_by(Booking.start_at)
-        rows = s.exec(q).all()
-
-        out = []
-        for r in rows:
-            user = s.get(User, r.user_id)
-            print(f"Booking id={r.id}, user={user}")
-            if user:
-                print(f"User data: username={user.username}, first_name={user.first_name}, nickname={user.nickname}")
-            else:
-                print("User not found in DB")
-
-            user_name = get_user_name(user, r.tg_user)
-            out.append({
-                "id": r.id,
-                "tg_user": r.tg_user,
-                "user_name": user_name,
-                "start": r.start_at.isoformat(),
-                "end": r.end_at.isoformat(),
-                "title": getattr(r, "title", "Бронирование"),
-                "status": r.status
-            })
+        q = q.order_by(b.start_at).offset(offset).limit(limit)
+        rows = (await s.exec(q)).all()
 
-    return JSONResponse(out)
+    logger.debug("api_bookings tg_user=%s all=%s: %d rows", tg_user, all, len(rows))
+    out = [(r.id, r.tg_user, get_user_name(r), r.start_at, r.end_at, "Бронирование", r.status) for r in rows]
+    return rows_response(BOOKING_FIELDS, out, format)
 
 
 
 @app.get("/api/bookings/archive")
-async def api_bookings_archive(all: bool = False, tg_user: int = None):
+async def api_bookings_archive(
+    all: bool = False, tg_user: int = None, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0, format: str = "json",
+    s: AsyncSession = ReadSession,
+):
+    """format=ndjson отдаёт строки потоком, и limit для него не ограничен MAX_PAGE_SIZE."""
     from datetime import datetime
     now = datetime.utcnow()
+    check_format(format)
+    if format == "ndjson":
+        limit, offset = max(1, limit), max(0, offset)
+    else:
+        limit, offset = page_bounds(limit, offset)
+
+    b = booking_history().c
+    q = select(b.id, b.tg_user, b.start_at.label("start"), b.end_at.label("end")).where(b.end_at < now)
+    if not all and tg_user:
+        q = q.where(b.tg_user == int(tg_user))
+    q = q.order_by(b.start_at.desc()).offset(offset).limit(limit)
+    if format == "ndjson":
+        return stream_rows(read_engine, q)
+    rows = (await s.exec(q)).all()
+    return rows_response(query_fields(q), rows, format)
+
+@app.get("/api/admin/export/bookings")
+async def api_export_bookings(
+    request: Request,
+    format: str = "xlsx",
+    date_from: str = None,
+    date_to: str = None,
+    printer_id: int = None,
+    status: str = None,
+):
+    """
+    Выгрузка броней с пользователями в XLSX или CSV для отчётов.
+    Строки читаются серверным курсором и пишутся по мере чтения (см. export.py).
+    """
+    if not is_request_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format должен быть xlsx или csv")
+
+    first = parse_day(date_from) if date_from else None
+    last = parse_day(date_to) if date_to else None
+    query = export_query(first, last, printer_id, status)
+    filename = f"bookings_{first or 'all'}_{last or 'all'}.{format}"
+    return StreamingResponse(
+        export_stream(format, query),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
-    with get_session() as s:
-        q = select(Booking).where(Booking.end_at < now)
-        if not all and tg_user:
-            q = q.where(Booking.tg_user == int(tg_user))
-        q = q.order_by(Booking.start_at.desc())
-        rows = s.exec(q).all()
-
-    out = [
-        {
-            "id": r.id,
-            "tg_user": r.tg_user,
-            "start": r.start_at.isoformat(),
-            "end": r.end_at.isoformat(),
-        }
-        for r in rows
-    ]
-    return JSONResponse(out)
 
 @app.get("/api/bookings/by_date")
-async def api_bookings_by_date(date: str, request: Request = None):
+async def api_bookings_by_date(date: str, request: Request = None, format: str = "json"):
     if not is_request_admin(request):
         raise HTTPException(status_code=403, detail="Forbidden")
+    check_format(format)
 
     from datetime import datetime, time
 
@@ -473,82 +1085,109 @@ async def api_bookings_by_date(date: str, request: Request = None):
     start_dt = datetime.combine(day, time.min)
     end_dt = datetime.combine(day, time.max)
 
-    with get_session() as s:
-        q = select(Booking).where(Booking.start_at >= start_dt, Booking.start_at <= end_dt).order_by(Booking.start_at)
-        rows = s.exec(q).all()
-
-    out = [
-        {
-            "id": r.id,
-            "tg_user": r.tg_user,
-            "start": r.start_at.isoformat(),
-            "end": r.end_at.isoformat(),
-            "status": r.status
-        }
-        for r in rows
-    ]
-    return JSONResponse(out)
+    b = booking_history().c
+    q = (
+        select(b.id, b.tg_user, b.start_at.label("start"), b.end_at.label("end"), b.status)
+        .where(b.start_at >= start_dt, b.start_at <= end_dt)
+        .order_by(b.start_at)
+    )
+    if format == "ndjson":
+        return stream_rows(async_engine, q)
+    async with get_async_session() as s:
+        rows = (await s.exec(q)).all()
+    return rows_response(query_fields(q), rows, format)
+
+@app.get("/api/admin/analytics")
+async def api_admin_analytics(
+    request: Request, day_from: Optional[str] = Query(None, alias="from"), days: int = analytics.DEFAULT_DAYS,
+    printer_id: Optional[int] = None, users: int = analytics.TOP_USERS, s: AsyncSession = ReadSession,
+):
+    """
+    Загрузка принтеров за days дней с from (по умолчанию — последние days дней, включая сегодня):
+    тепловая карта день недели × час, доля отмен и неявок, самые активные пользователи.
+    Считается по суточным сводкам (analytics.py), а не по истории броней.
+    """
+    if not is_request_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not 1 <= days <= analytics.MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {analytics.MAX_DAYS}")
+    first_day = parse_day(day_from) if day_from else datetime.utcnow().date() - timedelta(days=days - 1)
+    return await analytics.report(s, first_day, first_day + timedelta(days=days), printer_id, max(1, min(users, 100)))
 
 @app.post("/api/cancel_booking/{booking_id}")
-def cancel_booking_admin(booking_id: int, request: Request, db: Session = Depends(get_session)):
+async def cancel_booking_admin(booking_id: int, request: Request):
     if not is_request_admin(request):
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    booking = db.get(Booking, booking_id)
-    if not booking:
-        raise HTTPException(status_code=404, detail="Бронь не найдена")
+    async with get_async_session() as db:
+        booking = await db.get(Booking, booking_id)
+        if not booking:
+            raise HTTPException(status_code=404, detail="Бронь не найдена")
 
-    if booking.status != "active":
-        raise HTTPException(status_code=400, detail="Бронь уже отменена или завершена")
-
-    booking.status = "cancelled"
-    db.add(booking)
-    db.commit()
-    db.refresh(booking)
+        res = await db.execute(
+            update(Booking).where(Booking.id == booking.id, Booking.status == "active").values(status="cancelled")
+        )
+        if not res.rowcount:
+            raise HTTPException(status_code=400, detail="Бронь уже отменена или завершена")
+        await analytics.record_cancelled(db, [booking])
+        enqueue(db, booking.tg_user, cancelled_text(booking))
+        await db.commit()
+        booking.status = "cancelled"
+    wake_notifier()
+    broker.publish("booking.cancelled", booking_event(booking))
     return {"message": "Бронь успешно отменена", "booking_id": booking.id}
 
 @app.get("/api/user_is_admin/{tg_id}")
 async def api_user_is_admin(tg_id: int):
-    return {"is_admin": tg_id in ADMIN_IDS}
+    return {"is_admin": tg_id in admins}
 
-# Telegram bot (unchanged)
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus; с METRICS_DIR — сумма по всем воркерам."""
+    if METRICS_DIR:
+        return Response(await asyncio.to_thread(registry.render), media_type=CONTENT_TYPE)
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
-bot: Bot = Bot(token=BOT_TOKEN)
-dp: Dispatcher = Dispatcher()
+@app.get("/debug/profiles")
+async def debug_profiles(request: Request):
+    if not is_request_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return profiler.summaries()
+
+@app.get("/debug/profiles/{profile_id}")
+async def debug_profile(profile_id: str, request: Request):
+    """Collapsed stacks профиля: flamegraph.pl или speedscope.app открывают их как есть."""
+    if not is_request_admin(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    stacks = profiler.collapsed(profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден (хранятся последние 50 в каждом воркере)")
+    return Response(stacks, media_type="text/plain; charset=utf-8")
+
+if BOT_MODE == "webhook":
+    # aiogram импортируется только здесь: это секунды на старте каждого воркера
+    from bot import WEBHOOK_PATH, WEBHOOK_SECRET, dp
+
+    @app.post(WEBHOOK_PATH, include_in_schema=False)
+    async def telegram_webhook(request: Request):
+        """Апдейты Telegram в режиме вебхука; бот при этом не запускается отдельным процессом."""
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        await dp.feed_webhook_update(request.app.state.bot, await request.json())
+        return {"ok": True}
 
-@dp.message(Command("start"))
-async def cmd_start(message: types.Message):
-    if WEBAPP_URL:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Открыть приложение", web_app=WebAppInfo(url=WEBAPP_URL))]])
-        await message.answer("Открой мини-приложение:", reply_markup=keyboard)
-    else:
-        await message.answer("WEBAPP_URL не задан на сервере")
-
-async def run_bot():
-    global bot, dp
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
-    dp.message.register(cmd_start, Command("start"))
-    await bot.delete_webhook(drop_pending_updates=True)
-    asyncio.create_task(dp.start_polling(bot))
-    return bot
-
-async def main():
-    bot_instance = await run_bot()
-    app.state.bot_app = bot_instance
-    import uvicorn
-    config = uvicorn.Config(app=app, host="0.0.0.0", port=80, loop="asyncio", log_level="info")
-    server = uvicorn.Server(config)
-    try:
-        await server.serve()
-    finally:
-        await dp.storage.close()
-        await dp.storage.wait_closed()
-        await bot_instance.session.close()
 
 if __name__ == "__main__":
-    nest_asyncio.apply()
-    asyncio.run(main())
+    # Один процесс: python main.py; несколько: WEB_CONCURRENCY=4 python main.py,
+    # uvicorn main:app --workers 4 или gunicorn main:app -k uvicorn.workers.UvicornWorker -w 4.
+    # Перед первым запуском и после обновления: python -m migrate; бот — python bot.py.
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "80")),
+        workers=WEB_CONCURRENCY,
+        # воркеры импортируют приложение одновременно; на малом числе ядер это дольше 5 с по умолчанию
+        timeout_worker_healthcheck=30,
+        log_level="info",
+    )
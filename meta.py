@@ -0,0 +1,113 @@
+import re
+from pathlib import Path
+
+import numpy as np
+
+from thumbnails import STL_DTYPE, ascii_stl_chunks
+
+STL_CHUNK = 1_000_000  # треугольников за проход: ~50 МБ memmap, ~72 МБ float64
+GCODE_SCAN = 256 * 1024  # слайсеры пишут сводку в начало (Cura) или в конец (Prusa/Orca) файла
+
+META_FIELDS = ("size_x", "size_y", "size_z", "triangles", "volume", "print_time", "filament_mm", "filament_g")
+
+
+def _stl_stats(chunks):
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    count = 0
+    volume = 0.0
+    for tris in chunks:
+        tris = tris[np.isfinite(tris).all(axis=(1, 2))]
+        if not len(tris):
+            continue
+        pts = tris.reshape(-1, 3)
+        lo = np.minimum(lo, pts.min(axis=0))
+        hi = np.maximum(hi, pts.max(axis=0))
+        # Объём замкнутой сетки — сумма ориентированных тетраэдров с вершиной в начале координат
+        volume += np.einsum("ij,ij->i", tris[:, 0], np.cross(tris[:, 1], tris[:, 2])).sum() / 6
+        count += len(tris)
+    if not count:
+        raise ValueError("пустой STL")
+    size = hi - lo
+    return {
+        "size_x": round(float(size[0]), 2),
+        "size_y": round(float(size[1]), 2),
+        "size_z": round(float(size[2]), 2),
+        "triangles": count,
+        "volume": round(abs(float(volume)), 2),
+    }
+
+
+def analyze_stl(path: Path) -> dict:
+    """Габариты (мм), число треугольников и объём (мм³). Бинарный STL идёт кусками по memmap, ASCII — по ascii_stl_chunks."""
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        head = f.read(84)
+    count = int.from_bytes(head[80:84], "little") if len(head) == 84 else -1
+    if count >= 0 and size == 84 + STL_DTYPE.itemsize * count:
+        data = np.memmap(path, dtype=STL_DTYPE, mode="r", offset=84, shape=(count,))["v"]
+        chunks = (np.asarray(data[i:i + STL_CHUNK], dtype=np.float64) for i in range(0, count, STL_CHUNK))
+        return _stl_stats(chunks)
+    return _stl_stats(ascii_stl_chunks(path))
+
+
+_DURATION_RE = re.compile(r"(?:(\d+)\s*d)?\s*(?:(\d+)\s*h)?\s*(?:(\d+)\s*m)?\s*(?:(\d+)\s*s)?")
+
+GCODE_PATTERNS = [
+    # Cura
+    ("print_time", re.compile(r"^;TIME:(\d+)", re.M), int),
+    ("filament_mm", re.compile(r"^;Filament used:\s*([\d.]+)m", re.M), lambda v: float(v) * 1000),
+    # PrusaSlicer / OrcaSlicer / Bambu Studio
+    ("print_time", re.compile(r"^; estimated printing time(?: \(normal mode\))?\s*=\s*(.+)$", re.M), "duration"),
+    ("filament_mm", re.compile(r"^; (?:total )?filament used \[mm\]\s*=\s*([\d.]+)", re.M), float),
+    ("filament_g", re.compile(r"^; (?:total )?filament used \[g\]\s*=\s*([\d.]+)", re.M), float),
+    # Simplify3D
+    ("print_time", re.compile(r"^;\s+Build time:\s*(\d+) hours? (\d+) minutes?", re.M), "hours_minutes"),
+    ("filament_mm", re.compile(r"^;\s+Filament length:\s*([\d.]+) mm", re.M), float),
+    ("filament_g", re.compile(r"^;\s+Plastic weight:\s*([\d.]+) g", re.M), float),
+]
+
+
+def _duration(text: str):
+    m = _DURATION_RE.match(text.strip())
+    if not m or not any(m.groups()):
+        return None
+    d, h, mi, s = (int(x or 0) for x in m.groups())
+    return ((d * 24 + h) * 60 + mi) * 60 + s
+
+
+def analyze_gcode(path: Path) -> dict:
+    """Время печати (с) и расход филамента из комментариев слайсера; файл целиком не читается."""
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        text = f.read(GCODE_SCAN)
+        if size > GCODE_SCAN:
+            f.seek(max(GCODE_SCAN, size - GCODE_SCAN))
+            text += b"\n" + f.read()
+    text = text.decode("utf-8", "ignore")
+
+    out = {}
+    for field, pattern, conv in GCODE_PATTERNS:
+        if field in out:
+            continue
+        m = pattern.search(text)
+        if not m:
+            continue
+        if conv == "duration":
+            value = _duration(m.group(1))
+        elif conv == "hours_minutes":
+            value = (int(m.group(1)) * 60 + int(m.group(2))) * 60
+        else:
+            value = conv(m.group(1))
+        if value is not None:
+            out[field] = round(value, 2) if isinstance(value, float) else value
+    return out
+
+
+def analyze_model(path: Path, filename: str) -> dict:
+    name = filename.lower()
+    if name.endswith(".stl"):
+        return analyze_stl(path)
+    if name.endswith((".gcode", ".gco", ".g")):
+        return analyze_gcode(path)
+    return {}
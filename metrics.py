@@ -0,0 +1,305 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger("Metrics")
+logger.setLevel(logging.INFO)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# С несколькими воркерами каждый раз в DUMP_INTERVAL пишет свои значения в METRICS_DIR/<pid>.json,
+# а /metrics суммирует файлы всех процессов. Каталог очищается при деплое, как у prometheus_client.
+METRICS_DIR = os.getenv("METRICS_DIR")
+DUMP_INTERVAL = 5.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def merge(self, target: dict, values: dict):
+        for key, value in values.items():
+            target[key] = target.get(key, 0) + value
+
+    def lines(self, values: dict):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        # collect() -> {labels: value} — значения, которые считаются в момент выгрузки
+        self.collect = collect
+
+    def inc(self, labels=(), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value: float):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [0] * (len(self.buckets) + 2)  # бакеты, count, sum
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += 1
+        state[-1] += value
+
+    def merge(self, target: dict, values: dict):
+        for key, state in values.items():
+            if key in target:
+                target[key] = [a + b for a, b in zip(target[key], state)]
+            else:
+                target[key] = list(state)
+
+    def lines(self, values: dict):
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {state[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {state[-2]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict:
+        out = {}
+        for m in self.metrics:
+            values = dict(m.values)
+            if isinstance(m, Gauge) and m.collect:
+                values.update(m.collect())
+            out[m.name] = [[list(k), v] for k, v in values.items()]
+        return out
+
+    def dump(self):
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _snapshots(self):
+        if not METRICS_DIR:
+            return [(True, self.snapshot())]
+        self.dump()
+        out = []
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith(".json"):
+                continue
+            pid = int(name[:-5])
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as f:
+                    out.append((_alive(pid), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    def render(self) -> str:
+        merged = {m.name: {} for m in self.metrics}
+        for alive, snap in self._snapshots():
+            for m in self.metrics:
+                # Счётчики умерших воркеров остаются в сумме, их текущие значения (gauge) — нет
+                if isinstance(m, Gauge) and not alive:
+                    continue
+                m.merge(merged[m.name], {tuple(k): v for k, v in snap.get(m.name, [])})
+        out = []
+        for m in self.metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.lines(merged[m.name]))
+        return "\n".join(out) + "\n"
+
+    async def dump_loop(self):
+        while True:
+            await asyncio.sleep(DUMP_INTERVAL)
+            try:
+                await asyncio.to_thread(self.dump)
+            except OSError:
+                logger.exception("Metrics dump failed")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry()
+
+REQUESTS = registry.add(Counter(
+    "http_requests_total", "Запросы к API по маршруту и коду ответа", ("method", "route", "status")
+))
+LATENCY = registry.add(Histogram(
+    "http_request_duration_seconds", "Время обработки запроса до конца ответа", ("method", "route")
+))
+IN_FLIGHT = registry.add(Gauge("http_requests_in_flight", "Запросы в обработке (включая SSE-подписки)"))
+REQUEST_QUERIES = registry.add(Histogram(
+    "http_request_db_queries", "Число SQL-запросов на один HTTP-запрос", ("route",), QUERY_COUNT_BUCKETS
+))
+REQUEST_DB_TIME = registry.add(Histogram(
+    "http_request_db_seconds", "Суммарное время SQL на один HTTP-запрос", ("route",), DB_BUCKETS
+))
+QUERY_TIME = registry.add(Histogram(
+    "db_query_duration_seconds", "Время выполнения SQL-запроса", ("engine", "operation"), DB_BUCKETS
+))
+POOL = registry.add(Gauge(
+    "db_pool_connections", "Соединения пула: checked_out — выданы, idle — свободны, overflow — сверх pool_size",
+    ("engine", "state"), collect=lambda: _pool_values(),
+))
+
+_engines = {}
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+current_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+def instrument_engine(name: str, engine):
+    """SQLAlchemy engine events: время каждого запроса и учёт в статистике текущего HTTP-запроса."""
+    _engines[name] = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            operation = "OTHER"
+        QUERY_TIME.observe((name, operation), elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+
+def _pool_values():
+    out = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        out[(name, "checked_out")] = pool.checkedout()
+        out[(name, "idle")] = pool.checkedin()
+        out[(name, "overflow")] = max(0, pool.overflow())
+    return out
+
+
+def route_label(scope) -> str:
+    # Шаблон маршрута (/api/cancel_booking/{booking_id}), а не путь: иначе ряд на каждый id
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: задержка, коды ответов, запросы в работе и SQL на запрос для /metrics.
+    С profiler — снимает профиль запросов, для которых allow_profile(scope) разрешает X-Profile.
+    """
+
+    def __init__(self, app, profiler=None, allow_profile=None):
+        self.app = app
+        self.profiler = profiler
+        self.allow_profile = allow_profile
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        profile = None
+        if self.profiler and any(k == b"x-profile" for k, _ in scope["headers"]):
+            if self.allow_profile is None or self.allow_profile(scope):
+                profile = self.profiler.begin()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile is not None:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            route = route_label(scope)
+            REQUESTS.inc((scope["method"], route, str(status)))
+            LATENCY.observe((scope["method"], route), elapsed)
+            REQUEST_QUERIES.observe((route,), stats.queries)
+            REQUEST_DB_TIME.observe((route,), stats.db_time)
+            current_request.reset(token)
+            if profile is not None:
+                self.profiler.end(profile, f"{scope['method']} {scope['path']}", elapsed, stats)
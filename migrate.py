@@ -0,0 +1,94 @@
+"""
+Миграция схемы — отдельный шаг деплоя, а не побочный эффект импорта приложения:
+
+    python -m migrate
+
+Создаёт недостающие таблицы, добавляет в существующие недостающие колонки и индексы моделей
+из db.py, применяет ограничения броней и поиск, затем записывает SCHEMA_VERSION.
+При старте API только сверяет версию (check_schema) — воркеры не гоняют DDL наперегонки.
+"""
+import logging
+import os
+
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.schema import CreateIndex
+from sqlmodel import SQLModel, select
+
+from analytics import rebuild_on
+from db import SchemaVersion, UsageDaily, engine, ensure_booking_constraints, ensure_model_search, get_async_session
+
+logger = logging.getLogger("Migrate")
+logger.setLevel(logging.INFO)
+
+# Увеличивать при каждом изменении моделей в db.py
+SCHEMA_VERSION = 3
+MIGRATE_ON_START = os.getenv("MIGRATE_ON_START") == "1"
+MIGRATION_LOCK = 7_310_001
+
+
+def add_missing_columns(conn):
+    insp = inspect(conn)
+    existing_tables = set(insp.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {c["name"] for c in insp.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            # Старые строки получают значение по умолчанию модели (printer_id = 1 и т.п.);
+            # колонка без него добавляется допускающей NULL
+            if column.default is not None and column.default.is_scalar:
+                value = literal(column.default.arg, column.type).compile(
+                    dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+                )
+                ddl += f" DEFAULT {value}" + ("" if column.nullable else " NOT NULL")
+            conn.exec_driver_sql(ddl)
+            logger.info("added %s.%s", table.name, column.name)
+        indexes = {i["name"] for i in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+                logger.info("created index %s", index.name)
+
+
+def migrate() -> int:
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Два одновременных деплоя не должны применять DDL параллельно
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK})
+        fresh_rollups = not inspect(conn).has_table(UsageDaily.__tablename__)
+        SQLModel.metadata.create_all(conn)
+        add_missing_columns(conn)
+        ensure_booking_constraints(conn)
+        ensure_model_search(conn)
+        if fresh_rollups:
+            # Сводки аналитики появились в версии 3: заполняются по уже накопленной истории броней
+            logger.info("analytics rollups: %s", rebuild_on(conn))
+        row = conn.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1)).first()
+        if row is None:
+            conn.execute(SchemaVersion.__table__.insert().values(id=1, version=SCHEMA_VERSION))
+        else:
+            conn.execute(SchemaVersion.__table__.update().values(version=SCHEMA_VERSION))
+    logger.info("schema is at version %d", SCHEMA_VERSION)
+    return SCHEMA_VERSION
+
+
+async def check_schema():
+    """Для lifespan: падает с понятной ошибкой, если миграцию не запускали."""
+    try:
+        async with get_async_session() as s:
+            version = (await s.exec(select(SchemaVersion.version).where(SchemaVersion.id == 1))).first()
+    except Exception:
+        version = None
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Схема БД версии {version}, нужна {SCHEMA_VERSION}: выполните python -m migrate "
+            f"(или MIGRATE_ON_START=1 для одного процесса)"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate()
@@ -0,0 +1,210 @@
+"""
+Файлы модерации. Перенос одобренных старых загрузок из uploads/pending в uploads/models и удаление
+файлов отклонённых заявок идут в пуле потоков, а не в event loop. Блобы общие (одинаковая загрузка
+хранится один раз), поэтому удаляется только то, на что не ссылается ни модель библиотеки,
+ни заявка, ещё ждущая модерации. PendingSweeper (в процессе-лидере) периодически убирает то,
+что осталось без ссылок: файлы в uploads/pending, блобы с превью и недописанные .part.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import union
+from sqlmodel import select
+
+from db import ModelItem, PendingModel, get_async_session
+from storage import BLOB_DIR, BLOB_HASH_RE, blob_path
+from thumbnails import THUMB_DIR, THUMB_NAME_RE, THUMB_SIZES, thumb_path
+
+logger = logging.getLogger("Moderation")
+logger.setLevel(logging.INFO)
+
+FILE_WORKERS = int(os.getenv("FILE_WORKERS", "4"))
+FILE_CHUNK = 100
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "3600"))
+# Файлы, изменённые недавно, не удаляются: загрузка с тем же содержимым могла ещё не дойти
+# до записи в БД (store_blob обновляет mtime существующего блоба)
+SWEEP_GRACE = float(os.getenv("SWEEP_GRACE", "600"))
+
+
+def _move(pairs) -> int:
+    moved = 0
+    for src, dst in pairs:
+        try:
+            os.replace(src, dst)
+            moved += 1
+        except FileNotFoundError:
+            pass
+    return moved
+
+
+def _remove(paths, before: float) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            if path.stat().st_mtime < before:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _scan(directory: Path, pattern: str, before: float):
+    """Файлы directory по шаблону, не менявшиеся с before."""
+    out = []
+    for path in directory.glob(pattern):
+        try:
+            if path.is_file() and path.stat().st_mtime < before:
+                out.append(path)
+        except FileNotFoundError:
+            pass
+    return out
+
+
+class FileOps:
+    """Файловые операции пачками по FILE_CHUNK в пуле потоков: переносы и удаления идут параллельно."""
+
+    def __init__(self, workers: int = FILE_WORKERS, grace: float = SWEEP_GRACE):
+        self.workers = workers
+        self.grace = grace
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="files")
+        return self._pool
+
+    async def _chunked(self, fn, items, *args) -> int:
+        loop = asyncio.get_running_loop()
+        done = await asyncio.gather(*(
+            loop.run_in_executor(self._executor(), fn, items[i:i + FILE_CHUNK], *args)
+            for i in range(0, len(items), FILE_CHUNK)
+        ))
+        return sum(done)
+
+    async def move(self, pairs) -> int:
+        return await self._chunked(_move, list(pairs))
+
+    async def remove(self, paths) -> int:
+        return await self._chunked(_remove, list(paths), time.time() - self.grace)
+
+    async def scan(self, directory: Path, pattern: str):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor(), _scan, directory, pattern, time.time() - self.grace
+        )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+files = FileOps()
+
+
+def blob_files(sha256: str):
+    return [blob_path(sha256), *(thumb_path(sha256, size) for size in THUMB_SIZES)]
+
+
+def referenced_hashes():
+    """sha256 блобов, на которые ссылаются модели библиотеки и заявки, ждущие модерации."""
+    waiting = PendingModel.moderated == False
+    return union(
+        select(ModelItem.file_hash), select(ModelItem.image_hash),
+        select(PendingModel.file_hash).where(waiting), select(PendingModel.image_hash).where(waiting),
+    )
+
+
+async def unreferenced(session, hashes) -> set:
+    hashes = {h for h in hashes if h}
+    if not hashes:
+        return set()
+    refs = referenced_hashes().subquery()
+    used = (await session.exec(select(refs.c[0]).where(refs.c[0].in_(hashes)))).all()
+    return hashes - set(used)
+
+
+async def unreferenced_pending(session, pending_dir: Path, names) -> list:
+    """Файлы старых загрузок в pending_dir, которые не нужны ни одной заявке на модерации."""
+    names = set(names)
+    if not names:
+        return []
+    used = (await session.exec(
+        select(PendingModel.filename).where(
+            PendingModel.moderated == False, PendingModel.file_hash == None, PendingModel.filename.in_(names)
+        )
+    )).all()
+    return [pending_dir / name for name in names - set(used)]
+
+
+class PendingSweeper:
+    """
+    Периодическая уборка файлов без ссылок, старше grace секунд:
+    - uploads/pending: файл заявки, которой нет среди ждущих модерации. Если под этим именем есть
+      старая модель библиотеки, а в uploads/models файла нет, — перенос прервался, файл доносится;
+    - блобы и превью, на которые никто не ссылается;
+    - .part, оставшиеся от оборванных загрузок.
+    """
+
+    def __init__(self, pending_dir: Path, models_dir: Path, interval: float = SWEEP_INTERVAL, ops: FileOps = files):
+        self.pending_dir = pending_dir
+        self.models_dir = models_dir
+        self.interval = interval
+        self.ops = ops
+        self._task = None
+
+    async def sweep_pending(self):
+        paths = await self.ops.scan(self.pending_dir, "*")
+        if not paths:
+            return 0, 0
+        async with get_async_session() as s:
+            orphans = await unreferenced_pending(s, self.pending_dir, [p.name for p in paths])
+            names = [p.name for p in orphans]
+            library = set((await s.exec(
+                select(ModelItem.filename).where(ModelItem.file_hash == None, ModelItem.filename.in_(names))
+            )).all()) if names else set()
+        unfinished = [(p, self.models_dir / p.name) for p in orphans if p.name in library]
+        unfinished = [(src, dst) for src, dst in unfinished if not dst.exists()]
+        moved = await self.ops.move(unfinished)
+        removed = await self.ops.remove(p for p in orphans if p.name not in library or (self.models_dir / p.name).exists())
+        return moved, removed
+
+    async def sweep_blobs(self):
+        blobs = await self.ops.scan(BLOB_DIR, "??/*")
+        thumbs = await self.ops.scan(THUMB_DIR, "??/*.webp")
+        hashes = {p.name for p in blobs if BLOB_HASH_RE.fullmatch(p.name)}
+        for p in thumbs:
+            if m := THUMB_NAME_RE.fullmatch(p.name):
+                hashes.add(m.group(1))
+        async with get_async_session() as s:
+            orphans = await unreferenced(s, hashes)
+        parts = await self.ops.scan(BLOB_DIR, ".*.part")
+        return await self.ops.remove([*(f for h in orphans for f in blob_files(h)), *parts])
+
+    async def sweep(self) -> dict:
+        moved, removed = await self.sweep_pending()
+        blobs = await self.sweep_blobs()
+        if moved or removed or blobs:
+            logger.info("Sweep: %d pending files moved, %d removed, %d blob files removed", moved, removed, blobs)
+        return {"pending_moved": moved, "pending_removed": removed, "blob_files_removed": blobs}
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
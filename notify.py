@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from auth import BOT_TOKEN
+from db import Booking, Notification, get_async_session
+from metrics import Counter, registry
+
+logger = logging.getLogger("Notifier")
+logger.setLevel(logging.INFO)
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Telegram: не больше ~30 сообщений в секунду на бота и одного в секунду в один чат
+GLOBAL_RATE = float(os.getenv("NOTIFY_RATE", "25"))
+CHAT_INTERVAL = 1.0
+SEND_CONCURRENCY = 16
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 5.0
+MAX_TEXT = 4096
+POLL_INTERVAL = 10.0
+REMIND_BEFORE = timedelta(minutes=int(os.getenv("REMIND_BEFORE_MIN", "15")))
+REMIND_INTERVAL = 60.0
+KEEP_SENT = timedelta(days=7)
+
+MESSAGES = registry.add(Counter(
+    "telegram_messages_total", "Сообщения в Telegram: sent, retry (429, 5xx, сеть), failed", ("result",)
+))
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity про запас; pause() — ответ на 429 с retry_after."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+def enqueue(session, chat_id: int, text: str, key: str = None, send_after: datetime = None):
+    """Сообщение в очередь в транзакции вызывающего: уйдёт, только если изменение закоммичено."""
+    if not chat_id:
+        return
+    session.add(Notification(chat_id=chat_id, text=text, key=key, send_after=send_after or datetime.utcnow()))
+
+
+async def enqueue_many(session, messages):
+    """Пачка сообщений [(chat_id, text)] одним INSERT в транзакции вызывающего — для пакетных операций."""
+    now = datetime.utcnow()
+    rows = [
+        {"chat_id": chat_id, "text": text, "key": None, "status": "pending", "attempts": 0,
+         "created_at": now, "send_after": now}
+        for chat_id, text in messages if chat_id
+    ]
+    if rows:
+        await session.execute(insert(Notification), rows)
+
+
+def coalesce(rows):
+    """Подряд идущие сообщения одного чата — одним сообщением, пока влезают в MAX_TEXT."""
+    taken, parts, size = [], [], 0
+    for row in rows:
+        extra = len(row.text) + (2 if parts else 0)
+        if parts and size + extra > MAX_TEXT:
+            break
+        taken.append(row)
+        parts.append(row.text[:MAX_TEXT])
+        size += extra
+    return taken, "\n\n".join(parts)
+
+
+class Notifier:
+    """
+    Отправка очереди Notification в Telegram. Работает в процессе-лидере (cluster.py), как и очередь печати.
+    Общий token bucket держит темп бота, для каждого чата — не чаще CHAT_INTERVAL; сообщения чата,
+    накопившиеся к отправке, уходят одним. 429 останавливает все отправки на retry_after, 5xx и сетевые
+    ошибки повторяются с задержкой, 400/403 (чат не найден, бот заблокирован) — сразу failed.
+    Отдельный цикл раз в REMIND_INTERVAL ставит напоминания о бронях, начинающихся в ближайшие REMIND_BEFORE.
+    """
+
+    def __init__(self, token: str = BOT_TOKEN, api_url: str = TELEGRAM_API_URL, rate: float = GLOBAL_RATE,
+                 chat_interval: float = CHAT_INTERVAL, concurrency: int = SEND_CONCURRENCY):
+        self.token = token
+        self.api_url = api_url.rstrip("/")
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.concurrency = concurrency
+        self._chat_ready = {}
+        self._wake = asyncio.Event()
+        self._client = None
+        self._tasks = []
+
+    async def start(self):
+        if not self.token:
+            logger.warning("BOT_TOKEN не задан: уведомления копятся в очереди, но не отправляются")
+            return
+        self._client = httpx.AsyncClient(
+            base_url=f"{self.api_url}/bot{self.token}",
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self._tasks = [asyncio.create_task(self._dispatch()), asyncio.create_task(self._remind())]
+        logger.info("Notifier started, %.0f msg/s", self.bucket.rate)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def send_due(self) -> int:
+        """Один проход по очереди; возвращает число подошедших уведомлений (0 — очередь пуста)."""
+        now = datetime.utcnow()
+        async with get_async_session() as s:
+            rows = (await s.exec(
+                select(Notification)
+                .where(Notification.status == "pending", Notification.send_after <= now)
+                .order_by(Notification.id)
+                .limit(BATCH_SIZE)
+            )).all()
+        chats = OrderedDict()
+        for row in rows:
+            chats.setdefault(row.chat_id, []).append(row)
+        clock = time.monotonic()
+        ready = [(chat, chat_rows) for chat, chat_rows in chats.items() if self._chat_ready.get(chat, 0) <= clock]
+        if not ready:
+            if chats:
+                await asyncio.sleep(min(self._chat_ready[c] for c in chats) - clock)
+            return len(rows)
+
+        sem = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._send_chat(sem, chat, chat_rows) for chat, chat_rows in ready))
+        await self._record(results)
+        # Отметки о готовности чатов нужны только на CHAT_INTERVAL вперёд
+        clock = time.monotonic()
+        self._chat_ready = {c: t for c, t in self._chat_ready.items() if t > clock}
+        return len(rows)
+
+    async def _send_chat(self, sem, chat_id: int, rows):
+        taken, text = coalesce(rows)
+        async with sem:
+            await self.bucket.acquire()
+            self._chat_ready[chat_id] = time.monotonic() + self.chat_interval
+            try:
+                r = await self._client.post("/sendMessage", json={"chat_id": chat_id, "text": text})
+            except httpx.HTTPError as e:
+                return taken, "retry", str(e) or type(e).__name__
+        if r.status_code == 200:
+            return taken, "sent", None
+        try:
+            body = r.json()
+        except ValueError:
+            body = {}
+        description = body.get("description") or f"HTTP {r.status_code}"
+        if r.status_code == 429:
+            retry_after = float(body.get("parameters", {}).get("retry_after", 1))
+            logger.warning("Telegram flood limit, pause %.0f s", retry_after)
+            self.bucket.pause(retry_after)
+            self._chat_ready[chat_id] = time.monotonic() + retry_after
+            return taken, "retry", description
+        if r.status_code >= 500:
+            return taken, "retry", description
+        return taken, "failed", description
+
+    async def _record(self, results):
+        now = datetime.utcnow()
+        async with get_async_session() as s:
+            for taken, result, error in results:
+                MESSAGES.inc((result,))
+                ids = [row.id for row in taken]
+                if result == "sent":
+                    await s.execute(
+                        update(Notification).where(Notification.id.in_(ids)).values(status="sent", sent_at=now, error=None)
+                    )
+                    continue
+                attempts = max(row.attempts for row in taken) + 1
+                if result == "retry" and attempts < MAX_ATTEMPTS:
+                    delay = RETRY_BACKOFF * 2 ** attempts * (0.5 + random.random() / 2)
+                    values = {"send_after": now + timedelta(seconds=delay)}
+                else:
+                    values = {"status": "failed"}
+                    logger.warning("Notification to %s failed: %s", taken[0].chat_id, error)
+                await s.execute(
+                    update(Notification).where(Notification.id.in_(ids)).values(attempts=attempts, error=error, **values)
+                )
+            await s.commit()
+
+    async def remind(self, now: datetime = None) -> int:
+        """Напоминания о бронях, которые начнутся в ближайшие REMIND_BEFORE; повторно не ставятся (key)."""
+        now = now or datetime.utcnow()
+        async with get_async_session() as s:
+            upcoming = (await s.exec(
+                select(Booking.id, Booking.tg_user, Booking.printer_id, Booking.start_at, Booking.end_at)
+                .where(Booking.status == "active", Booking.start_at > now, Booking.start_at <= now + REMIND_BEFORE)
+            )).all()
+            if not upcoming:
+                return 0
+            keys = {f"reminder:{b.id}": b for b in upcoming}
+            queued = set()
+            for i in range(0, len(keys), BATCH_SIZE):
+                chunk = list(keys)[i:i + BATCH_SIZE]
+                queued.update((await s.exec(select(Notification.key).where(Notification.key.in_(chunk)))).all())
+            for key, b in keys.items():
+                if key not in queued:
+                    enqueue(s, b.tg_user, reminder_text(b), key=key)
+            try:
+                await s.commit()
+            except IntegrityError:
+                # Тот же набор уже поставил другой процесс (смена лидера) — следующий проход доберёт остальное
+                await s.rollback()
+                return 0
+        return len(keys) - len(queued)
+
+    async def cleanup(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        async with get_async_session() as s:
+            old = (
+                select(Notification.id)
+                .where(Notification.status != "pending", Notification.created_at < now - KEEP_SENT)
+                .limit(BATCH_SIZE * 10)
+            )
+            await s.execute(delete(Notification).where(Notification.id.in_(old)))
+            await s.commit()
+
+    async def _dispatch(self):
+        while True:
+            try:
+                due = await self.send_due()
+            except Exception:
+                logger.exception("Notification dispatch failed")
+                due = 0
+            if due:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _remind(self):
+        while True:
+            try:
+                if await self.remind():
+                    self.wake()
+                await self.cleanup()
+            except Exception:
+                logger.exception("Booking reminders failed")
+            await asyncio.sleep(REMIND_INTERVAL)
+
+
+def reminder_text(booking) -> str:
+    return f"Напоминание: ваша бронь принтера {booking.printer_id} начинается в {booking.start_at:%H:%M} (до {booking.end_at:%H:%M})."
+
+
+def cancelled_text(booking) -> str:
+    return f"Администратор отменил вашу бронь принтера {booking.printer_id} на {booking.start_at:%d.%m %H:%M}–{booking.end_at:%H:%M}."
+
+
+def approved_text(title: str) -> str:
+    return f"Модель «{title}» одобрена и добавлена в библиотеку."
+
+
+def rejected_text(title: str) -> str:
+    return f"Модель «{title}» отклонена модератором."
+
+
+notifier = Notifier()
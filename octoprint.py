@@ -1,17 +1,194 @@
 import logging
 import asyncio
+import random
+import secrets
+import time
 from datetime import datetime
+from pathlib import Path
+
+import aiofiles
+import aiofiles.os
+import httpx
 
 logger = logging.getLogger("FakeOctoPrint")
 logger.setLevel(logging.INFO)
 
-async def send_to_printer(file_path: str, user_id: int):
-    logger.info(f"[OCTOPRINT] Пользователь {user_id} отправил модель '{file_path}' на печать.")
-    await asyncio.sleep(1)
-    logger.info(f"[OCTOPRINT] Печать модели '{file_path}' успешно (фиктивно) началась!")
+BUSY_STATES = {"Printing", "Pausing", "Paused", "Starting", "Cancelling"}
+
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+UPLOAD_TIMEOUT = httpx.Timeout(300.0, connect=5.0)
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = {502, 503, 504}
+# Ошибки, при которых запрос точно не дошёл до OctoPrint — их можно повторять даже для загрузки
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+STATUS_TTL = 1.0
+UPLOAD_CHUNK = 1024 * 1024
+
+
+async def multipart_file(path: Path, fields: dict):
+    """
+    multipart/form-data с полями fields и файлом path: тело — асинхронный генератор, файл читается
+    кусками через aiofiles. Синхронный файл в files= httpx читал бы гигабайтный G-code прямо в event loop.
+    """
+    boundary = secrets.token_hex(16)
+    head = "".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in fields.items()
+    )
+    filename = path.name.replace("\\", "\\\\").replace('"', '\\"')
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    )
+    head, tail = head.encode(), f"\r\n--{boundary}--\r\n".encode()
+    size = (await aiofiles.os.stat(path)).st_size
+
+    async def body():
+        yield head
+        async with aiofiles.open(path, "rb") as f:
+            while chunk := await f.read(UPLOAD_CHUNK):
+                yield chunk
+        yield tail
+
+    return body(), {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + size + len(tail)),
+    }
+
+
+class OctoPrintClient:
+    """
+    Клиент OctoPrint REST API для одного принтера.
+    Держит постоянный пул keep-alive соединений, повторяет сбойные запросы с экспоненциальной
+    задержкой и склеивает одновременные запросы статуса в один поход к принтеру.
+    """
+
+    def __init__(self, base_url: str, api_key: str = None, retries: int = RETRIES, backoff: float = BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"X-Api-Key": api_key or ""},
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=60),
+        )
+        self._status = None
+        self._status_at = 0.0
+        self._status_task = None
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * 2 ** attempt * (0.5 + random.random() / 2)
+
+    async def _send(self, make_request, idempotent: bool = True) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                r = await make_request()
+                # Загрузку с print=true нельзя повторять после ответа: OctoPrint мог уже запустить печать
+                if r.status_code not in RETRY_STATUSES or not idempotent or attempt >= self.retries:
+                    r.raise_for_status()
+                    return r
+                logger.warning("%s: HTTP %s, retry %d", self.base_url, r.status_code, attempt + 1)
+            except CONNECT_ERRORS as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning("%s: %s, retry %d", self.base_url, e, attempt + 1)
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= self.retries:
+                    raise
+                logger.warning("%s: %s, retry %d", self.base_url, e, attempt + 1)
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def get(self, url: str, timeout=DEFAULT_TIMEOUT) -> dict:
+        r = await self._send(lambda: self._client.get(url, timeout=timeout))
+        return r.json()
+
+    async def upload(self, file_path: str, print_after: bool = True, timeout=UPLOAD_TIMEOUT) -> dict:
+        """Загружает G-code потоком с диска (multipart) и при print_after сразу запускает печать."""
+        path = Path(file_path)
+        fields = {"select": "true", "print": "true" if print_after else "false"}
+
+        async def attempt():
+            body, headers = await multipart_file(path, fields)
+            return await self._client.post("/api/files/local", content=body, headers=headers, timeout=timeout)
+
+        r = await self._send(attempt, idempotent=False)
+        self._status_at = 0.0
+        return r.json()
+
+    async def _fetch_status(self) -> dict:
+        job, printer = await asyncio.gather(self.get("/api/job"), self.get("/api/printer"), return_exceptions=True)
+        if isinstance(job, Exception):
+            raise job
+        status = {"state": job.get("state"), "job": job.get("job"), "progress": job.get("progress")}
+        if not isinstance(printer, Exception):
+            status["temperature"] = printer.get("temperature")
+        self._status, self._status_at = status, time.monotonic()
+        return status
+
+    async def status(self, max_age: float = STATUS_TTL) -> dict:
+        if self._status is not None and time.monotonic() - self._status_at < max_age:
+            return self._status
+        if self._status_task is None or self._status_task.done():
+            self._status_task = asyncio.ensure_future(self._fetch_status())
+        return await asyncio.shield(self._status_task)
+
+
+_clients = {}
+
+
+def get_client(printer) -> OctoPrintClient:
+    key = (printer.octoprint_url, printer.api_key)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = OctoPrintClient(printer.octoprint_url, printer.api_key)
+    return client
+
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+
+async def send_to_printer(file_path: str, user_id: int, printer=None):
+    if printer is None or not printer.octoprint_url:
+        logger.info(f"[OCTOPRINT] Пользователь {user_id} отправил модель '{file_path}' на печать.")
+        await asyncio.sleep(1)
+        logger.info(f"[OCTOPRINT] Печать модели '{file_path}' успешно (фиктивно) началась!")
+    else:
+        logger.info(f"[OCTOPRINT] {printer.name}: загрузка '{file_path}' от пользователя {user_id}")
+        await get_client(printer).upload(file_path)
 
     return {
         "success": True,
         "file": file_path,
+        "printer": getattr(printer, "name", None),
         "timestamp": datetime.now().isoformat()
     }
+
+
+async def printer_status(printer, max_age: float = STATUS_TTL) -> dict:
+    if printer is None or not printer.octoprint_url:
+        return {"state": "Operational", "simulated": True}
+    return await get_client(printer).status(max_age)
+
+
+async def poll_printers(printers, max_age: float = STATUS_TTL) -> dict:
+    """Статусы нескольких принтеров разом: запросы идут параллельно, ошибки не валят остальных."""
+    results = await asyncio.gather(*(printer_status(p, max_age) for p in printers), return_exceptions=True)
+    return {
+        p.id: ({"state": "Offline", "error": str(r)} if isinstance(r, Exception) else r)
+        for p, r in zip(printers, results)
+    }
+
+
+async def printer_busy(printer) -> bool:
+    status = await printer_status(printer, max_age=0)
+    return status.get("state") in BUSY_STATES
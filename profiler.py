@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger("Profiler")
+logger.setLevel(logging.INFO)
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_KEEP = 50
+MAX_DEPTH = 64
+
+
+class Profile:
+    __slots__ = ("id", "task", "frame", "thread", "samples", "started", "summary")
+
+    def __init__(self, id: str, task, frame, thread: int):
+        self.id = id
+        self.task = task
+        self.frame = frame
+        self.thread = thread
+        self.samples = Counter()
+        self.started = time.time()
+        self.summary = None
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _awaited_frames(coro):
+    """Цепочка await приостановленной корутины, от внешней к внутренней."""
+    frames = []
+    while coro is not None and len(frames) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class SamplingProfiler:
+    """
+    Профиль отдельного запроса в продакшене, по заголовку X-Profile (см. MetricsMiddleware).
+    Пока профилируемые запросы выполняются, поток-сэмплер раз в PROFILE_INTERVAL смотрит на задачу
+    asyncio каждого: если она сейчас на CPU — берётся стек потока event loop, если ждёт (БД, сеть) —
+    цепочка её await. Остальные запросы это не замедляет; сэмплер останавливается, когда профилей нет.
+    Результат — collapsed stacks (flamegraph.pl, speedscope), корень cpu или wait, вес — миллисекунды:
+    пока на loop идёт вычисление, сэмплер получает GIL реже, и простой счёт отсчётов занизил бы CPU.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, keep: int = PROFILE_KEEP):
+        self.interval = interval
+        self.keep = keep
+        self.done = OrderedDict()
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self) -> Profile:
+        # Вызывается из middleware: текущий кадр — граница, выше которой стек не интересен
+        profile = Profile(
+            f"{os.getpid()}-{next(self._ids)}", asyncio.current_task(), sys._getframe(1), threading.get_ident()
+        )
+        with self._lock:
+            self._active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def end(self, profile: Profile, title: str, elapsed: float, stats=None):
+        with self._lock:
+            self._active.pop(profile.id, None)
+        profile.task = profile.frame = None
+        total = sum(profile.samples.values())
+        cpu = sum(ms for stack, ms in profile.samples.items() if stack.startswith("cpu"))
+        profile.summary = {
+            "id": profile.id,
+            "request": title,
+            "ms": round(elapsed * 1000, 1),
+            "sampled_ms": total,
+            "cpu_share": round(cpu / total, 2) if total else None,
+            "db_queries": stats.queries if stats else None,
+            "db_ms": round(stats.db_time * 1000, 1) if stats else None,
+        }
+        self.done[profile.id] = profile
+        while len(self.done) > self.keep:
+            self.done.popitem(last=False)
+        logger.info("Profile %s: %s %.1f ms, cpu %s", profile.id, title, elapsed * 1000, profile.summary["cpu_share"])
+
+    def collapsed(self, profile_id: str):
+        profile = self.done.get(profile_id)
+        if profile is None:
+            return None
+        return "".join(f"{stack} {n}\n" for stack, n in profile.samples.most_common())
+
+    def summaries(self):
+        return [p.summary for p in reversed(self.done.values())]
+
+    def _sample(self, profile: Profile, frames, weight: int):
+        thread_frame = frames.get(profile.thread)
+        stack = []
+        frame = thread_frame
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(frame)
+            if frame is profile.frame:
+                break
+            frame = frame.f_back
+        if stack and stack[-1] is profile.frame:
+            kind = "cpu"
+            stack.reverse()
+        else:
+            task = profile.task
+            if task is None or task.done():
+                return
+            chain = _awaited_frames(task.get_coro())
+            if profile.frame in chain:
+                chain = chain[chain.index(profile.frame):]
+            kind, stack = "wait", chain
+        if stack:
+            profile.samples[";".join([kind] + [_label(f) for f in stack])] += weight
+
+    def _run(self):
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._thread = None
+                    return
+            now = time.perf_counter()
+            weight = max(1, round((now - last) * 1000))
+            last = now
+            frames = sys._current_frames()
+            for profile in active:
+                try:
+                    self._sample(profile, frames, weight)
+                except Exception:
+                    # Корутина может завершиться прямо во время обхода — такой отсчёт пропускается
+                    pass
+            del frames
+            time.sleep(self.interval)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, update
+from sqlmodel import select
+
+from db import User, async_engine
+
+logger = logging.getLogger("ProfileSync")
+logger.setLevel(logging.INFO)
+
+FLUSH_INTERVAL = 10.0
+PROFILE_FIELDS = ("username", "first_name", "nickname")
+
+
+class ProfileSync:
+    """
+    tg_id → User в памяти процесса. Для знакомого пользователя бронь не читает таблицу User,
+    а изменения имени/ника копятся и раз в flush_interval пишутся одним UPDATE на всех.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_entries: int = 50_000):
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._known = OrderedDict()  # tg_id -> {"id", "username", "first_name", "nickname"}
+        self._dirty = set()
+        self._task = None
+
+    async def user_id(self, session, tg_user: int, username=None, first_name=None, nickname=None) -> int:
+        """
+        id пользователя для брони. Новый пользователь создаётся в сессии вызывающего (flush),
+        и запоминается только после его commit — см. remember().
+        """
+        fresh = {"username": username, "first_name": first_name, "nickname": nickname}
+        known = self._known.get(tg_user)
+        if known is not None:
+            self._known.move_to_end(tg_user)
+            if any(v and v != known[k] for k, v in fresh.items()):
+                known.update({k: v for k, v in fresh.items() if v})
+                self._dirty.add(tg_user)
+            return known["id"]
+
+        user = (await session.exec(select(User).where(User.tg_id == tg_user))).first()
+        if not user:
+            # Создаем нового пользователя
+            user = User(
+                tg_id=tg_user,
+                username=username or f"user_{tg_user}",
+                first_name=first_name,
+                nickname=nickname
+            )
+            session.add(user)
+        else:
+            # Строка уже прочитана — обновляем её сразу, вместе с бронью
+            for k, v in fresh.items():
+                if v and v != getattr(user, k):
+                    setattr(user, k, v)
+        await session.flush()
+        session.info.setdefault("profiles", []).append(user)
+        return user.id
+
+    def remember(self, session):
+        """Вызывается после успешного commit: пользователи сессии попадают в кэш."""
+        for user in session.info.pop("profiles", []):
+            self._known[user.tg_id] = {"id": user.id, **{k: getattr(user, k) for k in PROFILE_FIELDS}}
+            self._known.move_to_end(user.tg_id)
+        while len(self._known) > self.max_entries:
+            tg_id, entry = self._known.popitem(last=False)
+            if tg_id in self._dirty:
+                # Не теряем несохранённое изменение: запись дождётся ближайшего flush
+                self._known[tg_id] = entry
+                break
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        rows = [
+            {"uid": self._known[t]["id"], **{f"p_{k}": self._known[t][k] for k in PROFILE_FIELDS}}
+            for t in dirty if t in self._known
+        ]
+        if not rows:
+            return 0
+        stmt = (
+            update(User.__table__)
+            .where(User.__table__.c.id == bindparam("uid"))
+            .values({k: bindparam(f"p_{k}") for k in PROFILE_FIELDS})
+        )
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(stmt, rows)
+        except Exception:
+            self._dirty |= dirty
+            raise
+        return len(rows)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Profile flush failed")
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+profiles = ProfileSync()
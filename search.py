@@ -0,0 +1,72 @@
+import re
+
+from sqlalchemy import func, literal_column, or_, text
+from sqlmodel import select
+
+from db import ModelItem
+
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+MAX_TOKENS = 8
+
+_trigram = None
+
+
+def _like(text: str) -> str:
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+async def has_trigram_index(session) -> bool:
+    """Есть ли триграммный индекс по названию (pg_trgm ставится не везде). Проверяется один раз."""
+    global _trigram
+    if _trigram is None:
+        row = await session.execute(text("SELECT to_regclass('ix_modelitem_title_trgm') IS NOT NULL"))
+        _trigram = bool(row.scalar())
+    return _trigram
+
+
+def search_query(
+    dialect: str,
+    q: str = None,
+    max_x: float = None,
+    max_y: float = None,
+    max_z: float = None,
+    min_time: int = None,
+    max_time: int = None,
+    substring: bool = False,
+    columns=None,
+):
+    """
+    Поиск по библиотеке. В PostgreSQL — префиксный полнотекстовый поиск по tsvector (GIN)
+    по релевантности; substring добавляет совпадение подстроки в названии — только при
+    триграммном индексе, иначе OR с ILIKE превращает запрос в полный проход по таблице.
+    В SQLite — LIKE по каждому слову без учёта регистра (unicode_lower из db.py).
+    Фильтры по габаритам (мм) и времени печати (с) отбрасывают модели, у которых этих данных нет.
+    columns — выбрать только эти колонки вместо целых ModelItem.
+    """
+    stmt = select(*columns) if columns else select(ModelItem)
+    order = [ModelItem.uploaded_at.desc(), ModelItem.id.desc()]
+    tokens = SEARCH_TOKEN_RE.findall(q or "")[:MAX_TOKENS]
+    if tokens and dialect == "postgresql":
+        search = literal_column("modelitem.search")
+        tsq = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in tokens))
+        match = search.op("@@")(tsq)
+        if substring:
+            match = or_(match, ModelItem.title.ilike(_like(q.strip()), escape="\\"))
+        stmt = stmt.where(match)
+        order.insert(0, func.ts_rank(search, tsq).desc())
+    elif tokens:
+        for t in tokens:
+            pattern = _like(t.lower())
+            stmt = stmt.where(or_(
+                func.unicode_lower(ModelItem.title).like(pattern, escape="\\"),
+                func.unicode_lower(ModelItem.filename).like(pattern, escape="\\"),
+            ))
+
+    for column, limit in ((ModelItem.size_x, max_x), (ModelItem.size_y, max_y), (ModelItem.size_z, max_z)):
+        if limit is not None:
+            stmt = stmt.where(column <= limit)
+    if min_time is not None:
+        stmt = stmt.where(ModelItem.print_time >= min_time)
+    if max_time is not None:
+        stmt = stmt.where(ModelItem.print_time <= max_time)
+    return stmt.order_by(*order)
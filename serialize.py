@@ -0,0 +1,58 @@
+"""
+Выдача списков. Строки выбираются кортежами нужных колонок (без ORM-объектов), а даты и всё
+остальное кодирует orjson — без isoformat() и dict на каждую строку в Python-коде обработчика.
+Формат выбирается параметром format:
+- json — массив объектов, как раньше;
+- columns — параллельные массивы {"id": [...], "start": [...]}: имена полей не повторяются в каждой строке;
+- ndjson — объект на строку; с stream_rows строки читаются серверным курсором и уходят по мере чтения.
+"""
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+LIST_FORMATS = ("json", "columns", "ndjson")
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+STREAM_BATCH = 2000
+
+
+def check_format(format: str) -> str:
+    if format not in LIST_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format должен быть одним из: {', '.join(LIST_FORMATS)}")
+    return format
+
+
+def query_fields(query):
+    """Имена полей ответа — имена (label) выбранных колонок запроса."""
+    return tuple(query.selected_columns.keys())
+
+
+def ndjson_lines(fields, rows) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+
+def encode_rows(fields, rows, format: str = "json") -> bytes:
+    if format == "columns":
+        columns = zip(*rows) if rows else [()] * len(fields)
+        return orjson.dumps({name: list(values) for name, values in zip(fields, columns)})
+    if format == "ndjson":
+        return ndjson_lines(fields, rows)
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+
+def rows_response(fields, rows, format: str = "json", headers: dict = None) -> Response:
+    media_type = NDJSON if format == "ndjson" else JSON
+    return Response(encode_rows(fields, rows, format), media_type=media_type, headers=headers)
+
+
+def stream_rows(engine, query, batch: int = STREAM_BATCH) -> StreamingResponse:
+    """NDJSON для больших выборок: в памяти не больше одной пачки из batch строк."""
+    fields = query_fields(query)
+
+    async def body():
+        async with engine.connect() as conn:
+            result = await conn.stream(query.execution_options(yield_per=batch))
+            async for part in result.partitions():
+                yield ndjson_lines(fields, part)
+
+    return StreamingResponse(body(), media_type=NDJSON)
@@ -0,0 +1,108 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlmodel import select
+
+from db import Booking
+
+SLOT_DURATION_MIN = 60
+OPEN_HOUR = 9
+CLOSE_HOUR = 21
+# Бронь не может быть длиннее суток: это даёт нижнюю границу по start_at,
+# и выборка идёт по индексу (status, start_at, end_at) только в пределах окна.
+MAX_BOOKING_SPAN = timedelta(days=1)
+MAX_DAYS = 31
+MAX_BATCH = 200
+
+
+def day_slots(day: date):
+    step = timedelta(minutes=SLOT_DURATION_MIN)
+    start = datetime.combine(day, time(hour=OPEN_HOUR))
+    close = datetime.combine(day, time(hour=CLOSE_HOUR))
+    while start + step <= close:
+        yield start, start + step
+        start += step
+
+
+def sweep(intervals, slots, now: datetime):
+    """
+    Занятость слотов одним проходом.
+    intervals — пары (start_at, end_at), отсортированные по start_at; slots — по возрастанию начала.
+    Слот занят, если его начало накрыто бронью (start_at <= начало < end_at) или уже прошло.
+    """
+    out = []
+    i = 0
+    covered_until = None
+    for start, end in slots:
+        while i < len(intervals) and intervals[i][0] <= start:
+            if covered_until is None or intervals[i][1] > covered_until:
+                covered_until = intervals[i][1]
+            i += 1
+        busy = covered_until is not None and covered_until > start
+        out.append({"start": start.isoformat(), "end": end.isoformat(), "occupied": busy or start <= now})
+    return out
+
+
+def find_conflicts(requested, busy):
+    """
+    Запрошенные интервалы, пересекающиеся с занятыми. Оба списка — пары (start, end),
+    отсортированные по началу; занятые сначала склеиваются, дальше один проход двумя указателями.
+    """
+    merged = []
+    for start, end in busy:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    out = []
+    j = 0
+    for start, end in requested:
+        while j < len(merged) and merged[j][1] <= start:
+            j += 1
+        if j < len(merged) and merged[j][0] < end:
+            out.append((start, end))
+    return out
+
+
+RECURRENCE_STEP = {"daily": timedelta(days=1), "weekly": timedelta(weeks=1)}
+
+
+def expand_recurrence(start: datetime, end: datetime, freq: str, count: int, interval: int = 1):
+    """Повторы интервала: freq — daily/weekly, каждые interval периодов, всего count штук."""
+    step = RECURRENCE_STEP[freq] * interval
+    return [(start + step * i, end + step * i) for i in range(count)]
+
+
+async def load_busy(session, window_start: datetime, window_end: datetime, printer_id: int = None):
+    """Активные брони, пересекающие окно, — пары (start_at, end_at) по возрастанию начала."""
+    q = (
+        select(Booking.start_at, Booking.end_at)
+        .where(
+            Booking.status == "active",
+            Booking.start_at >= window_start - MAX_BOOKING_SPAN,
+            Booking.start_at < window_end,
+            Booking.end_at > window_start,
+        )
+        .order_by(Booking.start_at)
+    )
+    if printer_id is not None:
+        q = q.where(Booking.printer_id == printer_id)
+    return (await session.exec(q)).all()
+
+
+async def load_days(session, first_day: date, days: int = 1, now: datetime = None, printer_id: int = None):
+    now = now or datetime.utcnow()
+    window_start = datetime.combine(first_day, time.min)
+    window_end = window_start + timedelta(days=days)
+    rows = await load_busy(session, window_start, window_end, printer_id)
+
+    result = []
+    slots = [s for d in range(days) for s in day_slots(first_day + timedelta(days=d))]
+    flat = sweep(rows, slots, now)
+    per_day = len(flat) // days if days else 0
+    for d in range(days):
+        result.append({
+            "date": (first_day + timedelta(days=d)).isoformat(),
+            "slots": flat[d * per_day:(d + 1) * per_day],
+        })
+    return result
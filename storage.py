@@ -0,0 +1,121 @@
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+from urllib.parse import quote
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+CHUNK_SIZE = 1024 * 1024
+MAX_MODEL_SIZE = int(os.getenv("MAX_MODEL_MB", "512")) * 1024 * 1024
+MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_MB", "20")) * 1024 * 1024
+# Поля формы и заголовки частей multipart сверх самих файлов
+FORM_OVERHEAD = 1024 * 1024
+
+# Контентно-адресуемое хранилище: файл лежит по sha256 своего содержимого,
+# одинаковые загрузки занимают место один раз, а ссылки на них никогда не меняются.
+BLOB_DIR = Path(__file__).parent / "uploads" / "blobs"
+BLOB_HASH_RE = re.compile(r"[0-9a-f]{64}")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256
+
+
+def blob_url(sha256: str, name: str = None) -> str:
+    url = f"/storage/blob/{sha256}"
+    return f"{url}?name={quote(name)}" if name else url
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in tags
+
+
+def too_large(max_size: int, what: str = "Файл") -> str:
+    return f"{what} больше {max_size // (1024 * 1024)} МБ"
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI-middleware: лимит на всё тело запроса загрузки, limits — {путь: байт}.
+    Starlette отдаёт UploadFile в обработчик, только когда multipart уже принят целиком
+    и записан во временный файл, поэтому проверка в _spool сама по себе не бережёт ни диск, ни канал.
+    Content-Length больше лимита — 413 сразу, тело не читается; тело без длины (chunked)
+    обрывается 413, как только превысит лимит.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await JSONResponse({"detail": too_large(limit, "Запрос")}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI пропускает HTTPException из разбора тела как есть
+                    raise HTTPException(413, too_large(limit, "Запрос"))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _spool(upload: UploadFile, directory: Path, max_size: int):
+    """
+    Пишет загрузку во временный файл в directory кусками по CHUNK_SIZE, не держа её в памяти.
+    Возвращает (путь, sha256, размер в байтах). При превышении max_size — 413.
+    """
+    if upload.size is not None and upload.size > max_size:
+        raise HTTPException(413, too_large(max_size))
+
+    tmp = directory / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp, "wb") as out:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(413, too_large(max_size))
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, digest.hexdigest(), size
+
+
+async def store_blob(upload: UploadFile, max_size: int):
+    """Сохраняет загрузку в хранилище блобов. Возвращает (sha256, размер)."""
+    tmp, sha256, size = await _spool(upload, BLOB_DIR, max_size)
+    dest = blob_path(sha256)
+    try:
+        # Такой блоб уже есть. Свежий mtime: уборка (moderation.py) не удалит его,
+        # пока ссылка из новой заявки ещё не записана в БД
+        os.utime(dest)
+        tmp.unlink()
+    except FileNotFoundError:
+        dest.parent.mkdir(exist_ok=True)
+        os.replace(tmp, dest)
+    return sha256, size
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from storage import BLOB_DIR, blob_path
+
+logger = logging.getLogger("Thumbnails")
+logger.setLevel(logging.INFO)
+
+# Превью лежат рядом с блобами, по sha256 исходника: uploads/thumbs/ab/<sha>_160.webp
+THUMB_DIR = BLOB_DIR.parent / "thumbs"
+THUMB_SIZES = (160, 480)
+THUMB_NAME_RE = re.compile(r"([0-9a-f]{64})_(\d+)\.webp")
+# Пул свой у каждого процесса API, поэтому ядра делятся на WEB_CONCURRENCY воркеров
+THUMB_WORKERS = int(os.getenv(
+    "THUMB_WORKERS", str(max(1, (os.cpu_count() or 2) // 2 // int(os.getenv("WEB_CONCURRENCY", "1"))))
+))
+WEBP_QUALITY = 80
+
+PREVIEW_SIZE = 512
+SUPERSAMPLE = 2
+SAMPLES_PER_PIXEL = 2
+MAX_SAMPLES = 4_000_000
+MAX_TRIANGLES = 2_000_000
+MODEL_COLOR = np.array([70, 130, 200], dtype=np.float64)
+
+STL_DTYPE = np.dtype([("normal", "<f4", (3,)), ("v", "<f4", (3, 3)), ("attr", "<u2")])
+STL_VERTEX_RE = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+ASCII_STL_CHUNK = 4 * 1024 * 1024
+ASCII_LINE_MAX = 1024
+# Короче треугольник в ASCII STL не записать: оценка сверху их числа по размеру файла
+ASCII_FACET_MIN = 100
+
+
+def thumb_path(sha256: str, size: int) -> Path:
+    return THUMB_DIR / sha256[:2] / f"{sha256}_{size}.webp"
+
+
+def thumb_url(sha256: str, size: int) -> str:
+    return f"/storage/thumb/{sha256}_{size}.webp"
+
+
+def thumb_urls(thumb_hash: str):
+    if not thumb_hash:
+        return None
+    return {str(size): thumb_url(thumb_hash, size) for size in THUMB_SIZES}
+
+
+def thumb_source(filename: str, file_hash: str, image_hash: str):
+    """Что рендерить в превью: картинку, если она есть, иначе геометрию STL. (kind, sha256) или None."""
+    if image_hash:
+        return "image", image_hash
+    if file_hash and filename.lower().endswith(".stl"):
+        return "stl", file_hash
+    return None
+
+
+def ascii_stl_chunks(path: Path, chunk: int = ASCII_STL_CHUNK):
+    """Треугольники ASCII STL массивами (n, 3, 3) по кускам файла в chunk байт — файл целиком не читается."""
+    rest = b""
+    carry = np.zeros((0, 3))
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk)
+            data = rest + block
+            if block:
+                # Кусок режется по концу строки, хвост уходит в следующий. Без переводов строки — перед
+                # последним vertex, но хвост не длиннее ASCII_LINE_MAX: иначе мусор копил бы весь файл
+                cut = data.rfind(b"\n") + 1 or max(data.rfind(b"vertex"), len(data) - ASCII_LINE_MAX, 0)
+                data, rest = data[:cut], data[cut:]
+            pts = np.concatenate([carry, np.array(STL_VERTEX_RE.findall(data), dtype=np.float64).reshape(-1, 3)])
+            whole = len(pts) - len(pts) % 3
+            carry = pts[whole:]
+            if whole:
+                yield pts[:whole].reshape(-1, 3, 3)
+            if not block:
+                return
+
+
+def load_stl(path: Path, max_triangles: int = MAX_TRIANGLES) -> np.ndarray:
+    """Треугольники (n, 3, 3). Бинарный STL читается через memmap; большие сетки прореживаются."""
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        head = f.read(84)
+    count = int.from_bytes(head[80:84], "little") if len(head) == 84 else -1
+    if count >= 0 and size == 84 + STL_DTYPE.itemsize * count:
+        tris = np.memmap(path, dtype=STL_DTYPE, mode="r", offset=84, shape=(count,))["v"]
+    else:
+        # Шаг прореживания — по оценке сверху числа треугольников, чтобы не держать в памяти все
+        step = max(1, -(-size // ASCII_FACET_MIN // max_triangles))
+        kept, seen = [], 0
+        for part in ascii_stl_chunks(path):
+            kept.append(part[-seen % step::step])
+            seen += len(part)
+        tris = np.concatenate(kept) if kept else np.zeros((0, 3, 3))
+    step = max(1, -(-len(tris) // max_triangles))
+    tris = np.asarray(tris[::step], dtype=np.float64)
+    return tris[np.isfinite(tris).all(axis=(1, 2))]
+
+
+def view_matrix(yaw: float = 45.0, pitch: float = 30.0) -> np.ndarray:
+    # Z модели — вверх; смотрим сверху-сбоку, ось z результата направлена к зрителю
+    a, b = np.radians(yaw), np.radians(pitch)
+    rz = np.array([[np.cos(a), -np.sin(a), 0], [np.sin(a), np.cos(a), 0], [0, 0, 1]])
+    rx = np.array([[1, 0, 0], [0, np.sin(b), np.cos(b)], [0, -np.cos(b), np.sin(b)]])
+    return rx @ rz
+
+
+def render_stl(path: Path, size: int = PREVIEW_SIZE) -> Image.Image:
+    """
+    Превью STL без OpenGL: треугольники поворачиваются и проецируются ортографически,
+    по каждому набрасываются случайные точки пропорционально его площади на экране,
+    ближайшая точка в пикселе выигрывает (z-буфер через np.maximum.at). Всё — массивами NumPy.
+    """
+    tris = load_stl(path)
+    if not len(tris):
+        raise ValueError("пустой STL")
+    w = size * SUPERSAMPLE
+    v = (tris - tris.reshape(-1, 3).mean(axis=0)) @ view_matrix().T
+    extent = np.abs(v[..., :2]).max() or 1.0
+    scale = w * 0.45 / extent
+
+    normals = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    light = np.array([0.3, 0.5, 1.0]) / np.linalg.norm([0.3, 0.5, 1.0])
+    shade = 0.25 + 0.75 * np.abs(normals @ light) / np.where(lengths > 0, lengths, 1)
+
+    screen_area = 0.5 * np.abs(normals[:, 2]) * scale * scale
+    counts = np.ceil(screen_area * SAMPLES_PER_PIXEL).astype(np.int64) + 1
+    if counts.sum() > MAX_SAMPLES:
+        counts = np.maximum(1, counts * MAX_SAMPLES // counts.sum())
+    idx = np.repeat(np.arange(len(v)), counts)
+
+    r1, r2 = np.random.default_rng(0).random((2, len(idx)), dtype=np.float32)
+    flip = r1 + r2 > 1
+    r1, r2 = np.where(flip, 1 - r1, r1), np.where(flip, 1 - r2, r2)
+    v = v.astype(np.float32)
+    e1, e2 = v[:, 1] - v[:, 0], v[:, 2] - v[:, 0]
+    points = np.take(v[:, 0], idx, axis=0)
+    points += r1[:, None] * np.take(e1, idx, axis=0)
+    points += r2[:, None] * np.take(e2, idx, axis=0)
+
+    px = (points[:, 0] * scale + w / 2).astype(np.int64)
+    py = (w / 2 - points[:, 1] * scale).astype(np.int64)
+    inside = (px >= 0) & (px < w) & (py >= 0) & (py < w)
+    pixel = (py * w + px)[inside]
+    depth = points[inside, 2]
+    idx = idx[inside]
+
+    zbuf = np.full(w * w, -np.inf)
+    np.maximum.at(zbuf, pixel, depth)
+    nearest = depth == zbuf[pixel]
+
+    rgba = np.zeros((w * w, 4), dtype=np.uint8)
+    rgba[pixel[nearest], :3] = (MODEL_COLOR * shade[idx[nearest], None]).astype(np.uint8)
+    rgba[pixel[nearest], 3] = 255
+    return Image.fromarray(rgba.reshape(w, w, 4), "RGBA").resize((size, size), Image.LANCZOS)
+
+
+def open_image(path: Path) -> Image.Image:
+    img = Image.open(path)
+    # JPEG можно декодировать сразу в уменьшенном масштабе
+    img.draft("RGB", (max(THUMB_SIZES) * 2, max(THUMB_SIZES) * 2))
+    img = ImageOps.exif_transpose(img)
+    return img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+
+
+def build_thumbnails(kind: str, sha256: str) -> bool:
+    """Выполняется в процессе пула: исходник из блобов -> WebP всех размеров THUMB_SIZES."""
+    src = blob_path(sha256)
+    img = render_stl(src) if kind == "stl" else open_image(src)
+    for size in THUMB_SIZES:
+        dst = thumb_path(sha256, size)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        thumb = img.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        tmp = dst.with_suffix(f".{os.getpid()}.tmp")
+        thumb.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(tmp, dst)
+    return True
+
+
+def thumbnails_exist(sha256: str) -> bool:
+    return all(thumb_path(sha256, size).is_file() for size in THUMB_SIZES)
+
+
+class ThumbnailPool:
+    """
+    Генерация превью в пуле процессов: декодирование картинок и рендер STL не держат GIL
+    и event loop API. Одинаковые исходники (по sha256) в работе одновременно не дублируются.
+    """
+
+    def __init__(self, workers: int = THUMB_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._running = {}
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def build(self, kind: str, sha256: str) -> bool:
+        if thumbnails_exist(sha256):
+            return True
+        fut = self._running.get(sha256)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = asyncio.ensure_future(loop.run_in_executor(self._executor(), build_thumbnails, kind, sha256))
+            self._running[sha256] = fut
+            fut.add_done_callback(lambda _: self._running.pop(sha256, None))
+        try:
+            return await asyncio.shield(fut)
+        except Exception:
+            logger.exception("Thumbnail %s %s failed", kind, sha256)
+            return False
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+thumbnails = ThumbnailPool()
@@ -44,6 +44,10 @@ const API_HEADERS = {
   "Content-Type": "application/json",
   "X-TG-ID": USER_ID   // обязательно
 };
+// Подписанные данные Telegram: по ним сервер проверяет пользователя (HMAC с токеном бота)
+if (tg?.initData) API_HEADERS["X-TG-Init-Data"] = tg.initData;
+// Принтер, слоты которого показывает и бронирует приложение
+const PRINTER_ID = 1;
 
 
 console.log("Detected user:", user);
@@ -122,27 +126,63 @@ function initWelcome() {
 /* -------------------------
    Models (library)
    ------------------------- */
-async function loadModels() {
+// Превью 80px: WebP-миниатюры, если готовы, иначе исходная картинка
+function modelThumb(m, empty) {
+  const t = m.thumbs;
+  if (t) return `<img src="${escapeHtml(t['160'])}" srcset="${escapeHtml(t['160'])} 160w, ${escapeHtml(t['480'])} 480w" sizes="80px" loading="lazy" style="width:100%;height:100%;object-fit:cover;">`;
+  if (m.image) return `<img src="${escapeHtml(m.image)}" loading="lazy" style="width:100%;height:100%;object-fit:cover;">`;
+  return empty;
+}
+
+// Габариты и время печати, если сервер успел разобрать файл
+function modelMetaText(meta) {
+  if (!meta) return '';
+  const parts = [];
+  if (meta.size_x != null) parts.push(`${Math.round(meta.size_x)}×${Math.round(meta.size_y)}×${Math.round(meta.size_z)} мм`);
+  if (meta.print_time != null) {
+    const h = Math.floor(meta.print_time / 3600), m = Math.round(meta.print_time % 3600 / 60);
+    parts.push(h ? `${h} ч ${m} мин` : `${m} мин`);
+  }
+  if (meta.filament_g != null) parts.push(`${meta.filament_g} г`);
+  return parts.join(' · ');
+}
+
+async function loadModels(cursor = null) {
   const wrap = $('#models'); if (!wrap) return;
   try {
-    const res = await fetch('/api/models', { headers: API_HEADERS });
+    const q = $('#modelSearch')?.value.trim();
+    const url = q ? `/api/models/search?q=${encodeURIComponent(q)}`
+      : cursor ? `/api/models?cursor=${encodeURIComponent(cursor)}` : '/api/models';
+    const res = await fetch(url, { headers: API_HEADERS });
     const arr = await res.json();
-    wrap.innerHTML = '';
-    if (!Array.isArray(arr) || arr.length === 0) { wrap.innerHTML = '<div class="text-gray-500">Нет моделей</div>'; return; }
+    if (!cursor) wrap.innerHTML = '';
+    $('#modelsMore')?.remove();
+    if (!cursor && (!Array.isArray(arr) || arr.length === 0)) { wrap.innerHTML = `<div class="text-gray-500">${q ? 'Ничего не найдено' : 'Нет моделей'}</div>`; return; }
     arr.forEach(m => {
       const div = document.createElement('div');
       div.className = 'model flex items-center gap-3 bg-transparent p-2 rounded';
       div.innerHTML = `
         <div style="width:80px;height:80px;background:#f3f4f6;border-radius:8px;display:flex;align-items:center;justify-content:center;margin-right:8px;overflow:hidden;">
-          ${m.image ? `<img src="${escapeHtml(m.image)}" style="width:100%;height:100%;object-fit:cover;">` : `<div class="text-sm text-gray-500">Нет фото</div>`}
+          ${modelThumb(m, `<div class="text-sm text-gray-500">Нет фото</div>`)}
         </div>
         <div style="flex:1">
           <div class="text-sm font-medium">${escapeHtml(m.title)}</div>
+          ${m.meta ? `<div class="text-xs text-gray-500">${escapeHtml(modelMetaText(m.meta))}</div>` : ''}
           <div class="text-xs text-gray-500 mt-1"><a href="${escapeHtml(m.file)}" target="_blank" class="text-blue-600 underline">Скачать</a></div>
         </div>
       `;
       wrap.appendChild(div);
     });
+    // Библиотека отдаётся страницами: курсор следующей приходит в заголовке
+    const next = res.headers.get('X-Next-Cursor');
+    if (next) {
+      const more = document.createElement('button');
+      more.id = 'modelsMore';
+      more.className = 'btn-primary px-4 py-2 rounded-xl';
+      more.innerText = 'Показать ещё';
+      more.addEventListener('click', () => loadModels(next));
+      wrap.appendChild(more);
+    }
   } catch (e) {
     console.error("loadModels error", e);
     wrap.innerHTML = `<div class="text-sm text-red-500">Ошибка загрузки моделей</div>`;
@@ -199,22 +239,37 @@ function renderCalendar() {
   }
 }
 
+function setSlotState(btn, occupied) {
+  btn.className = `slot-button px-4 py-2 rounded-lg font-medium ${ occupied ? 'bg-red-600 text-white cursor-not-allowed opacity-80' : 'bg-gray-700 hover:bg-gray-600 text-white' }`;
+  btn.disabled = !!occupied;
+}
+
+/* Точечно обновляет уже отрисованные слоты по событию брони */
+function markSlots(booking, occupied) {
+  if (booking.printer_id !== PRINTER_ID) return;
+  const from = new Date(booking.start).getTime();
+  const to = new Date(booking.end).getTime();
+  document.querySelectorAll('.slot-button[data-start]').forEach(btn => {
+    const t = new Date(btn.dataset.start).getTime();
+    if (t >= from && t < to) setSlotState(btn, occupied);
+  });
+}
+
 async function loadSlots(offset) {
   const slotsContainer = document.getElementById("slotsContainer");
   if (!slotsContainer) return;
   slotsContainer.innerHTML = '<div class="text-gray-500 text-sm">Загрузка слотов...</div>';
   try {
-    const res = await fetch(`/api/slots/${offset}`, { headers: API_HEADERS });
+    const res = await fetch(`/api/slots/${offset}?printer_id=${PRINTER_ID}`, { headers: API_HEADERS });
     const arr = await res.json();
     const slotWrap = document.createElement('div');
     slotWrap.className = 'flex flex-wrap justify-center gap-3 mt-2';
     arr.forEach(slot => {
       const btn = document.createElement('button');
-      const occupied = slot.occupied;
-      btn.className = `slot-button px-4 py-2 rounded-lg font-medium ${ occupied ? 'bg-red-600 text-white cursor-not-allowed opacity-80' : 'bg-gray-700 hover:bg-gray-600 text-white' }`;
+      btn.dataset.start = slot.start;
       btn.innerText = new Date(slot.start).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-      btn.disabled = !!occupied;
-      if (!occupied) btn.addEventListener('click', () => bookSlot(slot));
+      setSlotState(btn, slot.occupied);
+      btn.addEventListener('click', () => bookSlot(slot));
       slotWrap.appendChild(btn);
     });
     const selectedDay = document.querySelector('.day.selected');
@@ -242,6 +297,7 @@ async function bookSlot(slot) {
       start: slot.start,
       end: slot.end,
       tg_user: USER_ID,
+      printer_id: PRINTER_ID,
       username: user.username || undefined,
       first_name: user.first_name || undefined,
       nickname: user.nickname || undefined
@@ -448,10 +504,20 @@ async function loadPending() {
     const arr = await res.json();
     wrap.innerHTML = '';
     if (!arr.length) { wrap.innerHTML = '<p class="text-gray-500">Нет моделей на модерации.</p>'; return; }
+    if (arr.length > 1) {
+      const bulk = document.createElement('div'); bulk.className = 'flex gap-2';
+      const ids = arr.slice(0, 1000).map(m => m.id);  // сервер берёт не больше 1000 за раз
+      const approveAll = document.createElement('button'); approveAll.className='btn-primary px-3 py-1'; approveAll.innerText=`Одобрить все (${ids.length})`;
+      approveAll.addEventListener('click', () => moderateAll('approve_models', ids));
+      const rejectAll = document.createElement('button'); rejectAll.className='text-red-400 px-3 py-1'; rejectAll.innerText=`Отклонить все (${ids.length})`;
+      rejectAll.addEventListener('click', () => moderateAll('reject_models', ids));
+      bulk.appendChild(approveAll); bulk.appendChild(rejectAll);
+      wrap.appendChild(bulk);
+    }
     arr.forEach(m => {
       const el = document.createElement('div'); el.className = 'p-3 bg-gray-700 rounded-lg flex items-center gap-3';
       el.innerHTML = `
-        <div style="width:80px;height:80px;overflow:hidden;border-radius:8px;background:#111">${m.image ? `<img src="${escapeHtml(m.image)}" style="width:100%;height:100%;object-fit:cover;">` : 'No image'}</div>
+        <div style="width:80px;height:80px;overflow:hidden;border-radius:8px;background:#111">${modelThumb(m, 'No image')}</div>
         <div style="flex:1">
           <div class="font-medium">${escapeHtml(m.title)}</div>
           <div class="text-sm text-gray-400">От: ${escapeHtml(String(m.submitter))}</div>
@@ -487,6 +553,15 @@ async function rejectModel(pendingId) {
   } catch (e) { console.error('reject error', e); alert('Ошибка'); }
 }
 
+async function moderateAll(action, ids) {
+  if (!confirm(`${action === 'approve_models' ? 'Одобрить' : 'Отклонить'} ${ids.length} моделей?`)) return;
+  try {
+    const res = await fetch(`/api/admin/${action}`, { method: 'POST', headers: Object.assign({ 'Content-Type': 'application/json' }, API_HEADERS), body: JSON.stringify({ ids })});
+    if (res.ok) { alert('Готово'); loadPending(); if (action === 'approve_models') loadModels(); }
+    else { alert('Ошибка'); }
+  } catch (e) { console.error('moderate error', e); alert('Ошибка'); }
+}
+
 /* Users stats (admin) */
 async function loadUsersStats() {
   try {
@@ -531,6 +606,40 @@ async function loadBookingsByDate() {
   }
 }
 
+/* -------------------------
+   Live updates (SSE)
+   ------------------------- */
+function refreshAll() {
+  if (selectedDayOffset !== null) loadSlots(selectedDayOffset);
+  loadMyBookings();
+  if (userIsAdmin) { loadAdminBookings(); loadPending(); }
+}
+
+function onBookingEvent(b, occupied) {
+  markSlots(b, occupied);
+  if (USER_ID && String(b.tg_user) === String(USER_ID)) loadMyBookings();
+  if (userIsAdmin) loadAdminBookings();
+}
+
+function initLiveUpdates() {
+  if (!window.EventSource) { setInterval(refreshAll, 30000); return; }
+  let wasDown = false;
+  const es = new EventSource('/api/events');
+  es.addEventListener('open', () => { if (wasDown) refreshAll(); wasDown = false; });
+  es.addEventListener('error', () => { wasDown = true; });
+  es.addEventListener('resync', refreshAll);
+  es.addEventListener('booking.created', e => onBookingEvent(JSON.parse(e.data), true));
+  es.addEventListener('booking.cancelled', e => onBookingEvent(JSON.parse(e.data), false));
+  es.addEventListener('model.approved', () => { loadModels(); if (userIsAdmin) loadPending(); });
+  es.addEventListener('model.rejected', () => { if (userIsAdmin) loadPending(); });
+}
+
+function initModelSearch() {
+  const input = $('#modelSearch'); if (!input) return;
+  let timer = null;
+  input.addEventListener('input', () => { clearTimeout(timer); timer = setTimeout(() => loadModels(), 300); });
+}
+
 /* -------------------------
    Initialization
    ------------------------- */
@@ -538,11 +647,11 @@ function bindHeaderActions() { createThemeToggle(); }
 
 async function initAll() {
   initTheme(); createThemeToggle(); initTabs(); initWelcome(); bindHeaderActions();
-  await loadModels(); initSubmitForm(); renderCalendar();
+  await loadModels(); initSubmitForm(); initModelSearch(); renderCalendar();
   await loadMyBookings();
   await checkAdminAndInit();
-  // Polling updates
-  setInterval(()=>{ if (selectedDayOffset !== null) loadSlots(selectedDayOffset); loadMyBookings(); if (userIsAdmin) loadAdminBookings(); }, 30000);
+  // Живые обновления вместо опроса каждые 30 секунд
+  initLiveUpdates();
 }
 
 /* Expose some functions globally required by inline onclicks (if any) */